@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Chat message save load test: messages/sec one chat worker can persist
+
+Simulates --connections WebSocket senders on one event loop (one Channels
+worker), each sending its share of --messages through the consumer's save
+path, and reports throughput and per-message latency for:
+
+    legacy         the old save_message: INSERT, read-back, INFO logging
+    write-through  chat.message_store with CHAT_WRITE_BEHIND_MS=0
+    write-behind   group commit with CHAT_WRITE_BEHIND_MS=<each --delay>
+
+After every mode it checks that every message was stored once and the
+room counters match chat_messages. Uses a temporary SQLite database
+unless --use-database-url is given (rows are then added to that database).
+
+Usage:
+    python benchmarks/chat_message_load_test.py [--connections 50] [--messages 5000] [--delay 2 10]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from chat_rooms_benchmark import setup_django  # noqa: E402
+
+
+def legacy_save(room, user_data, message_text, product_id=None):
+    """ChatConsumer.save_message() before chat.message_store (kept for comparison)"""
+    import logging
+    from django.db import transaction
+    from django.utils import timezone
+    from chat import room_counters
+    from chat.models import ChatMessage
+
+    logger = logging.getLogger('chat.consumers')
+    logger.info(f"Saving message to room {room.name}: user_id={user_data['id']}, "
+                f"name={user_data['name']}, type={user_data['role']}")
+    with transaction.atomic():
+        message = ChatMessage.objects.create(
+            room=room, user_id=user_data['id'], user_name=user_data['name'],
+            user_email=user_data['email'], message=message_text, sender_type=user_data['role'],
+            product_id=product_id, created_at=timezone.now()
+        )
+        room_counters.record_message(message)
+        saved_message = ChatMessage.objects.get(id=message.id)
+        logger.info(f"Message successfully saved with ID: {saved_message.id}")
+    return message
+
+
+async def run_mode(label, save, rooms, connections, messages):
+    from chat.models import ChatMessage
+
+    before = await ChatMessage.objects.acount()
+    latencies = []
+    per_connection = messages // connections
+
+    async def sender(index):
+        room = rooms[index % len(rooms)]
+        user = {'id': index, 'name': f'Pembeli {index}', 'email': f'p{index}@example.com',
+                'role': 'buyer' if index % 3 else 'admin'}
+        for n in range(per_connection):
+            started = time.perf_counter()
+            message = await save(room, user, f'Pesan {n} dari koneksi {index}')
+            latencies.append(time.perf_counter() - started)
+            assert message.pk is not None
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender(i) for i in range(connections)))
+    elapsed = time.perf_counter() - started
+
+    stored = await ChatMessage.objects.acount() - before
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"  {label:<22} {len(latencies) / elapsed:>9.0f} msg/s   "
+          f"p50 {statistics.median(latencies) * 1000:>7.1f} ms   p95 {p95 * 1000:>7.1f} ms   "
+          f"stored {stored}/{len(latencies)}")
+    return stored == len(latencies)
+
+
+async def main_async(args):
+    from channels.db import database_sync_to_async
+    from django.conf import settings
+    from chat import message_store, room_counters
+    from chat.models import ChatRoom
+
+    rooms = []
+    for i in range(args.rooms):
+        room, _ = await ChatRoom.objects.aget_or_create(name=f'load_room_{i}', defaults={'buyer_id': 200000 + i})
+        rooms.append(room)
+
+    print(f"\nChat message saves, one worker, {args.connections} connections, "
+          f"{args.messages:,} messages per mode, {args.rooms} rooms")
+    ok = await run_mode('legacy', database_sync_to_async(legacy_save), rooms, args.connections, args.messages)
+
+    settings.CHAT_WRITE_BEHIND_MS = 0
+    ok &= await run_mode('write-through', message_store.save, rooms, args.connections, args.messages)
+
+    for delay in args.delay:
+        settings.CHAT_WRITE_BEHIND_MS = delay
+        settings.CHAT_WRITE_BEHIND_BATCH = args.batch
+        message_store._writers.clear()
+        ok &= await run_mode(f'write-behind {delay} ms', message_store.save, rooms, args.connections, args.messages)
+
+    drifted = await database_sync_to_async(room_counters.reconcile)(
+        ChatRoom.objects.filter(name__startswith='load_room_'), dry_run=True)
+    print(f"\n  every message stored once: {'yes' if ok else 'NO'}; "
+          f"room counters consistent: {'yes' if not drifted else f'NO ({len(drifted)} rooms)'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=5000, help='messages per mode')
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--delay', type=int, nargs='+', default=[2, 10], help='write-behind delays (ms)')
+    parser.add_argument('--batch', type=int, default=500, help='CHAT_WRITE_BEHIND_BATCH')
+    parser.add_argument('--use-database-url', action='store_true', help='use DATABASE_URL instead of SQLite')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'chat_load.sqlite3'), args.use_database_url)
+        asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
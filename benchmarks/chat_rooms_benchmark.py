@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Admin chat room list benchmark: annotated pages vs. per-room property queries
+
+Seeds a chat database with a fixture (default 10,000 buyer rooms and
+1,000,000 messages, skewed so a few rooms are busy and many are quiet) and
+compares the old BuyerChatRoomsView loop, which queried the last message,
+unread count and message count per room, with
+chat.room_list.room_page(): first page, a page deep into the cursor
+chain, and a search.
+
+By default the fixture goes into a temporary SQLite file. --db keeps it
+(later runs reuse it); --use-database-url seeds the database in
+DATABASE_URL instead (PostgreSQL), adding the fixture rows to it.
+
+Usage:
+    python benchmarks/chat_rooms_benchmark.py [--rooms 10000] [--messages 1000000] [--db PATH]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+CHAT_SERVICE = Path(__file__).resolve().parent.parent / 'chat_service'
+FIXTURE_PREFIX = 'bench_room_'
+
+
+def setup_django(db_path, use_database_url):
+    sys.path.insert(0, str(CHAT_SERVICE))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chat_microservice.settings')
+    if not use_database_url:
+        os.environ.pop('DATABASE_URL', None)
+    import chat_microservice.settings as settings
+    if not use_database_url:
+        settings.DATABASES['default']['NAME'] = db_path
+    # Benchmark rows are written in a few big transactions, not per request
+    settings.DATABASES['default']['ATOMIC_REQUESTS'] = False
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def seed(rooms, messages, seed_value=42):
+    """Insert the fixture unless a fixture of this size is already there"""
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from chat.models import ChatMessage, ChatRoom
+
+    existing = ChatRoom.objects.filter(name__startswith=FIXTURE_PREFIX)
+    if existing.count() == rooms and ChatMessage.objects.filter(room__in=existing).count() == messages:
+        print(f"Reusing fixture: {rooms:,} rooms, {messages:,} messages")
+        return
+    ChatMessage.objects.filter(room__in=existing).delete()
+    existing.delete()
+
+    rng = random.Random(seed_value)
+    now = timezone.now()
+    started = time.perf_counter()
+    with transaction.atomic():
+        ChatRoom.objects.bulk_create([
+            ChatRoom(name=f'{FIXTURE_PREFIX}{i}', buyer_id=100000 + i, buyer_name=f'Pembeli {i}',
+                     buyer_email=f'pembeli{i}@example.com', created_at=now - timedelta(days=365))
+            for i in range(rooms)
+        ], batch_size=2000)
+    room_ids = list(ChatRoom.objects.filter(name__startswith=FIXTURE_PREFIX).values_list('id', flat=True))
+    # Pareto-ish: a few busy rooms, a long tail of quiet ones
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(len(room_ids))]
+    rng.shuffle(weights)
+
+    table = ChatMessage._meta.db_table
+    sql = (f'INSERT INTO {table} (room_id, user_id, user_name, user_email, message, sender_type, '
+           f'product_id, is_read, is_deleted, created_at, updated_at) '
+           f'VALUES (%s, %s, %s, %s, %s, %s, NULL, %s, %s, %s, %s)')
+    batch = 20000
+    with connection.cursor() as cursor:
+        for offset in range(0, messages, batch):
+            rows = []
+            for room_id in rng.choices(room_ids, weights=weights, k=min(batch, messages - offset)):
+                created = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+                buyer = rng.random() < 0.6
+                rows.append((room_id, 1 if not buyer else room_id, 'Admin' if not buyer else 'Pembeli', None,
+                             'Halo, apakah gitar ini masih tersedia? ' * rng.randint(1, 3),
+                             'buyer' if buyer else 'admin', rng.random() < 0.9, rng.random() < 0.01,
+                             created, created))
+            with transaction.atomic():
+                cursor.executemany(sql, rows)
+    # Raw inserts bypass chat.room_counters; fill the room counters the way
+    # `manage.py reconcile_room_counters` does
+    from chat import room_counters
+    room_counters.reconcile(ChatRoom.objects.filter(name__startswith=FIXTURE_PREFIX), batch_size=2000)
+    print(f"Seeded {rooms:,} rooms and {messages:,} messages in {time.perf_counter() - started:.0f}s")
+
+
+def legacy_room_list(rooms_query):
+    """BuyerChatRoomsView.get() before room_list, with the old per-room properties inlined"""
+    from django.db.models import Max
+    rooms = rooms_query.annotate(last_message_time=Max('messages__created_at')).order_by('-last_message_time', '-created_at')
+    data = []
+    for room in rooms:
+        visible = room.messages.filter(is_deleted=False)
+        last_message = visible.order_by('-created_at').first()
+        data.append((room.id, visible.filter(is_read=False).count(), visible.count(),
+                     last_message.message[:50] if last_message else None))
+    return data
+
+
+def measure(label, func, runs):
+    from django.db import connection
+
+    # Counted with a wrapper; the debug query log stops at 9000 entries
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(1)
+        return execute(sql, params, many, context)
+
+    timings = []
+    for _ in range(runs):
+        queries.clear()
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            rows = func()
+            timings.append((time.perf_counter() - started) * 1000)
+    print(f"  {label:<34} rows {rows:>6}   queries {len(queries):>6}   "
+          f"median {statistics.median(timings):>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rooms', type=int, default=10000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--db', help='SQLite file to keep/reuse the fixture in')
+    parser.add_argument('--use-database-url', action='store_true', help='seed DATABASE_URL instead of SQLite')
+    parser.add_argument('--runs', type=int, default=3, help='repetitions per measurement')
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--skip-legacy', action='store_true', help='do not time the per-room loop')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(args.db or os.path.join(tmp, 'chat_bench.sqlite3'), args.use_database_url)
+        seed(args.rooms, args.messages)
+
+        from chat import room_list
+        from chat.models import ChatRoom
+
+        def rooms_query():
+            return ChatRoom.objects.filter(name__startswith=FIXTURE_PREFIX, buyer_id__isnull=False, is_active=True)
+
+        def first_page():
+            return len(room_list.room_page(rooms_query(), limit=args.page_size)[0])
+
+        # Cursor of a page ~20 pages in, to show deep pages cost the same
+        cursor = None
+        for _ in range(20):
+            _, cursor = room_list.room_page(rooms_query(), cursor=cursor, limit=args.page_size)
+
+        def deep_page():
+            return len(room_list.room_page(rooms_query(), cursor=cursor, limit=args.page_size)[0])
+
+        def search():
+            return len(room_list.room_page(rooms_query(), search='pembeli 42', limit=args.page_size)[0])
+
+        print(f"\nAdmin buyer room list ({args.rooms:,} rooms, {args.messages:,} messages)")
+        measure(f'room_page first {args.page_size}', first_page, args.runs)
+        measure('room_page page 21', deep_page, args.runs)
+        measure("room_page search 'pembeli 42'", search, args.runs)
+        if not args.skip_legacy:
+            measure('legacy loop (all rooms)', lambda: len(legacy_room_list(rooms_query())), 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Image compression benchmark: in-memory quality search vs. the old stepped loop
+
+The old compress_image() lowered the quality 10 points at a time and wrote
+the file to disk after every encode; the current one searches the quality
+in memory and writes once. Both are run on the same copies of a corpus of
+images and compared on encode count, disk writes, wall time and final size.
+
+Without --corpus a synthetic set of photo-like JPEGs, a WebP and a PNG is
+generated in a temporary directory.
+
+Usage:
+    python benchmarks/image_compression_benchmark.py [--corpus DIR] [--max-size-mb 1]
+"""
+import argparse
+import builtins
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+
+
+def legacy_compress_image(image_path, max_size_mb=1):
+    """compress_image() as it was before the in-memory search (kept for comparison)"""
+    from PIL import Image
+
+    file_size_mb = os.path.getsize(image_path) / (1024 * 1024)
+    if file_size_mb <= max_size_mb:
+        return
+
+    img = Image.open(image_path)
+    original_format = img.format
+    if original_format == 'GIF' and getattr(img, 'is_animated', False):
+        return
+
+    save_kwargs = {'optimize': True}
+    quality = 85
+    if original_format in ('JPEG', 'JPG'):
+        save_format = 'JPEG'
+    elif original_format == 'WEBP':
+        save_format = 'WEBP'
+    else:
+        save_format = 'PNG'
+
+    temp_path = f"{image_path}.tmp"
+    for _ in range(10):
+        if save_format in ('JPEG', 'WEBP'):
+            save_kwargs['quality'] = quality
+        img.save(temp_path, save_format, **save_kwargs)
+        if os.path.getsize(temp_path) / (1024 * 1024) <= max_size_mb:
+            break
+        if save_format in ('JPEG', 'WEBP'):
+            if quality <= 20:
+                break
+            quality -= 10
+        else:
+            width, height = img.size
+            if width > 800 or height > 800:
+                img = img.resize((int(width * 0.8), int(height * 0.8)), Image.Resampling.LANCZOS)
+            else:
+                break
+    os.replace(temp_path, image_path)
+
+
+def make_corpus(directory):
+    """Photo-like test images: smooth gradients with fine noise"""
+    from PIL import Image, ImageFilter
+
+    def photo(width, height, seed):
+        noise = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+        noise = noise.filter(ImageFilter.GaussianBlur(1))
+        gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+        return Image.blend(gradient, noise, 0.35 + seed * 0.1)
+
+    samples = [
+        ('guitar.jpg', photo(3000, 2000, 0), 'JPEG', {'quality': 97}),
+        ('amp.jpg', photo(2400, 2400, 1), 'JPEG', {'quality': 95}),
+        ('drums.jpg', photo(4000, 3000, 2), 'JPEG', {'quality': 92}),
+        ('pedal.webp', photo(2500, 1800, 1), 'WEBP', {'quality': 98}),
+        ('logo.png', photo(1600, 1200, 0), 'PNG', {}),
+    ]
+    for name, img, fmt, options in samples:
+        img.save(os.path.join(directory, name), fmt, **options)
+
+
+class SaveCounter:
+    """Counts PIL encodes and files opened for writing (PIL saves through builtins.open)"""
+
+    def __init__(self):
+        from PIL import Image
+        self._image_cls = Image.Image
+        self._original_save = Image.Image.save
+        self._original_open = builtins.open
+        self.encodes = 0
+        self.disk_writes = 0
+
+    def __enter__(self):
+        counter = self
+
+        def save(img, fp, *args, **kwargs):
+            counter.encodes += 1
+            return counter._original_save(img, fp, *args, **kwargs)
+
+        def open_(file, mode='r', *args, **kwargs):
+            if any(flag in mode for flag in 'wax+'):
+                counter.disk_writes += 1
+            return counter._original_open(file, mode, *args, **kwargs)
+
+        self._image_cls.save = save
+        builtins.open = open_
+        return self
+
+    def __exit__(self, *exc):
+        self._image_cls.save = self._original_save
+        builtins.open = self._original_open
+
+
+def run(compress, files, workdir, max_size_mb):
+    """Compress fresh copies of `files`; returns one result dict per file"""
+    results = []
+    for source in files:
+        target = os.path.join(workdir, os.path.basename(source))
+        shutil.copyfile(source, target)
+        with SaveCounter() as counter:
+            start = time.perf_counter()
+            compress(target, max_size_mb=max_size_mb)
+            elapsed = time.perf_counter() - start
+        results.append({
+            'name': os.path.basename(source),
+            'original': os.path.getsize(source),
+            'final': os.path.getsize(target),
+            'encodes': counter.encodes,
+            'writes': counter.disk_writes,
+            'ms': elapsed * 1000,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--corpus', help='directory of sample images (default: synthetic set)')
+    parser.add_argument('--max-size-mb', type=float, default=1, help='compression target')
+    parser.add_argument('--runs', type=int, default=3, help='repetitions per implementation')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault('SESSION_SECRET', 'image-benchmark')
+        os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        os.environ.setdefault('AUTO_INIT_DB', 'false')
+        sys.path.insert(0, str(PROJECT_ROOT))
+        from main import compress_image
+
+        corpus = args.corpus
+        if not corpus:
+            corpus = os.path.join(tmp, 'corpus')
+            os.makedirs(corpus)
+            make_corpus(corpus)
+        files = sorted(str(p) for p in Path(corpus).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not files:
+            sys.exit(f"No images found in {corpus}")
+
+        workdir = os.path.join(tmp, 'work')
+        os.makedirs(workdir)
+
+        implementations = [('stepped loop (old)', legacy_compress_image), ('quality search (new)', compress_image)]
+        totals = {}
+        for label, compress in implementations:
+            runs = [run(compress, files, workdir, args.max_size_mb) for _ in range(args.runs)]
+            totals[label] = runs
+            print(f"\n{label}")
+            print(f"  {'image':<16} {'original':>10} {'final':>10} {'encodes':>8} {'writes':>7} {'median ms':>10}")
+            for i, first in enumerate(runs[0]):
+                ms = statistics.median(r[i]['ms'] for r in runs)
+                print(f"  {first['name']:<16} {first['original'] / 1024:>8.0f}KB {first['final'] / 1024:>8.0f}KB "
+                      f"{first['encodes']:>8} {first['writes']:>7} {ms:>10.1f}")
+
+        print("\nTotals (first run, median wall time)")
+        for label, runs in totals.items():
+            first = runs[0]
+            wall = statistics.median(sum(r['ms'] for r in run_results) for run_results in runs)
+            print(f"  {label:<20} encodes {sum(r['encodes'] for r in first):>4}   "
+                  f"disk writes {sum(r['writes'] for r in first):>4}   "
+                  f"final size {sum(r['final'] for r in first) / 1024:>8.0f}KB   wall {wall:>8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the Flask app
+
+Every measurement runs in a fresh interpreter so module caches do not hide
+the cold-start cost a new gunicorn worker pays. Reports the import time of
+each heavy subsystem on its own, the time to import main.py (with and
+without AUTO_INIT_DB) and the first request served after boot.
+
+Usage:
+    SESSION_SECRET=x DATABASE_URL=sqlite:///bench.db python benchmarks/startup_benchmark.py [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+SUBSYSTEMS = [
+    ('flask', 'import flask'),
+    ('sqlalchemy', 'import sqlalchemy.orm'),
+    ('requests', 'import requests'),
+    ('jwt', 'import jwt'),
+    ('PIL', 'from PIL import Image'),
+    ('stripe', 'import stripe'),
+    ('midtransclient', 'import midtransclient'),
+    ('reportlab (PDF/labels)', 'from reportlab.pdfgen import canvas'),
+    ('openpyxl (Excel export)', 'import openpyxl'),
+]
+
+TIMER = """
+import time, sys
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+{after}
+print(f"{{elapsed * 1000:.1f}}")
+"""
+
+FIRST_REQUEST = """
+start = time.perf_counter()
+response = main.app.test_client().get('/health/ready')
+assert response.status_code == 200, response.status_code
+print(f"{(time.perf_counter() - start) * 1000:.1f}", end=' ')
+"""
+
+
+def measure(statement, runs, env=None, after=''):
+    """Run `statement` in `runs` fresh interpreters and return the timings (ms)"""
+    samples = []
+    code = TIMER.format(root=str(PROJECT_ROOT), statement=statement, after=after)
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], cwd=str(PROJECT_ROOT),
+                                env={**os.environ, **(env or {})},
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'failed')
+        values = result.stdout.strip().splitlines()[-1].split()
+        samples.append([float(v) for v in values])
+    return samples
+
+
+def report(label, samples):
+    values = [s[-1] for s in samples]
+    print(f"  {label:<34} median {statistics.median(values):8.1f} ms   "
+          f"min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per measurement')
+    args = parser.parse_args()
+
+    if not os.environ.get('SESSION_SECRET'):
+        os.environ['SESSION_SECRET'] = 'startup-benchmark'
+
+    print(f"Subsystem import time ({args.runs} runs each)")
+    for label, statement in SUBSYSTEMS:
+        try:
+            report(label, measure(statement, args.runs))
+        except RuntimeError as e:
+            print(f"  {label:<34} not available ({e})")
+
+    print("\nApplication boot")
+    report('import main (AUTO_INIT_DB=false)',
+           measure('import main', args.runs, env={'AUTO_INIT_DB': 'false'}))
+    report('import main (AUTO_INIT_DB=true)',
+           measure('import main', args.runs, env={'AUTO_INIT_DB': 'true'}))
+
+    samples = measure('import main', args.runs, env={'AUTO_INIT_DB': 'false'}, after=FIRST_REQUEST)
+    report('first request /health/ready', [[s[0]] for s in samples])
+
+    print("\nModules loaded by `import main` that are imported lazily:")
+    check = ("import sys; sys.path.insert(0, %r); import main; "
+             "print(' '.join(m for m in ('stripe', 'midtransclient', 'reportlab', 'PIL', 'jwt', 'requests', 'openpyxl') "
+             "if m in sys.modules) or 'none')") % str(PROJECT_ROOT)
+    result = subprocess.run([sys.executable, '-c', check], cwd=str(PROJECT_ROOT),
+                            env={**os.environ, 'AUTO_INIT_DB': 'false'}, capture_output=True, text=True)
+    print(f"  {result.stdout.strip().splitlines()[-1] if result.stdout.strip() else result.stderr.strip()}")
+
+
+if __name__ == '__main__':
+    main()
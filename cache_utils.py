@@ -0,0 +1,114 @@
+"""
+Process-local caches for rarely changing rows, with cross-process invalidation
+
+Each worker keeps its own copy of the cached value. Writers call
+`invalidate()`, which drops the local copy and bumps a version stamp file
+shared by all workers on the host; other workers notice the new stamp
+(checked at most once per STAMP_CHECK_INTERVAL) and reload on their next
+read. A TTL bounds staleness if the stamp directory is not shared, e.g.
+when workers run on different hosts.
+
+    CACHE_STAMP_DIR             where stamp files live (default: temp dir)
+    CACHE_TTL_SECONDS=300       maximum age of a cached value
+"""
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import inspect as sa_inspect
+
+STAMP_DIR = os.environ.get('CACHE_STAMP_DIR') or os.path.join(tempfile.gettempdir(), 'hurtrock-cache')
+STAMP_CHECK_INTERVAL = 1.0
+DEFAULT_TTL = float(os.environ.get('CACHE_TTL_SECONDS', '300'))
+
+_MISSING = object()
+
+
+class VersionStamp:
+    """A file whose mtime acts as a version number shared between processes"""
+
+    def __init__(self, name):
+        self.path = os.path.join(STAMP_DIR, f'{name}.stamp')
+        self._checked_at = 0.0
+        self._version = None
+
+    def read(self):
+        now = time.monotonic()
+        if now - self._checked_at >= STAMP_CHECK_INTERVAL:
+            try:
+                self._version = os.stat(self.path).st_mtime_ns
+            except OSError:
+                self._version = None
+            self._checked_at = now
+        return self._version
+
+    def bump(self):
+        try:
+            os.makedirs(STAMP_DIR, exist_ok=True)
+            with open(self.path, 'w') as f:
+                f.write(str(time.time_ns()))
+            # Never reuse the previous mtime, even on coarse-grained filesystems
+            now_ns = time.time_ns()
+            os.utime(self.path, ns=(now_ns, max(now_ns, (self._version or 0) + 1)))
+        except OSError as e:
+            print(f"[WARNING] Could not update cache stamp {self.path}: {e}")
+        self._checked_at = 0.0
+
+
+class CachedValue:
+    """Lazily loaded value shared by all requests in this process"""
+
+    def __init__(self, name, loader, ttl=DEFAULT_TTL):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.stamp = VersionStamp(name)
+        self._value = _MISSING
+        self._loaded_at = 0.0
+        self._loaded_version = None
+        # Bumped on every reload, usable as part of a derived cache key
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def _is_fresh(self):
+        return (self._value is not _MISSING
+                and time.monotonic() - self._loaded_at < self.ttl
+                and self.stamp.read() == self._loaded_version)
+
+    def get(self):
+        if self._is_fresh():
+            return self._value
+        with self._lock:
+            # Another thread may have reloaded while we waited
+            if self._is_fresh():
+                return self._value
+            version = self.stamp.read()
+            value = self.loader()
+            self._value = value
+            self._loaded_version = version
+            self._loaded_at = time.monotonic()
+            self.generation += 1
+            return value
+
+    def invalidate(self):
+        """Drop the cached value here and signal the other workers"""
+        with self._lock:
+            self._value = _MISSING
+        self.stamp.bump()
+
+
+def detached_copy(obj):
+    """
+    Copy a model's column values into a new transient instance.
+
+    Cached rows outlive the request session they were loaded in, so they must
+    not be session-bound instances; the copy is read-only by convention.
+    """
+    if obj is None:
+        return None
+    mapper = sa_inspect(obj).mapper
+    copy = mapper.class_()
+    for attr in mapper.column_attrs:
+        setattr(copy, attr.key, getattr(obj, attr.key))
+    return copy
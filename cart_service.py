@@ -0,0 +1,493 @@
+"""
+Server-side cart cache
+
+Cart pages, the navbar badge (/api/cart/count) and checkout read the cart
+from a cache instead of PostgreSQL. A cached cart holds the lines plus the
+product columns the cart pages show, so rendering it needs no queries, and
+CartView computes the subtotal, weight and volume once per request.
+
+Backends:
+
+    local   per-worker LRU. Changes are written to cart_items immediately
+            (write-through); the Flask session carries a cart version, so a
+            worker holding an older copy reloads instead of serving it.
+            Only for a single worker: with several workers a cart changed
+            from another browser or device through another worker would be
+            served stale, so carts are then read from the database (as with
+            `off`) and redis is required for caching. Changes always start
+            from cart_items, never from a cached copy.
+    redis   shared by all workers and authoritative for cart contents.
+            Changes are written to cart_items in the background
+            (write-behind); flush() persists a cart before code that reads
+            cart_items directly (checkout session, order creation).
+    off     every read goes to the database, as before.
+
+Product edits bump a version stamp that drops every cached cart; other
+product changes (stock) are picked up within CART_CACHE_TTL. Checkout
+re-validates stock against the database anyway.
+
+Every change to a user's cart also bumps a per-user stamp, which the
+/api/cart/events stream watches to push the new count to open pages.
+With the redis backend the stamps are Redis counters seen by every host;
+otherwise they are cache_utils stamp files.
+
+    CART_CACHE_BACKEND=local       local | redis | off
+    CART_CACHE_SIZE=5000           carts kept per worker (local backend)
+    CART_CACHE_TTL=300             seconds a cached cart's product data is trusted
+    CART_WRITE_BEHIND_DELAY=1.0    seconds between background writes (redis backend)
+    REDIS_URL                      redis backend connection
+    HURTROCK_WORKERS=1             worker processes (set by gunicorn.conf.py)
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from flask import session
+from sqlalchemy.orm import joinedload
+
+from cache_utils import VersionStamp
+from database import db
+import models
+
+BACKEND = os.environ.get('CART_CACHE_BACKEND', 'local').lower()
+CACHE_SIZE = int(os.environ.get('CART_CACHE_SIZE', '5000'))
+CACHE_TTL = float(os.environ.get('CART_CACHE_TTL', '300'))
+WRITE_BEHIND_DELAY = float(os.environ.get('CART_WRITE_BEHIND_DELAY', '1.0'))
+# Worker processes serving the app (set by gunicorn.conf.py)
+WORKERS = int(os.environ.get('HURTROCK_WORKERS', '1'))
+
+SESSION_KEY = 'cart_version'
+# Product columns kept in a cached cart (what cart.html / checkout.html use)
+PRODUCT_FIELDS = ('id', 'name', 'brand', 'model', 'price', 'image_url', 'stock_quantity',
+                  'weight', 'length', 'width', 'height')
+DECIMAL_FIELDS = ('price', 'weight', 'length', 'width', 'height')
+
+
+class CartLine:
+    """One product in a cart; `product` is a detached, read-only Product"""
+    __slots__ = ('product_id', 'quantity', 'product')
+
+    def __init__(self, product_id, quantity, product):
+        self.product_id = product_id
+        self.quantity = quantity
+        self.product = product
+
+    @property
+    def subtotal(self):
+        return self.quantity * self.product.price
+
+
+class CartView:
+    """A user's cart with its totals, computed once"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.count = len(lines)
+        self.subtotal = sum((line.subtotal for line in lines), Decimal(0))
+        self.total_weight = sum(line.quantity * (line.product.weight or 0) for line in lines)
+        self.total_volume = sum(line.quantity * line.product.volume_cm3 for line in lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return self.count
+
+
+class LocalBackend:
+    """Per-process LRU of cart snapshots"""
+    shared = False
+
+    def __init__(self, size):
+        self.size = size
+        self._carts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            snapshot = self._carts.get(user_id)
+            if snapshot is not None:
+                self._carts.move_to_end(user_id)
+            return snapshot
+
+    def set(self, user_id, snapshot):
+        with self._lock:
+            self._carts[user_id] = snapshot
+            self._carts.move_to_end(user_id)
+            while len(self._carts) > self.size:
+                self._carts.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._carts.pop(user_id, None)
+
+    def stamp(self, name):
+        return VersionStamp(name)
+
+
+class RedisStamp:
+    """VersionStamp kept in a Redis counter, shared by every host"""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.key = f'stamp:{name}'
+
+    def read(self):
+        value = self.client.get(self.key)
+        return int(value) if value is not None else None
+
+    def bump(self):
+        self.client.incr(self.key)
+
+
+class RedisBackend:
+    """
+    Cart snapshots in Redis, plus the carts not yet written to the database
+
+    A cart's dirty marker holds the version of its snapshot and is only
+    cleared after that version has been committed, so a worker crash
+    mid-write leaves it queued. Writes of one cart, by the background
+    writer or by flush(), take a per-user Redis lock.
+    """
+    shared = True
+    DIRTY_KEY = 'cart:dirty'
+    # Far longer than any write-behind delay; only bounds abandoned carts
+    KEY_TTL = 7 * 24 * 3600
+    # A crashed writer's lock is freed after PERSIST_LOCK_TTL seconds
+    PERSIST_LOCK_TTL = 30
+    PERSIST_LOCK_WAIT = 10
+    # Clears the marker only if no newer snapshot was stored meanwhile
+    CLEAR_DIRTY = """
+        if redis.call('hget', KEYS[1], ARGV[1]) == ARGV[2] then
+            return redis.call('hdel', KEYS[1], ARGV[1])
+        end
+        return 0
+    """
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+        self._clear_dirty = self.client.register_script(self.CLEAR_DIRTY)
+
+    def _key(self, user_id):
+        return f'cart:{user_id}'
+
+    def get(self, user_id):
+        raw = self.client.get(self._key(user_id))
+        return json.loads(raw) if raw else None
+
+    def set(self, user_id, snapshot, dirty=False):
+        """Store a snapshot; dirty=True also queues it for writing, atomically"""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(self._key(user_id), json.dumps(snapshot, default=str), ex=self.KEY_TTL)
+        if dirty:
+            pipe.hset(self.DIRTY_KEY, user_id, snapshot['version'])
+        pipe.execute()
+
+    def delete(self, user_id):
+        self.client.delete(self._key(user_id))
+
+    def stamp(self, name):
+        return RedisStamp(self.client, name)
+
+    def dirty_version(self, user_id):
+        """Version of the user's unwritten snapshot, or None if there is none"""
+        version = self.client.hget(self.DIRTY_KEY, user_id)
+        return int(version) if version is not None else None
+
+    def clear_dirty(self, user_id, version=None):
+        """Unqueue the cart once `version` is written (None: unconditionally)"""
+        if version is None:
+            self.client.hdel(self.DIRTY_KEY, user_id)
+        else:
+            self._clear_dirty(keys=[self.DIRTY_KEY], args=[user_id, version])
+
+    def dirty_users(self):
+        return [int(user_id) for user_id, _ in self.client.hscan_iter(self.DIRTY_KEY, count=100)]
+
+    @contextmanager
+    def persisting(self, user_id, wait=True):
+        """Per-user write lock; yields whether it was acquired"""
+        import redis
+        lock = self.client.lock(f'cart:persist:{user_id}', timeout=self.PERSIST_LOCK_TTL,
+                                blocking_timeout=self.PERSIST_LOCK_WAIT)
+        acquired = lock.acquire(blocking=wait)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except redis.exceptions.LockError:
+                    pass  # Held past PERSIST_LOCK_TTL; already expired
+
+
+class CartService:
+    def __init__(self):
+        self.app = None
+        self.backend = None
+        self.catalog = VersionStamp('cart_products')
+        # Serialises read-modify-write of one user's cart within this worker
+        self._locks = [threading.Lock() for _ in range(64)]
+        self._writer = None
+        self._wake = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        if BACKEND == 'redis':
+            try:
+                self.backend = RedisBackend(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+                print("[OK] Cart cache: redis (write-behind)")
+            except Exception as e:
+                print(f"[WARNING] Redis cart cache unavailable: {e}")
+        if self.backend is None and BACKEND != 'off':
+            if WORKERS > 1:
+                print(f"[WARNING] Cart cache 'local' needs a single worker ({WORKERS} running); "
+                      f"carts are read from the database. Use CART_CACHE_BACKEND=redis.")
+            else:
+                self.backend = LocalBackend(CACHE_SIZE)
+        self.catalog = self._stamp('cart_products')
+
+    def _stamp(self, name):
+        return self.backend.stamp(name) if self.backend is not None else VersionStamp(name)
+
+    @property
+    def write_behind(self):
+        return self.backend is not None and self.backend.shared
+
+    # Reading
+
+    def get_cart(self, user_id):
+        """CartView for the user, from the cache when it is still valid"""
+        if self.backend is None:
+            return self._view(self._load(user_id))
+        snapshot = self.backend.get(user_id)
+        if not self._is_valid(snapshot):
+            if self.write_behind:
+                self.flush(user_id)
+            snapshot = self._load(user_id)
+            self._store(user_id, snapshot)
+        return self._view(snapshot)
+
+    def count(self, user_id, readonly=False):
+        """
+        Number of lines in the user's cart. readonly=True never writes the
+        Flask session, for streamed responses whose cookie is already sent.
+        """
+        # A local reload would store its version in the session
+        if self.backend is None or (readonly and not self.backend.shared):
+            return models.CartItem.query.filter_by(user_id=user_id).count()
+        return self.get_cart(user_id).count
+
+    def _is_valid(self, snapshot):
+        if snapshot is None:
+            return False
+        if time.time() - snapshot['stored_at'] >= CACHE_TTL or snapshot['catalog'] != self.catalog.read():
+            return False
+        # A local copy is only current if this browser has not changed the cart elsewhere
+        return self.backend.shared or snapshot['version'] == session.get(SESSION_KEY)
+
+    def _load(self, user_id):
+        items = (models.CartItem.query
+                 .options(joinedload(models.CartItem.product))
+                 .filter_by(user_id=user_id)
+                 .order_by(models.CartItem.id)
+                 .all())
+        quantities = {}
+        products = {}
+        for item in items:
+            # Duplicate rows for one product (older data) are merged
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+            products[str(item.product_id)] = _product_fields(item.product)
+        return self._snapshot(list(quantities.items()), products)
+
+    def _snapshot(self, lines, products):
+        return {
+            'version': time.time_ns(),
+            'catalog': self.catalog.read(),
+            'stored_at': time.time(),
+            'lines': [[product_id, quantity] for product_id, quantity in lines],
+            'products': products,
+        }
+
+    def _store(self, user_id, snapshot):
+        self.backend.set(user_id, snapshot)
+        if not self.backend.shared:
+            session[SESSION_KEY] = snapshot['version']
+
+    def _view(self, snapshot):
+        products = {}
+        lines = []
+        for product_id, quantity in snapshot['lines']:
+            key = str(product_id)
+            if key not in products:
+                products[key] = _detached_product(snapshot['products'][key])
+            lines.append(CartLine(product_id, quantity, products[key]))
+        return CartView(lines)
+
+    # Writing
+
+    def add(self, user_id, product, quantity):
+        def change(lines):
+            lines[product.id] = lines.get(product.id, 0) + quantity
+        self._update(user_id, change, product)
+
+    def set_quantity(self, user_id, product_id, quantity):
+        """Set a line's quantity (<= 0 removes it); False if the product is not in the cart"""
+        def change(lines):
+            if product_id not in lines:
+                return False
+            if quantity > 0:
+                lines[product_id] = quantity
+            else:
+                del lines[product_id]
+        return self._update(user_id, change)
+
+    def remove(self, user_id, product_id):
+        return self.set_quantity(user_id, product_id, 0)
+
+    def _update(self, user_id, change, product=None):
+        with self._locks[user_id % len(self._locks)]:
+            if not self.write_behind:
+                # Write-through: cart_items is the cart. A cached copy may miss
+                # lines added through another worker, and _persist() would
+                # delete them
+                snapshot = self._load(user_id)
+            else:
+                self.get_cart(user_id)  # Revalidates/reloads the cached copy
+                snapshot = self.backend.get(user_id)
+
+            lines = dict((product_id, quantity) for product_id, quantity in snapshot['lines'])
+            if change(lines) is False:
+                return False
+            products = {key: fields for key, fields in snapshot['products'].items() if int(key) in lines}
+            if product is not None:
+                products[str(product.id)] = _product_fields(product)
+            snapshot = self._snapshot(lines.items(), products)
+
+            if self.write_behind:
+                self.backend.set(user_id, snapshot, dirty=True)
+                self._start_writer()
+            else:
+                _persist(user_id, snapshot['lines'])
+                if self.backend is not None:
+                    self._store(user_id, snapshot)
+        self._changes(user_id).bump()
+        return True
+
+    def flush(self, user_id):
+        """Write the user's cart to cart_items now if it has pending changes"""
+        if not self.write_behind:
+            return
+        # Waits for a background write of this cart that is in flight
+        with self.backend.persisting(user_id) as locked:
+            if not locked:
+                print(f"[WARNING] Cart of user {user_id} is locked by a stalled writer, writing anyway")
+            if self.backend.dirty_version(user_id) is not None:
+                self._write_cart(user_id, raise_errors=True)
+
+    def invalidate(self, user_id):
+        """Drop the cached cart after cart_items was changed directly (e.g. by an order)"""
+        if self.backend is not None:
+            self.backend.delete(user_id)
+        self._changes(user_id).bump()
+
+    def change_marker(self, user_id):
+        """Opaque value that changes whenever the user's cart changes"""
+        return self._changes(user_id).read()
+
+    def _changes(self, user_id):
+        return self._stamp(f'cart-{user_id}')
+
+    def products_changed(self):
+        """Product data shown in carts changed; every cached cart is reloaded"""
+        self.catalog.bump()
+
+    # Write-behind (redis backend)
+
+    def _start_writer(self):
+        self._wake.set()
+        if self._writer is not None and self._writer.is_alive():
+            return
+        # Started lazily so it runs in the worker process, not a pre-fork master
+        self._writer = threading.Thread(target=self._write_loop, name='cart-writer', daemon=True)
+        self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            self._wake.wait(timeout=WRITE_BEHIND_DELAY * 10)
+            time.sleep(WRITE_BEHIND_DELAY)
+            self._wake.clear()
+            try:
+                self.write_pending()
+            except Exception as e:
+                print(f"[WARNING] Cart write-behind failed: {e}")
+
+    def write_pending(self):
+        """Persist every cart with unwritten changes (any worker may do this)"""
+        with self.app.app_context():
+            for user_id in self.backend.dirty_users():
+                # A cart another worker is writing is left to it
+                with self.backend.persisting(user_id, wait=False) as locked:
+                    if locked:
+                        self._write_cart(user_id)
+
+    def _write_cart(self, user_id, raise_errors=False):
+        """Write the user's queued snapshot and unqueue it; call with the persist lock held"""
+        snapshot = self.backend.get(user_id)
+        if snapshot is None:
+            # Expired from Redis; nothing left to write
+            self.backend.clear_dirty(user_id)
+            return
+        try:
+            _persist(user_id, snapshot['lines'])
+        except Exception as e:
+            db.session.rollback()
+            # Stays queued; a cart that references a deleted product is reloaded instead
+            if not _products_exist([product_id for product_id, _ in snapshot['lines']]):
+                self.backend.delete(user_id)
+                self.backend.clear_dirty(user_id)
+            print(f"[WARNING] Could not write cart of user {user_id}: {e}")
+            if raise_errors:
+                raise
+            return
+        self.backend.clear_dirty(user_id, snapshot['version'])
+
+
+def _product_fields(product):
+    return {field: getattr(product, field) for field in PRODUCT_FIELDS}
+
+
+def _detached_product(fields):
+    values = dict(fields)
+    for field in DECIMAL_FIELDS:
+        if values.get(field) is not None:
+            values[field] = Decimal(str(values[field]))
+    return models.Product(**values)
+
+
+def _products_exist(product_ids):
+    found = db.session.query(models.Product.id).filter(models.Product.id.in_(product_ids)).count()
+    return found == len(set(product_ids))
+
+
+def _persist(user_id, lines):
+    """Make the user's cart_items rows match `lines` ([product_id, quantity] pairs)"""
+    wanted = {product_id: quantity for product_id, quantity in lines}
+    for item in models.CartItem.query.filter_by(user_id=user_id).order_by(models.CartItem.id).all():
+        quantity = wanted.pop(item.product_id, None)
+        if quantity is None:
+            db.session.delete(item)  # Removed, or a duplicate row for the product
+        elif item.quantity != quantity:
+            item.quantity = quantity
+    for product_id, quantity in wanted.items():
+        db.session.add(models.CartItem(user_id=user_id, product_id=product_id, quantity=quantity))
+    db.session.commit()
+
+
+cart = CartService()
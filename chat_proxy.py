@@ -0,0 +1,197 @@
+"""
+HTTP client for the Django chat service
+
+The Flask routes that forward to the chat service share one pooled,
+keep-alive requests.Session per worker process instead of opening a new
+connection per call. Instead of a health request before every call, the
+service's health is tracked from the proxied calls by a circuit breaker:
+
+    closed      calls go through; CHAT_BREAKER_FAILURES consecutive
+                connection errors or timeouts open it (any HTTP response,
+                5xx included, means the service is up)
+    open        calls fail at once (ChatServiceUnavailable) for
+                CHAT_BREAKER_COOLDOWN seconds
+    half-open   after the cooldown one call is let through as a probe;
+                success closes the breaker, failure opens it again
+
+Response bodies are streamed through as received (stream_response), not
+buffered in the worker.
+
+    CHAT_SERVICE_URL=http://127.0.0.1:8000
+    CHAT_PROXY_TIMEOUT=5           seconds to connect / between bytes
+    CHAT_PROXY_POOL_SIZE=20        keep-alive connections per worker
+    CHAT_BREAKER_FAILURES=3
+    CHAT_BREAKER_COOLDOWN=10       seconds
+    CHAT_HEALTH_TTL=15             seconds a successful call counts as healthy
+"""
+import os
+import threading
+import time
+
+from flask import Response
+
+SERVICE_URL = os.environ.get('CHAT_SERVICE_URL', 'http://127.0.0.1:8000').rstrip('/')
+TIMEOUT = float(os.environ.get('CHAT_PROXY_TIMEOUT', '5'))
+POOL_SIZE = int(os.environ.get('CHAT_PROXY_POOL_SIZE', '20'))
+BREAKER_FAILURES = int(os.environ.get('CHAT_BREAKER_FAILURES', '3'))
+BREAKER_COOLDOWN = float(os.environ.get('CHAT_BREAKER_COOLDOWN', '10'))
+HEALTH_TTL = float(os.environ.get('CHAT_HEALTH_TTL', '15'))
+
+CHUNK_SIZE = 16 * 1024
+# Connection-level headers that must not be forwarded (RFC 9110, section 7.6.1)
+HOP_BY_HOP = frozenset((
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'transfer-encoding', 'upgrade',
+))
+
+
+class ChatServiceUnavailable(Exception):
+    """The chat service is down, unreachable or the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker shared by the threads of a worker"""
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+            self.last_success = 0.0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Whether a call may go out now; in half-open only one probe at a time"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+            self.last_success = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.opened_at is not None or self.failures >= self.max_failures:
+                if self.opened_at is None:
+                    print(f"[WARNING] Chat service failing, pausing calls for {self.cooldown:g}s")
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def session():
+    """The worker's pooled session (rebuilt after fork; pools are not shared across processes)"""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                new_session = requests.Session()
+                # Internal service: skip per-request proxy/netrc lookups
+                new_session.trust_env = False
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+                new_session.mount('http://', adapter)
+                new_session.mount('https://', adapter)
+                _session, _session_pid = new_session, os.getpid()
+    return _session
+
+
+def request(method, path, headers=None, params=None, data=None, timeout=None, stream=True):
+    """
+    Call the chat service; returns the requests.Response (streamed unless
+    stream=False). Raises ChatServiceUnavailable if the breaker is open or
+    the service cannot be reached. Error responses are returned as they
+    are; they are the application's, not a sign the service is down.
+    """
+    import requests
+
+    if not breaker.allow():
+        raise ChatServiceUnavailable('circuit open')
+    try:
+        response = session().request(method, f"{SERVICE_URL}{path}", headers=headers, params=params,
+                                      data=data, timeout=timeout or TIMEOUT, stream=stream)
+    except requests.RequestException as e:
+        breaker.record_failure()
+        raise ChatServiceUnavailable(str(e)) from e
+
+    breaker.record_success()
+    return response
+
+
+def probe():
+    """GET /health/ directly, whatever the breaker state; a healthy answer closes the breaker"""
+    import requests
+
+    try:
+        response = session().get(f"{SERVICE_URL}/health/", timeout=2)
+    except requests.RequestException:
+        return False
+    if response.status_code != 200:
+        return False
+    breaker.record_success()
+    return True
+
+
+def service_available():
+    """Cached health: a recent successful call counts; otherwise probes /health/"""
+    if breaker.state == 'closed' and time.monotonic() - breaker.last_success < HEALTH_TTL:
+        return True
+    return probe()
+
+
+def forward_headers(headers):
+    """Client request headers worth passing to the chat service"""
+    return {key: value for key, value in headers.items()
+            if key.lower() not in HOP_BY_HOP and key.lower() not in ('host', 'content-length')}
+
+
+def stream_response(upstream):
+    """Flask response relaying `upstream` byte for byte as it arrives"""
+    def body():
+        complete = False
+        try:
+            # Raw bytes: keeps Content-Encoding and Content-Length valid
+            for chunk in upstream.raw.stream(CHUNK_SIZE, decode_content=False):
+                yield chunk
+            complete = True
+        finally:
+            if complete:
+                # Fully read: the keep-alive connection goes back to the pool
+                upstream.raw.release_conn()
+            else:
+                # Client went away mid-body; the connection cannot be reused
+                upstream.close()
+
+    headers = [(key, value) for key, value in upstream.headers.items() if key.lower() not in HOP_BY_HOP]
+    return Response(body(), status=upstream.status_code, headers=headers, direct_passthrough=True)
@@ -4,6 +4,7 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.conf import settings
 from .models import ChatRoom, ChatMessage, ChatSession
+from . import message_store, product_client
 from django.utils import timezone
 from asgiref.sync import sync_to_async
 import logging
@@ -167,8 +168,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             text_data_json = json.loads(text_data)
             message_type = text_data_json.get('type', 'chat_message')
 
-            logger.info(f"Received message type: {message_type} for room: {self.room_name}")
-            logger.debug(f"Message data: {text_data_json}")
+            logger.debug(f"Received message type: {message_type} for room: {self.room_name}")
 
             if message_type == 'chat_message':
                 await self.handle_chat_message(text_data_json)
@@ -209,13 +209,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # Save message to database
             message = await self.save_message(self.room, self.user_data, message_text, product_id)
 
-            logger.info(f"Message saved to database: ID {message.id}")
-
             # Get product info if product_id is provided
             product_info = None
-            if product_id:
-                product_info = await self.get_product_info(product_id)
-                logger.info(f"Product info retrieved for product ID {product_id}: {product_info}")
+            if message.product_id:
+                product_info = await self.get_product_info(message.product_id)
+                logger.debug(f"Product info retrieved for product ID {message.product_id}")
 
             # Prepare message data
             message_data = {
@@ -243,7 +241,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 }
             )
 
-            logger.info(f"Message sent to room {self.room_name} by {self.user_data['name']} (Message ID: {message.id})")
+            logger.debug(f"Message {message.id} sent to room {self.room_name}")
 
         except Exception as e:
             logger.error(f"Error handling chat message: {str(e)}", exc_info=True)
@@ -348,80 +346,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 room.buyer_id = self.user_data['id']
                 room.buyer_name = self.user_data['name']
                 room.buyer_email = self.user_data['email']
-                room.save()
+                # Only these fields: the counters are updated concurrently
+                room.save(update_fields=['buyer_id', 'buyer_name', 'buyer_email'])
                 logger.info(f"Updated buyer info for room {self.room_name}")
 
         logger.info(f"Room '{self.room_name}' accessed. Created: {created}")
         return room
 
-    @database_sync_to_async
-    def save_message(self, room, user_data, message_text, product_id=None):
-        """Save message to database with proper validation"""
-        try:
-            # Validate required fields
-            user_id = user_data.get('id', 0)
-            user_name = user_data.get('name', 'Anonymous')
-            user_email = user_data.get('email', '')
-            sender_type = user_data.get('role', 'buyer')
-
-            # Ensure sender_type is valid
-            valid_sender_types = ['buyer', 'admin', 'staff']
-            if sender_type not in valid_sender_types:
-                logger.warning(f"Invalid sender type '{sender_type}' for user {user_id}. Defaulting to 'buyer'.")
-                sender_type = 'buyer'
-
-            logger.info(f"Saving message to room {room.name}: user_id={user_id}, name={user_name}, type={sender_type}")
-
-            from django.db import transaction
-            with transaction.atomic():
-                message = ChatMessage.objects.create(
-                    room=room,
-                    user_id=user_id,
-                    user_name=user_name,
-                    user_email=user_email,
-                    message=message_text,
-                    sender_type=sender_type,
-                    product_id=product_id,
-                    created_at=timezone.now()
-                )
-
-                # Verify the message was saved
-                saved_message = ChatMessage.objects.get(id=message.id)
-                logger.info(f"Message successfully saved with ID: {saved_message.id}")
-
-            return message
-        except Exception as e:
-            logger.error(f"Error saving message: {str(e)}", exc_info=True)
-            raise
+    async def save_message(self, room, user_data, message_text, product_id=None):
+        """Save message to database; returns it once committed"""
+        return await message_store.save(room, user_data, message_text, product_id)
 
     async def get_product_info(self, product_id):
-        """Fetch product information from Flask API"""
+        """Product card from the Flask store (cached, shared connection)"""
         try:
-            import aiohttp
-            
-            # Use internal communication - try different endpoints
-            endpoints = [
-                f'http://127.0.0.1:5000/api/products/{product_id}',
-                f'http://localhost:5000/api/products/{product_id}',
-                f'http://0.0.0.0:5000/api/products/{product_id}'
-            ]
-
-            timeout = aiohttp.ClientTimeout(total=5)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                for endpoint in endpoints:
-                    try:
-                        async with session.get(endpoint) as response:
-                            if response.status == 200:
-                                product_data = await response.json()
-                                logger.info(f"Product info fetched successfully from {endpoint}: {product_data}")
-                                return product_data
-                    except Exception as e:
-                        logger.warning(f"Failed to fetch from {endpoint}: {e}")
-                        continue
-
-            logger.warning(f"Failed to fetch product info for ID {product_id} from any endpoint.")
-            return None
-
+            return await product_client.get_product(product_id)
         except Exception as e:
             logger.error(f"Error fetching product info: {e}", exc_info=True)
             return None
@@ -0,0 +1,38 @@
+"""
+Recompute ChatRoom message counters and last-message pointers
+
+    python manage.py reconcile_room_counters [--room NAME] [--dry-run]
+
+Run after changing chat_messages outside the chat service (admin edits,
+soft deletes, imports), or on a schedule to catch drift.
+"""
+from django.core.management.base import BaseCommand
+
+from chat import room_counters
+from chat.models import ChatRoom
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-room message counters from chat_messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', action='append', dest='rooms', metavar='NAME',
+                            help='only this room (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='report drift without fixing it')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rooms = ChatRoom.objects.all()
+        if options['rooms']:
+            rooms = rooms.filter(name__in=options['rooms'])
+
+        drifted = room_counters.reconcile(rooms, dry_run=options['dry_run'], batch_size=options['batch_size'])
+
+        for room, changes in drifted:
+            if options['verbosity'] > 1:
+                details = ', '.join(f'{field} {stored} -> {actual}' for field, (stored, actual) in changes.items())
+                self.stdout.write(f'{room.name}: {details}')
+
+        action = 'would be corrected' if options['dry_run'] else 'corrected'
+        style = self.style.WARNING if drifted else self.style.SUCCESS
+        self.stdout.write(style(f'[OK] {len(drifted)} of {rooms.count()} rooms {action}'))
@@ -0,0 +1,198 @@
+"""
+Chat message persistence for ChatConsumer
+
+save() stores a message and returns it once it is committed. By default
+each message is written in its own transaction: one INSERT (the id comes
+back from it, nothing is read back) and the room counter UPDATE from
+chat.room_counters.
+
+With CHAT_WRITE_BEHIND_MS > 0, messages are group-committed: each worker
+buffers them for up to that many milliseconds (or CHAT_WRITE_BEHIND_BATCH
+messages) and writes the batch in one transaction with one bulk_create
+and one counter UPDATE per room. save() still only returns after the
+batch has committed, so a message is never broadcast before it is
+stored. A failed batch is retried, then its messages are written one by
+one, so a message the database rejects fails alone; save() raises for it
+and the sender is told to resend: delivery is at-least-once, never
+silently dropped.
+
+    CHAT_WRITE_BEHIND_MS=0        0 writes every message immediately
+    CHAT_WRITE_BEHIND_BATCH=500   most messages per bulk insert
+"""
+import asyncio
+import logging
+import weakref
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import room_counters
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+SENDER_TYPES = ('buyer', 'admin', 'staff')
+WRITE_ATTEMPTS = 3
+RETRY_DELAY = 0.05
+# Largest value an IntegerField holds on every backend
+MAX_PRODUCT_ID = 2 ** 31 - 1
+
+
+def clean_product_id(product_id):
+    """The client's product_id as a valid id, or None"""
+    if product_id in (None, ''):
+        return None
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        product_id = None
+    if product_id is None or not 0 < product_id <= MAX_PRODUCT_ID:
+        logger.warning("Ignoring invalid product_id in chat message")
+        return None
+    return product_id
+
+
+def _fit(value, field_name):
+    """Cut `value` to the column's max_length"""
+    max_length = ChatMessage._meta.get_field(field_name).max_length
+    return value[:max_length] if isinstance(value, str) else value
+
+
+def build_message(room, user_data, message_text, product_id=None):
+    """Unsaved ChatMessage from a WebSocket user's data"""
+    sender_type = user_data.get('role', 'buyer')
+    if sender_type not in SENDER_TYPES:
+        logger.warning(f"Invalid sender type '{sender_type}' for user {user_data.get('id')}. Defaulting to 'buyer'.")
+        sender_type = 'buyer'
+
+    user_email = user_data.get('email', '')
+    if isinstance(user_email, str) and len(user_email) > ChatMessage._meta.get_field('user_email').max_length:
+        user_email = None  # A cut-off address is no address
+
+    return ChatMessage(
+        room=room,
+        user_id=user_data.get('id', 0),
+        user_name=_fit(user_data.get('name', 'Anonymous'), 'user_name'),
+        user_email=user_email,
+        message=message_text,
+        sender_type=sender_type,
+        product_id=clean_product_id(product_id),
+        created_at=timezone.now()
+    )
+
+
+def write_messages(messages):
+    """Insert messages and count them in their rooms, in one transaction"""
+    with transaction.atomic():
+        if len(messages) > 1 and connection.features.can_return_rows_from_bulk_insert:
+            ChatMessage.objects.bulk_create(messages)
+        else:
+            # Without RETURNING from multi-row inserts the ids would be lost
+            for message in messages:
+                message.save(force_insert=True)
+        room_counters.record_messages(messages)
+    return messages
+
+
+class MessageWriter:
+    """Group commit for the messages saved on one event loop"""
+
+    def __init__(self, delay_ms, batch_size):
+        self.delay = delay_ms / 1000
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+        self.full = asyncio.Event()
+        self.task = None
+
+    async def submit(self, message):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future))
+        if len(self.pending) >= self.batch_size:
+            self.full.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self):
+        while self.pending:
+            try:
+                await asyncio.wait_for(self.full.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            if len(self.pending) >= self.batch_size:
+                self.full.set()
+            await self._write(batch)
+
+    async def _write(self, batch):
+        messages = [message for message, _ in batch]
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                await database_sync_to_async(write_messages)(messages)
+                break
+            except Exception as e:
+                # The transaction rolled back; insert the same messages again
+                _reset(messages)
+                if attempt == WRITE_ATTEMPTS:
+                    logger.error(f"Failed to write {len(messages)} chat messages: {e}", exc_info=True)
+                    if len(batch) > 1:
+                        await self._write_each(batch)
+                    else:
+                        _resolve(batch[0][1], error=e)
+                    return
+                logger.warning(f"Chat message batch write failed (attempt {attempt}), retrying: {e}")
+                await asyncio.sleep(RETRY_DELAY * attempt)
+
+        for message, future in batch:
+            _resolve(future, message)
+
+    async def _write_each(self, batch):
+        """Write a failed batch message by message; only the rejected ones fail"""
+        for message, future in batch:
+            try:
+                await database_sync_to_async(write_messages)([message])
+            except Exception as e:
+                _reset([message])
+                logger.error(f"Chat message from user {message.user_id} rejected: {e}")
+                _resolve(future, error=e)
+            else:
+                _resolve(future, message)
+
+
+def _reset(messages):
+    for message in messages:
+        message.pk = None
+        message._state.adding = True
+
+
+def _resolve(future, message=None, error=None):
+    # The sender may have disconnected meanwhile; the message is stored anyway
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(message)
+
+
+_writers = weakref.WeakKeyDictionary()
+
+
+def _writer():
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        writer = _writers[loop] = MessageWriter(settings.CHAT_WRITE_BEHIND_MS, settings.CHAT_WRITE_BEHIND_BATCH)
+    return writer
+
+
+async def save(room, user_data, message_text, product_id=None):
+    """Store a chat message; returns it (with id) once committed"""
+    message = build_message(room, user_data, message_text, product_id)
+    if settings.CHAT_WRITE_BEHIND_MS > 0:
+        return await _writer().submit(message)
+    await database_sync_to_async(write_messages)([message])
+    return message
@@ -0,0 +1,44 @@
+"""
+Trigram indexes for the admin room search (PostgreSQL only)
+
+The room list filters with icontains, which Django renders as
+UPPER(column::text) LIKE UPPER('%term%'); GIN trigram indexes on the same
+expressions let PostgreSQL answer it without scanning every room. Other
+databases, or servers without pg_trgm, keep the sequential scan.
+"""
+from django.db import migrations, transaction
+
+SEARCH_COLUMNS = ('buyer_name', 'buyer_email', 'name')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for column in SEARCH_COLUMNS:
+                schema_editor.execute(
+                    f'CREATE INDEX IF NOT EXISTS chat_rooms_{column}_trgm '
+                    f'ON chat_rooms USING GIN (UPPER({column}::text) gin_trgm_ops)'
+                )
+    except Exception as e:
+        print(f"[WARNING] pg_trgm not available, chat room search will scan: {e}")
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in SEARCH_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS chat_rooms_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
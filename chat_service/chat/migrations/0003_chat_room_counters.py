@@ -0,0 +1,68 @@
+"""
+Denormalised message counters and last-message pointer on ChatRoom
+
+Adds the columns maintained by chat.room_counters, fills them from
+chat_messages in one UPDATE, and indexes the room list order.
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    visible = ChatMessage.objects.filter(room=OuterRef('pk'), is_deleted=False).order_by()
+    latest = visible.order_by('-created_at', '-id')
+
+    def count(messages):
+        return Coalesce(Subquery(messages.values('room').annotate(n=Count('id')).values('n')), 0)
+
+    ChatRoom.objects.update(
+        message_count=count(visible),
+        unread_messages_count=count(visible.filter(is_read=False)),
+        buyer_unread_count=count(visible.filter(is_read=False, sender_type='buyer')),
+        last_message_id=Subquery(latest.values('id')[:1]),
+        last_message_at=Subquery(latest.values('created_at')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_chat_room_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='unread_messages_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='buyer_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.chatmessage'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chatroom',
+            index=models.Index(Coalesce('last_message_at', 'created_at').desc(), models.F('id').desc(), name='chat_rooms_activity_idx'),
+        ),
+    ]
@@ -3,6 +3,8 @@
 Chat models for the microservice
 """
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 
@@ -14,30 +16,29 @@ class ChatRoom(models.Model):
     buyer_email = models.EmailField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     is_active = models.BooleanField(default=True)
-    
+
+    # Maintained by chat.room_counters as messages are sent and read;
+    # `manage.py reconcile_room_counters` recomputes them from chat_messages
+    message_count = models.PositiveIntegerField(default=0)
+    unread_messages_count = models.PositiveIntegerField(default=0)
+    buyer_unread_count = models.PositiveIntegerField(default=0)
+    last_message = models.ForeignKey('ChatMessage', null=True, blank=True, on_delete=models.SET_NULL,
+                                     related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         ordering = ['-created_at']
         db_table = 'chat_rooms'
-    
+        indexes = [
+            # Room list order: last activity, newest first
+            models.Index(Coalesce('last_message_at', 'created_at').desc(), F('id').desc(),
+                         name='chat_rooms_activity_idx'),
+        ]
+
     def __str__(self):
         if self.buyer_name:
             return f"Room: {self.buyer_name} ({self.buyer_email})"
         return f"Room: {self.name}"
-    
-    @property
-    def message_count(self):
-        """Get total message count for this room"""
-        return self.messages.filter(is_deleted=False).count()
-    
-    @property
-    def last_message(self):
-        """Get the last message in this room"""
-        return self.messages.filter(is_deleted=False).order_by('-created_at').first()
-    
-    @property
-    def unread_messages_count(self):
-        """Get count of unread messages"""
-        return self.messages.filter(is_read=False, is_deleted=False).count()
 
 
 class ChatMessage(models.Model):
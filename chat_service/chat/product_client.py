@@ -0,0 +1,154 @@
+"""
+Product cards for chat product tags, fetched from the Flask store
+
+Each event loop keeps one aiohttp session open to Flask, so lookups reuse
+keep-alive connections. Cards are cached for CHAT_PRODUCT_CACHE_TTL
+seconds in an LRU shared by the worker. Concurrent lookups of the same
+id share one request, and ids missing from the cache are fetched together
+from /api/products?ids=... . One base URL with a short timeout replaces
+the three hosts tried in turn; a slow or dead Flask delays a message by
+at most CHAT_PRODUCT_LOOKUP_TIMEOUT.
+
+    FLASK_API_URL=http://127.0.0.1:5000
+    CHAT_PRODUCT_CACHE_TTL=300       seconds a card is reused
+    CHAT_PRODUCT_CACHE_SIZE=2000     cards kept per worker
+    CHAT_PRODUCT_LOOKUP_TIMEOUT=2    seconds per request
+"""
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Must match MAX_PRODUCT_IDS in the Flask app
+BATCH_SIZE = 100
+# Unknown ids are remembered for less time than real cards
+NOT_FOUND_TTL = 30
+
+_MISS = object()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(product_id):
+    with _cache_lock:
+        entry = _cache.get(product_id)
+        if entry is None:
+            return _MISS
+        expires, card = entry
+        if expires < time.monotonic():
+            del _cache[product_id]
+            return _MISS
+        _cache.move_to_end(product_id)
+        return card
+
+
+def _store(cards):
+    now = time.monotonic()
+    with _cache_lock:
+        for product_id, card in cards.items():
+            ttl = settings.CHAT_PRODUCT_CACHE_TTL if card is not None else min(NOT_FOUND_TTL, settings.CHAT_PRODUCT_CACHE_TTL)
+            _cache[product_id] = (now + ttl, card)
+            _cache.move_to_end(product_id)
+        while len(_cache) > settings.CHAT_PRODUCT_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+class ProductClient:
+    """HTTP session and in-flight lookups for one event loop"""
+
+    def __init__(self):
+        self.session = None
+        self.inflight = {}
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            import aiohttp
+            timeout = settings.CHAT_PRODUCT_LOOKUP_TIMEOUT
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=timeout, connect=min(1, timeout)),
+                connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+            )
+        return self.session
+
+    async def _fetch(self, product_ids):
+        """{id: card or None} straight from Flask; raises on transport errors"""
+        cards = dict.fromkeys(product_ids)
+        url = f"{settings.FLASK_API_URL.rstrip('/')}/api/products"
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            chunk = product_ids[start:start + BATCH_SIZE]
+            async with self._session().get(url, params={'ids': ','.join(map(str, chunk))}) as response:
+                response.raise_for_status()
+                data = await response.json()
+            for card in data.get('products', []):
+                cards[card['id']] = card
+        return cards
+
+    async def get_many(self, product_ids):
+        """{id: card or None}; None for unknown products or when Flask is unreachable"""
+        product_ids = list(dict.fromkeys(int(product_id) for product_id in product_ids))
+        result = {}
+        waiting = {}
+        to_fetch = []
+        for product_id in product_ids:
+            card = _cached(product_id)
+            if card is not _MISS:
+                result[product_id] = card
+            elif product_id in self.inflight:
+                waiting[product_id] = self.inflight[product_id]
+            else:
+                to_fetch.append(product_id)
+
+        if to_fetch:
+            loop = asyncio.get_running_loop()
+            futures = {product_id: loop.create_future() for product_id in to_fetch}
+            self.inflight.update(futures)
+            cards = None
+            try:
+                cards = await self._fetch(to_fetch)
+                _store(cards)
+            except Exception as e:
+                logger.warning(f"Product lookup for {to_fetch} failed: {e}")
+            finally:
+                for product_id, future in futures.items():
+                    self.inflight.pop(product_id, None)
+                    card = cards.get(product_id) if cards else None
+                    future.set_result(card)
+                    result[product_id] = card
+
+        for product_id, future in waiting.items():
+            # Shielded: a cancelled caller must not cancel the shared lookup
+            result[product_id] = await asyncio.shield(future)
+        return result
+
+    async def get(self, product_id):
+        return (await self.get_many([product_id])).get(int(product_id))
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def client():
+    """The ProductClient of the running event loop"""
+    loop = asyncio.get_running_loop()
+    product_client = _clients.get(loop)
+    if product_client is None:
+        product_client = _clients[loop] = ProductClient()
+    return product_client
+
+
+async def get_product(product_id):
+    return await client().get(product_id)
+
+
+async def get_products(product_ids):
+    return await client().get_many(product_ids)
@@ -0,0 +1,116 @@
+"""
+Per-room message counters
+
+ChatRoom keeps message_count, unread_messages_count, buyer_unread_count
+and a pointer to its latest message (last_message, last_message_at), so
+room lists, stats and the pending badge read fields instead of
+aggregating chat_messages. Writes that change them go through here, in
+the same transaction as the message write:
+
+    record_messages()  messages were saved (one UPDATE per room)
+    mark_room_read()   a room's unread messages were read
+
+Counters cover messages that are not deleted. Changes made any other way
+(admin edits, soft deletes, SQL) are corrected by
+`manage.py reconcile_room_counters`, which uses reconcile().
+"""
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import ChatMessage, ChatRoom
+
+COUNTER_FIELDS = ('message_count', 'unread_messages_count', 'buyer_unread_count',
+                  'last_message_id', 'last_message_at')
+
+
+def record_messages(messages):
+    """Count newly saved messages in their rooms; call in the transaction that saved them"""
+    by_room = {}
+    for message in messages:
+        if not message.is_deleted:
+            by_room.setdefault(message.room_id, []).append(message)
+
+    # Rooms in id order, so concurrent batches lock them in the same order
+    for room_id in sorted(by_room):
+        room_messages = by_room[room_id]
+        unread = [message for message in room_messages if not message.is_read]
+        buyer_unread = sum(1 for message in unread if message.sender_type == 'buyer')
+        latest = max(room_messages, key=lambda message: (message.created_at, message.pk))
+        # Messages committed out of order must not move the pointer back
+        newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=latest.created_at)
+        ChatRoom.objects.filter(pk=room_id).update(
+            message_count=F('message_count') + len(room_messages),
+            unread_messages_count=F('unread_messages_count') + len(unread),
+            buyer_unread_count=F('buyer_unread_count') + buyer_unread,
+            last_message_id=Case(When(newer, then=Value(latest.pk)), default=F('last_message_id'),
+                                 output_field=models.BigIntegerField()),
+            last_message_at=Case(When(newer, then=Value(latest.created_at)), default=F('last_message_at')),
+        )
+
+
+def record_message(message):
+    record_messages([message])
+
+
+def mark_room_read(room):
+    """Mark every unread message in `room` read; returns the ids marked"""
+    with transaction.atomic():
+        # Room row first: a message saved concurrently is either marked
+        # here or counted as unread once this commits, never lost
+        list(ChatRoom.objects.select_for_update(no_key=True).filter(pk=room.pk).values_list('pk'))
+        unread = ChatMessage.objects.filter(room=room, is_read=False)
+        message_ids = list(unread.values_list('id', flat=True))
+        if message_ids:
+            unread.update(is_read=True)
+            ChatRoom.objects.filter(pk=room.pk).update(unread_messages_count=0, buyer_unread_count=0)
+    return message_ids
+
+
+def _actual_counters():
+    """Annotations with a room's counters computed from chat_messages"""
+    visible = ChatMessage.objects.filter(room=OuterRef('pk'), is_deleted=False).order_by()
+    latest = visible.order_by('-created_at', '-id')
+
+    def count(messages):
+        return Coalesce(Subquery(messages.values('room').annotate(n=Count('id')).values('n')), 0)
+
+    return {
+        'actual_message_count': count(visible),
+        'actual_unread_messages_count': count(visible.filter(is_read=False)),
+        'actual_buyer_unread_count': count(visible.filter(is_read=False, sender_type='buyer')),
+        'actual_last_message_id': Subquery(latest.values('id')[:1]),
+        'actual_last_message_at': Subquery(latest.values('created_at')[:1]),
+    }
+
+
+def reconcile(rooms=None, dry_run=False, batch_size=500):
+    """
+    Recompute the counters of `rooms` (default: all) from chat_messages.
+
+    Returns [(room, {field: (stored, actual)})] for the rooms that had
+    drifted; they are corrected unless dry_run. Each batch is recomputed
+    with its rooms locked, so messages saved meanwhile are not lost.
+    """
+    rooms = ChatRoom.objects.all() if rooms is None else rooms
+    room_ids = list(rooms.order_by('pk').values_list('pk', flat=True))
+    drifted = []
+    for start in range(0, len(room_ids), batch_size):
+        with transaction.atomic():
+            batch = (ChatRoom.objects.select_for_update(no_key=True)
+                     .filter(pk__in=room_ids[start:start + batch_size])
+                     .annotate(**_actual_counters()))
+            stale = []
+            for room in batch:
+                changes = {}
+                for field in COUNTER_FIELDS:
+                    stored, actual = getattr(room, field), getattr(room, f'actual_{field}')
+                    if stored != actual:
+                        changes[field] = (stored, actual)
+                        setattr(room, field, actual)
+                if changes:
+                    drifted.append((room, changes))
+                    stale.append(room)
+            if stale and not dry_run:
+                ChatRoom.objects.bulk_update(stale, COUNTER_FIELDS)
+    return drifted
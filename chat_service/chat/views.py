@@ -4,7 +4,9 @@ REST API views for chat microservice
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db.models import Count, Q
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
@@ -13,6 +15,7 @@ from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination
 
 from .models import ChatRoom, ChatMessage, ChatSession
+from . import room_counters, room_list
 from .serializers import ChatRoomSerializer, ChatMessageSerializer, ChatSessionSerializer
 from .permissions import IsAdminOrStaff, IsOwnerOrAdmin
 
@@ -182,12 +185,10 @@ class PendingChatsView(APIView):
     def get(self, request):
         """Get pending chat count and recent messages"""
         try:
-            # Count unread messages from buyers
-            pending_count = ChatMessage.objects.filter(
-                is_read=False,
-                sender_type='buyer',
-                is_deleted=False
-            ).count()
+            # Count unread messages from buyers (per-room counters)
+            pending_count = ChatRoom.objects.aggregate(
+                total=Coalesce(Sum('buyer_unread_count'), 0)
+            )['total']
 
             # Get recent unread messages
             recent_messages = ChatMessage.objects.filter(
@@ -219,7 +220,7 @@ class ChatStatsView(APIView):
         try:
             # Basic counts
             total_rooms = ChatRoom.objects.count()
-            total_messages = ChatMessage.objects.filter(is_deleted=False).count()
+            total_messages = ChatRoom.objects.aggregate(total=Coalesce(Sum('message_count'), 0))['total']
             active_sessions = ChatSession.objects.filter(is_active=True).count()
 
             # Messages by type
@@ -230,7 +231,7 @@ class ChatStatsView(APIView):
             ).order_by('sender_type')
 
             # Recent activity (last 7 days) - using TruncDate instead of deprecated extra()
-            from django.db.models import TruncDate
+            from django.db.models.functions import TruncDate
             week_ago = timezone.now() - timezone.timedelta(days=7)
             recent_activity = ChatMessage.objects.filter(
                 created_at__gte=week_ago,
@@ -241,18 +242,15 @@ class ChatStatsView(APIView):
                 count=Count('id')
             ).order_by('date')
 
-            # Top active rooms - consistent message counting (exclude deleted)
-            top_rooms = ChatRoom.objects.annotate(
-                message_count=Count('messages', filter=Q(messages__is_deleted=False))
-            ).order_by('-message_count')[:5]
+            # Top active rooms - message_count excludes deleted messages
+            top_rooms = ChatRoom.objects.select_related('last_message').order_by('-message_count')[:5]
 
             top_rooms_data = []
             for room in top_rooms:
-                last_active_message = room.messages.filter(is_deleted=False).order_by('-created_at').first()
                 top_rooms_data.append({
                     'name': room.name,
                     'message_count': room.message_count,
-                    'last_message': last_active_message.formatted_created_at if last_active_message else None
+                    'last_message': room.last_message.formatted_created_at if room.last_message else None
                 })
 
             return Response({
@@ -276,7 +274,7 @@ class BuyerChatRoomsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        """Get list of buyer chat rooms with search functionality"""
+        """Get a page of buyer chat rooms with search functionality"""
         try:
             search_query = request.query_params.get('search', '').strip()
 
@@ -286,23 +284,18 @@ class BuyerChatRoomsView(APIView):
                 is_active=True
             ).exclude(name='support_room')
 
-            # Apply search filter
-            if search_query:
-                from django.db import models as django_models
-                rooms_query = rooms_query.filter(
-                    django_models.Q(buyer_name__icontains=search_query) |
-                    django_models.Q(buyer_email__icontains=search_query)
+            try:
+                rooms, next_cursor = room_list.room_page(
+                    rooms_query,
+                    search=search_query,
+                    cursor=request.query_params.get('cursor'),
+                    limit=room_list.page_size(request.query_params.get('limit'))
                 )
-
-            # Order by latest message
-            from django.db.models import Max
-            rooms = rooms_query.annotate(
-                last_message_time=Max('messages__created_at')
-            ).order_by('-last_message_time', '-created_at')
+            except room_list.InvalidCursor:
+                return Response({'error': 'Cursor tidak valid'}, status=status.HTTP_400_BAD_REQUEST)
 
             rooms_data = []
             for room in rooms:
-                last_message = room.last_message
                 rooms_data.append({
                     'id': room.id,
                     'name': room.name,
@@ -312,16 +305,23 @@ class BuyerChatRoomsView(APIView):
                     'unread_count': room.unread_messages_count,
                     'message_count': room.message_count,
                     'last_message': {
-                        'content': last_message.message[:50] + '...' if last_message and len(last_message.message) > 50 else last_message.message if last_message else None,
-                        'timestamp': last_message.created_at.isoformat() if last_message else None,
-                        'sender_type': last_message.sender_type if last_message else None
-                    } if last_message else None,
+                        'content': room_list.preview(room.last_message.message),
+                        'timestamp': room.last_message.created_at.isoformat(),
+                        'sender_type': room.last_message.sender_type
+                    } if room.last_message else None,
                     'created_at': room.created_at.isoformat()
                 })
 
+            # Across all rooms, not just the loaded pages (sidebar badge)
+            total_unread = rooms_query.aggregate(
+                total=Coalesce(Sum('unread_messages_count'), 0)
+            )['total']
+
             return Response({
                 'rooms': rooms_data,
-                'total_count': len(rooms_data)
+                'total_count': len(rooms_data),
+                'total_unread': total_unread,
+                'next_cursor': next_cursor
             }, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -344,16 +344,9 @@ class MarkMessagesAsReadView(APIView):
             room = get_object_or_404(ChatRoom, name=room_name)
             user = request.user if hasattr(request, 'user') else request.jwt_user
 
-            # Get unread messages before marking as read
-            unread_messages = ChatMessage.objects.filter(
-                room=room,
-                is_read=False
-            )
-
-            message_ids = list(unread_messages.values_list('id', flat=True))
-
-            # Mark unread messages as read
-            updated_count = unread_messages.update(is_read=True)
+            # Mark unread messages as read and reset the room's unread counters
+            message_ids = room_counters.mark_room_read(room)
+            updated_count = len(message_ids)
 
             # Send notification to room about read status
             if updated_count > 0:
@@ -406,24 +399,21 @@ def get_buyer_rooms(request):
 
         search_query = request.GET.get('search', '').strip()
 
-        # Build the query
-        rooms_query = ChatRoom.objects.select_related().prefetch_related('messages')
-
-        if search_query:
-            rooms_query = rooms_query.filter(
-                Q(buyer_name__icontains=search_query) |
-                Q(buyer_email__icontains=search_query) |
-                Q(name__icontains=search_query)
+        # One query per page: counts are room columns, the last message is joined
+        try:
+            rooms, next_cursor = room_list.room_page(
+                ChatRoom.objects.all(),
+                search=search_query,
+                search_fields=('buyer_name', 'buyer_email', 'name'),
+                cursor=request.GET.get('cursor'),
+                limit=room_list.page_size(request.GET.get('limit'))
             )
-
-        rooms = rooms_query.order_by('-created_at')
+        except room_list.InvalidCursor:
+            return Response({'error': 'Invalid cursor', 'rooms': [], 'total_count': 0}, status=400)
 
         # Serialize the data
         rooms_data = []
         for room in rooms:
-            last_message = room.messages.first()
-            unread_count = room.messages.filter(is_read=False, sender_type='buyer').count()
-
             room_data = {
                 'id': room.id,
                 'name': room.name,
@@ -432,18 +422,23 @@ def get_buyer_rooms(request):
                 'buyer_email': room.buyer_email or '',
                 'created_at': room.created_at.isoformat() if room.created_at else None,
                 'is_active': room.is_active,
-                'unread_count': unread_count,
+                'unread_count': room.buyer_unread_count,
                 'last_message': {
-                    'content': last_message.message if last_message else '',
-                    'created_at': last_message.created_at.isoformat() if last_message else None,
-                    'sender_type': last_message.sender_type if last_message else '',
-                } if last_message else None,
+                    'content': room.last_message.message or '',
+                    'created_at': room.last_message.created_at.isoformat(),
+                    'sender_type': room.last_message.sender_type or '',
+                } if room.last_message else None,
             }
             rooms_data.append(room_data)
 
         return Response({
             'rooms': rooms_data,
-            'total_count': len(rooms_data)
+            'total_count': len(rooms_data),
+            # Across all rooms, not just the loaded pages
+            'total_unread': ChatRoom.objects.aggregate(
+                total=Coalesce(Sum('buyer_unread_count'), 0)
+            )['total'],
+            'next_cursor': next_cursor
         })
 
     except Exception as e:
@@ -476,16 +471,18 @@ def send_message(request):
             defaults={'is_active': True}
         )
         
-        # Create message
-        chat_message = ChatMessage.objects.create(
-            room=room,
-            user_id=request.user.get('id', 0),
-            user_name=request.user.get('name', 'Anonymous'),
-            user_email=request.user.get('email', ''),
-            message=message,
-            sender_type=request.user.get('role', 'buyer'),
-            product_id=product_id
-        )
+        # Create message and count it in the room
+        with transaction.atomic():
+            chat_message = ChatMessage.objects.create(
+                room=room,
+                user_id=request.user.get('id', 0),
+                user_name=request.user.get('name', 'Anonymous'),
+                user_email=request.user.get('email', ''),
+                message=message,
+                sender_type=request.user.get('role', 'buyer'),
+                product_id=product_id
+            )
+            room_counters.record_message(chat_message)
         
         serializer = ChatMessageSerializer(chat_message)
         return Response(serializer.data, status=201)
@@ -533,10 +530,7 @@ def mark_messages_read(request, room_name):
     """Mark messages as read in a room"""
     try:
         room = get_object_or_404(ChatRoom, name=room_name)
-        ChatMessage.objects.filter(
-            room=room,
-            is_read=False
-        ).update(is_read=True)
+        room_counters.mark_room_read(room)
         
         return Response({'message': 'Messages marked as read'})
     except Exception as e:
@@ -217,6 +217,18 @@ else:
         },
     }
 
+# Chat message persistence (chat/message_store.py): 0 writes each message
+# in its own transaction; > 0 group-commits the messages received within
+# that many milliseconds with one bulk insert
+CHAT_WRITE_BEHIND_MS = int(os.environ.get('CHAT_WRITE_BEHIND_MS', '0'))
+CHAT_WRITE_BEHIND_BATCH = int(os.environ.get('CHAT_WRITE_BEHIND_BATCH', '500'))
+
+# Product tags in chat (chat/product_client.py): Flask store API and card cache
+FLASK_API_URL = os.environ.get('FLASK_API_URL', 'http://127.0.0.1:5000')
+CHAT_PRODUCT_CACHE_TTL = int(os.environ.get('CHAT_PRODUCT_CACHE_TTL', '300'))
+CHAT_PRODUCT_CACHE_SIZE = int(os.environ.get('CHAT_PRODUCT_CACHE_SIZE', '2000'))
+CHAT_PRODUCT_LOOKUP_TIMEOUT = float(os.environ.get('CHAT_PRODUCT_LOOKUP_TIMEOUT', '2'))
+
 # CORS Configuration - Dynamic domain support with security
 def build_cors_origins():
     origins = [
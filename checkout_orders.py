@@ -0,0 +1,115 @@
+"""
+Turning a paid checkout into an order
+
+payment_success() can be hit more than once for the same payment (page
+refresh, double redirect from the provider, two tabs). The checkout
+stores the provider's reference (Stripe checkout session id / Midtrans
+order id) in the Flask session, and orders.payment_reference is unique,
+so the first request creates the order and every retry finds it instead.
+
+The order is written in a fixed number of statements whatever the cart
+size: one INSERT for the order, one executemany INSERT for its items, the
+stock settlement and one DELETE for the cart.
+"""
+import sqlalchemy as sa
+from sqlalchemy import delete, insert, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from database import db
+import models
+import stock_reservations
+
+SESSION_KEY = 'checkout_ref'
+
+
+def payment_reference(provider, provider_id):
+    """Idempotency key stored on the order, e.g. 'stripe:cs_test_...'"""
+    return f"{provider}:{provider_id}"
+
+
+def create_paid_order(user, reference, shipping_service_id=None, shipping_cost=0):
+    """
+    Create the paid order for `reference` from the user's cart and commit.
+
+    Returns (order, created). A retry for a reference that already has an
+    order returns that order with created=False and leaves the cart alone.
+    """
+    existing = models.Order.query.filter_by(payment_reference=reference).first()
+    if existing:
+        return existing, False
+
+    cart_items = (models.CartItem.query
+                  .options(joinedload(models.CartItem.product))
+                  .filter_by(user_id=user.id)
+                  .all())
+    if not cart_items:
+        return None, False
+
+    subtotal = sum(item.quantity * item.product.price for item in cart_items)
+    estimated_delivery_days = 0
+    if shipping_service_id:
+        shipping_service = db.session.get(models.ShippingService, int(shipping_service_id))
+        if shipping_service:
+            estimated_delivery_days = shipping_service.max_days
+
+    order = models.Order(
+        user_id=user.id,
+        total_amount=float(subtotal) + float(shipping_cost),
+        shipping_cost=shipping_cost,
+        shipping_service_id=int(shipping_service_id) if shipping_service_id else None,
+        estimated_delivery_days=estimated_delivery_days,
+        shipping_address=user.address,
+        payment_method=reference.split(':', 1)[0],
+        payment_reference=reference,
+        status='paid',
+        created_at=models.get_utc_time()
+    )
+    try:
+        db.session.add(order)
+        db.session.flush()  # Concurrent retry loses here, on the unique payment_reference
+
+        db.session.execute(insert(models.OrderItem), [
+            {
+                'order_id': order.id,
+                'product_id': item.product_id,
+                'quantity': item.quantity,
+                'price': item.product.price,
+            }
+            for item in cart_items
+        ])
+
+        # Held stock becomes the sale, in the same transaction as the order
+        stock_reservations.settle_order(user.id, order.id, cart_items, reference.split(':', 1)[1])
+
+        # Only the rows that were ordered; items added meanwhile stay in the cart
+        db.session.execute(
+            delete(models.CartItem)
+            .where(models.CartItem.user_id == user.id,
+                   models.CartItem.id.in_([item.id for item in cart_items]))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        existing = models.Order.query.filter_by(payment_reference=reference).first()
+        if existing is None:
+            raise
+        return existing, False
+
+    return order, True
+
+
+def ensure_payment_reference_column():
+    """Add orders.payment_reference to databases created before it existed"""
+    try:
+        columns = [col['name'] for col in sa.inspect(db.engine).get_columns('orders')]
+        with db.engine.connect() as conn:
+            if 'payment_reference' not in columns:
+                conn.execute(text('ALTER TABLE orders ADD COLUMN payment_reference VARCHAR(255)'))
+                print("[OK] Added orders.payment_reference column")
+            conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_orders_payment_reference '
+                              'ON orders (payment_reference)'))
+            conn.commit()
+    except Exception as e:
+        print(f"[WARNING] Could not add orders.payment_reference column: {e}")
@@ -25,12 +25,8 @@ def configure_database(app):
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
     db.init_app(app)
-    
-    with app.app_context():
-        try:
-            db.create_all()
-            print("[OK] Database PostgreSQL berhasil dikonfigurasi dan tabel dibuat")
-            return True
-        except Exception as e:
-            print(f"[ERROR] Error konfigurasi database: {e}")
-            return False
\ No newline at end of file
+
+    # No connection is made here; tables are created by main.bootstrap_database()
+    # (`python main.py --init-db`) so importing the app stays cheap
+    print("[OK] Database dikonfigurasi")
+    return True
\ No newline at end of file
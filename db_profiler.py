@@ -0,0 +1,212 @@
+"""
+Opt-in per-request SQL profiling
+
+Enable with DB_PROFILING=1. Every statement run through SQLAlchemy during a
+request is timed via engine cursor events; the totals are sent back in a
+`Server-Timing` header, aggregated per endpoint for the /admin/perf page,
+and requests over the configured thresholds are logged.
+
+    DB_PROFILING=1              turn the profiler on
+    DB_SLOW_QUERY_MS=100        statements slower than this are logged
+    DB_SLOW_REQUEST_MS=500      requests slower than this are logged
+    DB_SLOW_REQUEST_QUERIES=50  requests issuing more statements are logged
+"""
+import heapq
+import os
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOWEST_PER_REQUEST = 5
+SLOWEST_OVERALL = 20
+RECENT_SLOW_REQUESTS = 50
+STATEMENT_PREVIEW = 500
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+def is_enabled():
+    return os.environ.get('DB_PROFILING', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+class _EndpointStats:
+    __slots__ = ('requests', 'total_ms', 'max_ms', 'db_ms', 'queries', 'max_queries')
+
+    def __init__(self):
+        self.requests = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.db_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+
+    def as_dict(self, endpoint):
+        return {
+            'endpoint': endpoint,
+            'requests': self.requests,
+            'avg_ms': self.total_ms / self.requests if self.requests else 0,
+            'max_ms': self.max_ms,
+            'avg_db_ms': self.db_ms / self.requests if self.requests else 0,
+            'avg_queries': self.queries / self.requests if self.requests else 0,
+            'max_queries': self.max_queries,
+        }
+
+
+class QueryProfiler:
+    """Collects per-request statement timings and process-wide aggregates"""
+
+    def __init__(self):
+        self.slow_query_ms = _env_float('DB_SLOW_QUERY_MS', 100)
+        self.slow_request_ms = _env_float('DB_SLOW_REQUEST_MS', 500)
+        self.slow_request_queries = int(_env_float('DB_SLOW_REQUEST_QUERIES', 50))
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._slowest = []  # min-heap of (ms, statement, endpoint)
+            self._slow_requests = deque(maxlen=RECENT_SLOW_REQUESTS)
+            self.started_at = time.time()
+
+    # -- engine events -----------------------------------------------------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            conn.info.setdefault('profiler_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context():
+            return
+        starts = conn.info.get('profiler_start')
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+
+        profile = g.get('_db_profile')
+        if profile is None:
+            return
+        profile['count'] += 1
+        profile['db_ms'] += elapsed_ms
+        entry = (elapsed_ms, statement[:STATEMENT_PREVIEW])
+        if len(profile['slowest']) < SLOWEST_PER_REQUEST:
+            heapq.heappush(profile['slowest'], entry)
+        else:
+            heapq.heappushpop(profile['slowest'], entry)
+
+        if elapsed_ms >= self.slow_query_ms:
+            print(f"[WARNING] Slow query {elapsed_ms:.1f}ms on {request.endpoint}: "
+                  f"{' '.join(statement.split())[:200]}")
+
+    def _handle_error(self, exception_context):
+        # after_cursor_execute is skipped for failed statements
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('profiler_start'):
+            conn.info['profiler_start'].pop()
+
+    # -- request hooks -----------------------------------------------------
+
+    def _before_request(self):
+        g._db_profile = {'start': time.perf_counter(), 'count': 0, 'db_ms': 0.0, 'slowest': []}
+
+    def _after_request(self, response):
+        profile = g.pop('_db_profile', None)
+        if profile is None:
+            return response
+        total_ms = (time.perf_counter() - profile['start']) * 1000
+        endpoint = request.endpoint or request.path
+
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={profile["db_ms"]:.1f};desc="{profile["count"]} queries", '
+            f'app;dur={total_ms:.1f}'
+        )
+
+        self._record(endpoint, total_ms, profile)
+
+        if total_ms >= self.slow_request_ms or profile['count'] >= self.slow_request_queries:
+            print(f"[WARNING] Slow request {request.method} {request.path} "
+                  f"({endpoint}): {total_ms:.1f}ms, {profile['count']} queries, "
+                  f"{profile['db_ms']:.1f}ms in database")
+        return response
+
+    def _record(self, endpoint, total_ms, profile):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = _EndpointStats()
+            stats.requests += 1
+            stats.total_ms += total_ms
+            stats.max_ms = max(stats.max_ms, total_ms)
+            stats.db_ms += profile['db_ms']
+            stats.queries += profile['count']
+            stats.max_queries = max(stats.max_queries, profile['count'])
+
+            for elapsed_ms, statement in profile['slowest']:
+                entry = (elapsed_ms, statement, endpoint)
+                if len(self._slowest) < SLOWEST_OVERALL:
+                    heapq.heappush(self._slowest, entry)
+                else:
+                    heapq.heappushpop(self._slowest, entry)
+
+            if total_ms >= self.slow_request_ms or profile['count'] >= self.slow_request_queries:
+                self._slow_requests.appendleft({
+                    'at': time.time(),
+                    'method': request.method,
+                    'path': request.full_path.rstrip('?'),
+                    'endpoint': endpoint,
+                    'total_ms': total_ms,
+                    'db_ms': profile['db_ms'],
+                    'queries': profile['count'],
+                })
+
+    # -- reporting ---------------------------------------------------------
+
+    def snapshot(self):
+        """Aggregates for the /admin/perf page, worst endpoints first"""
+        with self._lock:
+            endpoints = [stats.as_dict(name) for name, stats in self._endpoints.items()]
+            slowest = sorted(self._slowest, reverse=True)
+            slow_requests = list(self._slow_requests)
+        endpoints.sort(key=lambda e: e['avg_ms'] * e['requests'], reverse=True)
+        return {
+            'enabled': self.enabled,
+            'started_at': self.started_at,
+            'endpoints': endpoints,
+            'slowest_queries': [
+                {'ms': ms, 'statement': statement, 'endpoint': endpoint}
+                for ms, statement, endpoint in slowest
+            ],
+            'slow_requests': slow_requests,
+            'thresholds': {
+                'slow_query_ms': self.slow_query_ms,
+                'slow_request_ms': self.slow_request_ms,
+                'slow_request_queries': self.slow_request_queries,
+            },
+        }
+
+    def init_app(self, app):
+        """Attach the hooks to `app` and every engine, if DB_PROFILING is set"""
+        if not is_enabled() or self.enabled:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(Engine, 'handle_error', self._handle_error)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        self.enabled = True
+        print(f"[OK] SQL profiling enabled (slow query >= {self.slow_query_ms:.0f}ms, "
+              f"slow request >= {self.slow_request_ms:.0f}ms or {self.slow_request_queries} queries)")
+
+
+profiler = QueryProfiler()
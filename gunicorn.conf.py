@@ -0,0 +1,49 @@
+"""
+Gunicorn settings for the production Flask service
+
+Used by `server.py --production` and the systemd unit. Every value can be
+overridden from the environment:
+
+    HURTROCK_BIND=0.0.0.0:5000
+    WEB_CONCURRENCY=<2 x CPU + 1>   worker processes
+    GUNICORN_THREADS=4              threads per worker (gthread)
+    GUNICORN_MAX_REQUESTS=1000      recycle a worker after this many requests
+    GUNICORN_MAX_REQUESTS_JITTER=100
+    GUNICORN_TIMEOUT=60
+    GUNICORN_GRACEFUL_TIMEOUT=30
+
+Send SIGHUP to the master for a graceful reload (new workers are started
+with fresh code before the old ones finish their in-flight requests).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('HURTROCK_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Inherited by the workers; per-process caches that need a single worker check it
+os.environ['HURTROCK_WORKERS'] = str(workers)
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+# Each worker imports the app itself so a HUP reload picks up new code and
+# no database connection is shared across fork()
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+proc_name = 'hurtrock-music-store'
+
+
+def on_starting(server):
+    server.log.info(f"Hurtrock Music Store: {workers} workers x {threads} threads on {bind}")
+
+
+def worker_exit(server, worker):
+    server.log.info(f"Worker {worker.pid} exiting (recycled or shutting down)")
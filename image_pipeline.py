@@ -0,0 +1,180 @@
+"""
+Background processing for uploaded images
+
+Upload routes save the file, record an ImageJob row in the same
+transaction as the product and return; a small thread pool then claims
+pending jobs and compresses the images off the request path. Jobs live in
+the database, so work left over when a worker stops is picked up again by
+the next process to serve a request, and the admin UI can show progress.
+Jobs for one file run in the order they were queued, so derivatives are
+rendered from the compressed file, not the upload it replaces.
+
+    IMAGE_WORKERS=2             threads per process
+    IMAGE_JOB_MAX_ATTEMPTS=3    give up on an image after this many failures
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from sqlalchemy import distinct, exists, func, update
+from sqlalchemy.orm import aliased
+
+from database import db
+import models
+
+MAX_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+MAX_ATTEMPTS = int(os.environ.get('IMAGE_JOB_MAX_ATTEMPTS', '3'))
+# A job left in 'processing' this long belongs to a worker that died
+STALE_AFTER = timedelta(minutes=10)
+
+
+class ImagePipeline:
+    """Thread pool draining the image_jobs table"""
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self.app = None
+        self.handlers = {}
+        self._executor = None
+        self._active = 0
+        self._lock = threading.Lock()
+        self._resumed = False
+
+    def init_app(self, app):
+        self.app = app
+
+        @app.before_request
+        def _resume_image_jobs():
+            # First request in this process: pick up jobs left by a previous run
+            if not self._resumed:
+                self._resumed = True
+                self.resume()
+
+    def handler(self, operation):
+        """Register the function that performs `operation` on a job"""
+        def register(func):
+            self.handlers[operation] = func
+            return func
+        return register
+
+    def enqueue(self, image_path, image_url=None, operation='compress'):
+        """Add a job to the current session; call kick() after committing"""
+        job = models.ImageJob(image_path=image_path, image_url=image_url, operation=operation)
+        db.session.add(job)
+        return job
+
+    def kick(self):
+        """Make sure enough pool threads are draining the queue"""
+        with self._lock:
+            if self._executor is None:
+                # Created lazily so gunicorn workers each get their own threads after fork
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='image-pipeline')
+            while self._active < self.max_workers:
+                self._active += 1
+                self._executor.submit(self._drain)
+
+    def resume(self):
+        """Requeue jobs abandoned by a dead worker and start draining"""
+        try:
+            cutoff = models.get_utc_time() - STALE_AFTER
+            db.session.execute(
+                update(models.ImageJob)
+                .where(models.ImageJob.status == 'processing', models.ImageJob.started_at < cutoff)
+                .values(status='pending')
+            )
+            db.session.commit()
+            has_pending = db.session.query(models.ImageJob.id).filter_by(status='pending').first()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARNING] Could not resume image jobs: {e}")
+            return
+        if has_pending:
+            self.kick()
+
+    def _claim(self):
+        """Atomically move one pending job to 'processing'; safe across processes"""
+        while True:
+            # Not while an earlier job for the same file is still open
+            earlier = aliased(models.ImageJob)
+            blocked = exists().where(earlier.image_path == models.ImageJob.image_path,
+                                     earlier.id < models.ImageJob.id,
+                                     earlier.status.in_(('pending', 'processing')))
+            job_id = db.session.query(models.ImageJob.id)\
+                .filter(models.ImageJob.status == 'pending', ~blocked)\
+                .order_by(models.ImageJob.id).limit(1).scalar()
+            if job_id is None:
+                return None
+            claimed = db.session.execute(
+                update(models.ImageJob)
+                .where(models.ImageJob.id == job_id, models.ImageJob.status == 'pending')
+                .values(status='processing', started_at=models.get_utc_time(),
+                        attempts=models.ImageJob.attempts + 1)
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(models.ImageJob, job_id)
+
+    def _drain(self):
+        try:
+            with self.app.app_context():
+                while True:
+                    job = self._claim()
+                    if job is None:
+                        return
+                    self._run(job)
+        except Exception as e:
+            print(f"[ERROR] Image pipeline worker failed: {e}")
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _run(self, job):
+        handler = self.handlers.get(job.operation)
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for operation {job.operation!r}")
+            handler(job)
+            job.status = 'done'
+            job.error = None
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(models.ImageJob, job.id)
+            job.error = str(e)[:1000]
+            job.status = 'failed' if (job.attempts or 0) >= MAX_ATTEMPTS else 'pending'
+            print(f"[ERROR] Image job {job.id} ({job.image_path}) failed: {e}")
+        job.finished_at = models.get_utc_time()
+        db.session.commit()
+
+    # -- admin reporting ---------------------------------------------------
+
+    def status_by_product(self, product_ids=None):
+        """{product_id: {'pending': n, 'failed': n}} for products with open jobs"""
+        # Jobs belong to files; a file shared by several products counts for each
+        query = db.session.query(
+            models.ProductImage.product_id, models.ImageJob.status, func.count(distinct(models.ImageJob.id))
+        ).join(
+            models.ProductImage, models.ProductImage.image_url == models.ImageJob.image_url
+        ).filter(
+            models.ImageJob.status.in_(['pending', 'processing', 'failed'])
+        )
+        if product_ids is not None:
+            query = query.filter(models.ProductImage.product_id.in_(product_ids))
+
+        result = {}
+        for product_id, status, count in query.group_by(models.ProductImage.product_id, models.ImageJob.status):
+            entry = result.setdefault(product_id, {'pending': 0, 'failed': 0})
+            entry['failed' if status == 'failed' else 'pending'] += count
+        return result
+
+    def summary(self):
+        """Job counts per status"""
+        rows = db.session.query(models.ImageJob.status, func.count(models.ImageJob.id))\
+            .group_by(models.ImageJob.status).all()
+        counts = {'pending': 0, 'processing': 0, 'done': 0, 'failed': 0}
+        counts.update(dict(rows))
+        return counts
+
+
+pipeline = ImagePipeline()
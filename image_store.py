@@ -0,0 +1,196 @@
+"""
+Content-addressed storage for product images
+
+Uploads are named after the SHA-256 of their bytes, so the same photo
+uploaded for several products (or re-uploaded on edit) is stored,
+compressed and turned into derivatives only once. A file's references are
+the ProductImage rows (and Product.image_url values) pointing at its URL;
+collect_garbage() removes files, derivatives and queued jobs once nothing
+refers to them any more. An unreferenced file it cannot remove yet (too
+recent, or a job is still working on it) is recorded in image_orphans
+and collected later by maybe_collect_deferred(), which runs on admin
+product pages, or by `flask gc-images`.
+
+    IMAGE_GC_GRACE_SECONDS=300   files touched more recently are never collected
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+import image_variants
+import models
+
+UPLOAD_URL = '/static/public/produk_images'
+HASH_CHUNK_SIZE = 1024 * 1024
+# An upload that reuses a file may not have committed its ProductImage yet
+GC_GRACE_SECONDS = int(os.environ.get('IMAGE_GC_GRACE_SECONDS', '300'))
+# Per-process throttle for the deferred collection
+DEFERRED_INTERVAL = 60.0
+
+_deferred_lock = threading.Lock()
+_last_deferred = 0.0
+
+_EXTENSION_ALIASES = {'jpeg': 'jpg'}
+
+StoredImage = namedtuple('StoredImage', 'path url is_new')
+
+
+def _extension(filename):
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'bin'
+    return _EXTENSION_ALIASES.get(ext, ext)
+
+
+def store_upload(file, upload_folder):
+    """
+    Save an uploaded FileStorage under its content hash.
+
+    Returns StoredImage(path, url, is_new); is_new is False when identical
+    bytes were stored before, in which case nothing is written and the
+    existing (already processed) file is reused.
+    """
+    stream = file.stream
+    stream.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+
+    filename = f"{digest.hexdigest()}.{_extension(file.filename)}"
+    path = os.path.join(upload_folder, filename)
+    url = f"{UPLOAD_URL}/{filename}"
+
+    if os.path.exists(path):
+        # Refresh the mtime so a concurrent collect_garbage() leaves it alone
+        os.utime(path)
+        return StoredImage(path, url, False)
+
+    os.makedirs(upload_folder, exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    file.save(temp_path)
+    os.replace(temp_path, path)
+    return StoredImage(path, url, True)
+
+
+def known_variants(url):
+    """Derivatives already recorded for `url` by another ProductImage, if any"""
+    return db.session.query(models.ProductImage.variants)\
+        .filter(models.ProductImage.image_url == url, models.ProductImage.variants.isnot(None))\
+        .limit(1).scalar()
+
+
+def reference_count(url):
+    """Number of rows still pointing at `url`"""
+    images = db.session.query(models.ProductImage.id).filter_by(image_url=url).count()
+    products = db.session.query(models.Product.id).filter_by(image_url=url).count()
+    return images + products
+
+
+def _remember_orphan(url):
+    if models.ImageOrphan.query.filter_by(image_url=url).first():
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(models.ImageOrphan(image_url=url))
+    except IntegrityError:
+        pass  # Recorded by a concurrent collection
+
+
+def _forget_orphan(url):
+    models.ImageOrphan.query.filter_by(image_url=url).delete(synchronize_session=False)
+
+
+def collect_garbage(urls, upload_folder):
+    """
+    Delete the stored files behind `urls` that are no longer referenced.
+
+    Call after the transaction that dropped the references has committed.
+    Unreferenced files that cannot go yet are recorded for a later run.
+    Returns the number of files removed.
+    """
+    removed = 0
+    for url in set(u for u in urls if u and u.startswith(UPLOAD_URL + '/')):
+        if reference_count(url):
+            _forget_orphan(url)
+            continue
+        path = os.path.join(upload_folder, url.rsplit('/', 1)[1])
+        try:
+            if time.time() - os.path.getmtime(path) < GC_GRACE_SECONDS:
+                _remember_orphan(url)
+                continue
+        except OSError:
+            pass  # Already gone; still clean up derivatives and jobs below
+
+        # Queued work for the file would only fail now; deleted before the
+        # check below, so no job can be claimed in between
+        jobs = models.ImageJob.query.filter(models.ImageJob.image_url == url)
+        jobs.filter(models.ImageJob.status.in_(['pending', 'failed'])).delete(synchronize_session=False)
+        db.session.commit()
+        # A job already running still writes the file and its derivatives
+        if jobs.filter(models.ImageJob.status == 'processing').first():
+            _remember_orphan(url)
+            continue
+
+        for victim in [path] + image_variants.existing_variant_files(path):
+            try:
+                os.remove(victim)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[WARNING] Could not remove {victim}: {e}")
+        _forget_orphan(url)
+        removed += 1
+    db.session.commit()
+    return removed
+
+
+def collect_deferred(upload_folder):
+    """Retry the files earlier collections had to leave"""
+    urls = [url for url, in db.session.query(models.ImageOrphan.image_url)]
+    return collect_garbage(urls, upload_folder) if urls else 0
+
+
+def maybe_collect_deferred(upload_folder):
+    """collect_deferred(), at most once per DEFERRED_INTERVAL in this process; never raises"""
+    global _last_deferred
+    now = time.monotonic()
+    if now - _last_deferred < DEFERRED_INTERVAL or not _deferred_lock.acquire(blocking=False):
+        return
+    try:
+        _last_deferred = now
+        removed = collect_deferred(upload_folder)
+        if removed:
+            print(f"[OK] Removed {removed} unreferenced product images")
+    except Exception as e:
+        db.session.rollback()
+        print(f"[WARNING] Deferred image garbage collection failed: {e}")
+    finally:
+        _deferred_lock.release()
+
+
+def sweep(upload_folder):
+    """Collect every unreferenced image in `upload_folder` (e.g. left by older versions)"""
+    try:
+        names = [name for name in os.listdir(upload_folder)
+                 if os.path.isfile(os.path.join(upload_folder, name)) and not name.endswith('.tmp')]
+    except FileNotFoundError:
+        names = []
+    orphans = [url for url, in db.session.query(models.ImageOrphan.image_url)]
+    return collect_garbage([f"{UPLOAD_URL}/{name}" for name in names] + orphans, upload_folder)
+
+
+def ensure_image_url_index():
+    """Index product_images.image_url (reference counting) on databases created before it existed"""
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_product_images_image_url '
+                              'ON product_images (image_url)'))
+            conn.commit()
+    except Exception as e:
+        print(f"[WARNING] Could not create product_images.image_url index: {e}")
@@ -0,0 +1,157 @@
+"""
+Responsive derivatives of product images
+
+After upload, the image pipeline renders each product image at a few
+widths in modern formats next to the original:
+
+    static/public/produk_images/variants/<name>-400.webp
+
+The widths and formats actually produced are recorded as JSON in
+ProductImage.variants, and the storefront templates turn that into
+<picture>/srcset markup so a grid card downloads a small thumbnail
+instead of the full-size upload.
+
+    IMAGE_VARIANT_WIDTHS=160,400,1024
+    IMAGE_VARIANT_FORMATS=avif,webp,jpeg   formats Pillow cannot encode are skipped
+"""
+import glob
+import json
+import os
+
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from database import db
+
+WIDTHS = tuple(sorted(int(w) for w in os.environ.get('IMAGE_VARIANT_WIDTHS', '160,400,1024').split(',') if w.strip()))
+FORMATS = tuple(f.strip().lower() for f in os.environ.get('IMAGE_VARIANT_FORMATS', 'avif,webp,jpeg').split(',') if f.strip())
+VARIANT_DIR = 'variants'
+
+# Pillow format name, file extension and encoder options per format
+_ENCODERS = {
+    'avif': ('AVIF', 'avif', {'quality': 60}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_supported = None
+
+
+def supported_formats():
+    """Configured formats this Pillow build can write"""
+    global _supported
+    if _supported is None:
+        from PIL import features
+        checks = {'avif': lambda: features.check_module('avif'), 'webp': lambda: features.check_module('webp')}
+        _supported = tuple(f for f in FORMATS if f in _ENCODERS and checks.get(f, lambda: True)())
+    return _supported
+
+
+def _variant_name(name, width, fmt):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f"{stem}-{width}.{_ENCODERS[fmt][1]}"
+
+
+def variant_url(image_url, width, fmt):
+    """Public URL of one derivative of `image_url`"""
+    base = image_url.rsplit('/', 1)[0]
+    return f"{base}/{VARIANT_DIR}/{_variant_name(image_url, width, fmt)}"
+
+
+def variant_path(image_path, width, fmt):
+    """Path on disk of one derivative of `image_path`"""
+    return os.path.join(os.path.dirname(image_path), VARIANT_DIR, _variant_name(image_path, width, fmt))
+
+
+def parse(raw):
+    """Decode a ProductImage.variants value; {} when missing or invalid"""
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return {}
+
+
+def srcset(image_url, variants, fmt):
+    """`srcset` attribute value for `fmt`, or '' if no derivatives exist"""
+    widths = variants.get('formats', {}).get(fmt) or []
+    candidates = [f"{variant_url(image_url, w, fmt)} {w}w" for w in widths]
+    if candidates and fmt == 'jpeg' and variants.get('width'):
+        # The original is the largest candidate for browsers without AVIF/WebP
+        candidates.append(f"{image_url} {variants['width']}w")
+    return ', '.join(candidates)
+
+
+def image_size(image_path):
+    """(width, height) of the file as displayed (EXIF orientation applied)"""
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        width, height = img.size
+        # Orientations 5-8 are rotated by 90 degrees
+        if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            width, height = height, width
+    return width, height
+
+
+def with_size(variants, image_path):
+    """`variants` with the width/height of the file now at `image_path`"""
+    width, height = image_size(image_path)
+    return dict(variants, width=width, height=height)
+
+
+def generate_variants(image_path):
+    """
+    Render the configured widths/formats of `image_path`.
+
+    Only widths smaller than the original are produced. Returns the dict
+    stored in ProductImage.variants: {'width': w, 'height': h, 'formats': {fmt: [widths]}}.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(image_path) as img:
+        if getattr(img, 'is_animated', False):
+            return {'width': img.width, 'height': img.height, 'formats': {}}
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+        width, height = img.size
+
+        os.makedirs(os.path.join(os.path.dirname(image_path), VARIANT_DIR), exist_ok=True)
+        produced = {}
+        for target in WIDTHS:
+            if target >= width:
+                break
+            resized = img.resize((target, max(1, round(height * target / width))), Image.Resampling.LANCZOS)
+            for fmt in supported_formats():
+                if fmt == 'jpeg' and has_alpha:
+                    continue  # JPEG would lose transparency, the original stays the fallback
+                pil_format, _, options = _ENCODERS[fmt]
+                path = variant_path(image_path, target, fmt)
+                temp_path = f"{path}.tmp"
+                resized.save(temp_path, pil_format, **options)
+                os.replace(temp_path, path)
+                produced.setdefault(fmt, []).append(target)
+
+    return {'width': width, 'height': height, 'formats': produced}
+
+
+def existing_variant_files(image_path):
+    """Derivatives of `image_path` present on disk, whatever was recorded"""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    pattern = os.path.join(os.path.dirname(image_path), VARIANT_DIR, f"{glob.escape(stem)}-*")
+    return [path for path in glob.glob(pattern) if not path.endswith('.tmp')]
+
+
+def ensure_variants_column():
+    """Add product_images.variants to databases created before it existed"""
+    try:
+        columns = [col['name'] for col in sa.inspect(db.engine).get_columns('product_images')]
+        if 'variants' not in columns:
+            with db.engine.connect() as conn:
+                conn.execute(text('ALTER TABLE product_images ADD COLUMN variants TEXT'))
+                conn.commit()
+            print("[OK] Added product_images.variants column")
+    except Exception as e:
+        print(f"[WARNING] Could not add product_images.variants column: {e}")
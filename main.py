@@ -1,30 +1,23 @@
 import os
-import requests
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session, send_file
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session, send_file, abort, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_migrate import Migrate
 from flask_wtf import FlaskForm
 from flask_wtf.csrf import CSRFProtect
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from PIL import Image
-import stripe
 from datetime import datetime, timedelta
 from database import db
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload, selectinload
+from pagination_utils import PRODUCT_SORTS, clamp_page_size, paginate_keyset
+import time
 import uuid
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.graphics.shapes import Drawing
-from reportlab.graphics.barcode import code128
-from reportlab.graphics import renderPDF
+from urllib.parse import quote as url_quote
 import io
 import random
 import string
-import midtransclient
 import json
-import jwt
 import sys # Import sys to check command line arguments
 
 # Create the Flask app
@@ -59,12 +52,28 @@ if not configure_database(app):
 migrate = Migrate(app, db)
 csrf = CSRFProtect(app)
 
+# Opt-in SQL profiling (DB_PROFILING=1), see db_profiler.py and /admin/perf
+from db_profiler import profiler as db_profiler
+db_profiler.init_app(app)
+
+# Fingerprinted, pre-compressed static files when a manifest was built (static_assets.py)
+import static_assets
+static_assets.assets.init_app(app)
+
+from cache_utils import CachedValue, detached_copy
+
 # Context processor to make store profile available in all templates
+def _load_store_profile():
+    return detached_copy(models.StoreProfile.get_active_profile())
+
+# The active profile changes rarely; admin_update_store_profile() invalidates it
+store_profile_cache = CachedValue('store_profile', _load_store_profile)
+
 @app.context_processor
 def inject_store_profile():
     """Make store profile available to all templates"""
     try:
-        profile = models.StoreProfile.get_active_profile()
+        profile = store_profile_cache.get()
         return dict(store_profile=profile)
     except Exception as e:
         print(f"[ERROR] Failed to inject store profile: {e}")
@@ -80,8 +89,10 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_image_orientation(image_path):
-    """Determine if image is landscape or portrait"""
+    """Determine if image is landscape or portrait (path or file object, header only)"""
+    from PIL import Image
     try:
+        # Image.open only parses the header, the pixels are not decoded here
         img = Image.open(image_path)
         width, height = img.size
         if width > height:
@@ -94,75 +105,119 @@ def get_image_orientation(image_path):
         print(f"[ERROR] Could not determine orientation for {image_path}: {e}")
         return 'unknown'
 
+# Quality range searched for lossy formats; the old stepped loop went 85 -> 15
+COMPRESS_MAX_QUALITY = 85
+COMPRESS_MIN_QUALITY = 15
+# Stop searching once an encode lands within 10% below the size limit
+COMPRESS_SIZE_SLACK = 0.1
+# Lossless images are downscaled, but never below this many pixels on the long side
+COMPRESS_MIN_DIMENSION = 800
+
+def _encode_image(img, save_format, **save_kwargs):
+    """Encode `img` in memory and return the bytes"""
+    buffer = io.BytesIO()
+    img.save(buffer, save_format, **save_kwargs)
+    return buffer.getvalue()
+
+def _search_quality(img, save_format, max_bytes, max_quality_size):
+    """
+    Highest-quality encode of `img` that fits in max_bytes, searched in memory.
+
+    Narrows a [too small, too big] quality bracket like a binary search, but
+    places each probe by interpolating the encoded sizes at the bracket ends
+    (size grows monotonically with quality), and stops once an encode lands
+    within COMPRESS_SIZE_SLACK of the limit. Falls back to the minimum
+    quality if nothing fits.
+    """
+    lo, lo_size = COMPRESS_MIN_QUALITY - 1, None
+    hi, hi_size = COMPRESS_MAX_QUALITY, max_quality_size
+    best = None
+    while hi - lo > 1:
+        if lo_size is None:
+            # No lower size known yet: assume size roughly proportional to quality
+            fraction = max_bytes / hi_size
+        else:
+            fraction = (max_bytes - lo_size) / (hi_size - lo_size)
+        quality = min(hi - 1, max(lo + 1, lo + round((hi - lo) * fraction)))
+        data = _encode_image(img, save_format, optimize=True, quality=quality)
+        if len(data) <= max_bytes:
+            best, lo, lo_size = data, quality, len(data)
+            if len(data) >= max_bytes * (1 - COMPRESS_SIZE_SLACK):
+                break
+        else:
+            hi, hi_size = quality, len(data)
+    if best is None:
+        # Nothing fits; keep the smallest encode like the old loop did
+        best = data if hi == COMPRESS_MIN_QUALITY else \
+            _encode_image(img, save_format, optimize=True, quality=COMPRESS_MIN_QUALITY)
+    return best
+
 def compress_image(image_path, max_size_mb=1):
     """Compress image to be under max_size_mb while preserving original format"""
-    img = Image.open(image_path)
-    original_format = img.format
+    from PIL import Image
 
-    # Check if file is already under size limit
-    file_size_mb = os.path.getsize(image_path) / (1024 * 1024)
-    if file_size_mb <= max_size_mb:
+    # Check if file is already under size limit (before opening it at all)
+    original_size = os.path.getsize(image_path)
+    max_bytes = max_size_mb * 1024 * 1024
+    if original_size <= max_bytes:
         return  # No compression needed
 
+    img = Image.open(image_path)
+    original_format = img.format
+
     # Don't compress animated GIFs - they lose animation
     if original_format == 'GIF' and getattr(img, 'is_animated', False):
         return  # Keep animated GIFs as-is
 
-    # Set format-specific parameters
-    save_kwargs = {'optimize': True}
-    quality = 85
-
-    if original_format in ('JPEG', 'JPG'):
-        save_format = 'JPEG'
-        save_kwargs['quality'] = quality
-    elif original_format == 'PNG':
-        save_format = 'PNG'
-        # PNG doesn't use quality, but we can optimize
-        save_kwargs['optimize'] = True
-    elif original_format == 'WEBP':
-        save_format = 'WEBP'
-        save_kwargs['quality'] = quality
-    else:
-        # For other formats, convert to PNG to preserve quality
-        save_format = 'PNG'
-        save_kwargs['optimize'] = True
-
-    # Try compression with decreasing quality for lossy formats
-    max_iterations = 10
-    iteration = 0
-
-    while iteration < max_iterations:
-        iteration += 1
-
-        if save_format in ('JPEG', 'WEBP'):
-            save_kwargs['quality'] = quality
+    if original_format in ('JPEG', 'JPG', 'WEBP'):
+        save_format = 'WEBP' if original_format == 'WEBP' else 'JPEG'
 
-        img.save(image_path, save_format, **save_kwargs)
-
-        # Check file size
-        file_size_mb = os.path.getsize(image_path) / (1024 * 1024)
-
-        if file_size_mb <= max_size_mb:
-            break
+        # Best case: the highest quality already fits
+        data = _encode_image(img, save_format, optimize=True, quality=COMPRESS_MAX_QUALITY)
+        if len(data) > max_bytes:
+            data = _search_quality(img, save_format, max_bytes, len(data))
+    else:
+        # PNG and other formats stay lossless (as PNG); shrink the dimensions instead,
+        # estimating the scale from the size ratio rather than stepping by 80%
+        data = _encode_image(img, 'PNG', optimize=True)
+        while len(data) > max_bytes and max(img.size) > COMPRESS_MIN_DIMENSION:
+            scale = min(0.9, (max_bytes / len(data)) ** 0.5 * 0.95)
+            scale = max(scale, COMPRESS_MIN_DIMENSION / max(img.size))
+            img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))),
+                             Image.Resampling.LANCZOS)
+            data = _encode_image(img, 'PNG', optimize=True)
+
+    if len(data) >= original_size:
+        return  # Re-encoding did not help, keep the upload as-is
+
+    # Single write to a temporary file swapped in atomically, the original may be served meanwhile
+    temp_path = f"{image_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, image_path)
+    return image_path
 
-        # For lossy formats, try reducing quality
-        if save_format in ('JPEG', 'WEBP'):
-            if quality <= 20:
-                break
-            quality -= 10
-        else:
-            # For lossless formats (PNG), try downscaling dimensions
-            current_width, current_height = img.size
-            if current_width > 800 or current_height > 800:
-                # Reduce by 80% each iteration
-                new_width = int(current_width * 0.8)
-                new_height = int(current_height * 0.8)
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            else:
-                # Can't compress further, break to avoid infinite loop
-                break
+# Uploaded images are compressed by a background thread pool (image_pipeline.py)
+from image_pipeline import pipeline as image_pipeline
+import image_store
+import image_variants
+image_pipeline.init_app(app)
 
-    return image_path
+@image_pipeline.handler('compress')
+def _compress_image_job(job):
+    if not compress_image(job.image_path) or not job.image_url:
+        return
+    # A downscaled PNG changes size; srcset must describe the file as written
+    for product_image in models.ProductImage.query.filter(models.ProductImage.image_url == job.image_url,
+                                                          models.ProductImage.variants.isnot(None)):
+        product_image.variants = json.dumps(image_variants.with_size(
+            image_variants.parse(product_image.variants), job.image_path))
+
+@image_pipeline.handler('variants')
+def _image_variants_job(job):
+    variants = image_variants.generate_variants(job.image_path)
+    models.ProductImage.query.filter_by(image_url=job.image_url)\
+        .update({'variants': json.dumps(variants)}, synchronize_session=False)
 
 # Login Manager setup
 login_manager = LoginManager()
@@ -213,6 +268,7 @@ JWT_ACCESS_TOKEN_LIFETIME = 86400  # 24 hours
 
 def generate_jwt_token(user):
     """Generate JWT token for chat service authentication"""
+    import jwt
     payload = {
         'user_id': user.id,
         'email': user.email,
@@ -225,6 +281,17 @@ def generate_jwt_token(user):
 
 # Import models before routes
 import models
+import product_search
+import product_suggest
+import query_loaders
+import reference_cache
+import stock_reservations
+import checkout_orders
+import shipping_quotes
+import shipping_zones
+import chat_proxy
+from cart_service import cart as cart_service
+cart_service.init_app(app)
 
 def setup_django_chat_service():
     """Setup Django chat service and run migrations"""
@@ -384,13 +451,8 @@ def start_django_service():
         return False
 
 def check_django_service():
-    """Check if Django chat service is running"""
-    try:
-        import requests
-        response = requests.get('http://127.0.0.1:8000/health/', timeout=2)
-        return response.status_code == 200
-    except:
-        return False
+    """Check if Django chat service is running (probes /health/ unless a call just succeeded)"""
+    return chat_proxy.service_available()
 
 def create_sample_data():
     """Create sample data for testing"""
@@ -519,6 +581,7 @@ def initialize_database():
         # Ensure all Flask tables are created with current schema
         db.create_all()
         print("[OK] Flask database tables created")
+        product_search.ensure_search_index()
 
         # Setup Django chat service
         if setup_django_chat_service():
@@ -589,81 +652,156 @@ def initialize_database():
     except Exception as e:
         print(f"[ERROR] Database initialization error: {e}")
 
-# Create database tables and setup everything
-with app.app_context():
-    # Initialize only Flask database for now, skip Django chat service during startup
-    try:
-        # Rollback any existing failed transaction first
-        db.session.rollback()
+def bootstrap_database():
+    """Create tables, search index, default admin/store profile and sample data"""
+    with app.app_context():
+        # Initialize only Flask database for now, skip Django chat service during startup
+        try:
+            # Rollback any existing failed transaction first
+            db.session.rollback()
         
-        # Ensure all Flask tables are created with current schema
-        db.create_all()
-        print("[OK] Flask database tables created")
+            # Ensure all Flask tables are created with current schema
+            db.create_all()
+            print("[OK] Flask database tables created")
 
-        # Create default admin user if it doesn't exist
-        admin_email = "admin@hurtrock.com"
+            # Full-text search index (tsvector/pg_trgm or SQLite FTS5)
+            product_search.ensure_search_index()
+            image_variants.ensure_variants_column()
+            image_store.ensure_image_url_index()
+            checkout_orders.ensure_payment_reference_column()
 
-        # Check if admin user exists safely
-        try:
-            db.session.rollback()  # Clear any pending transaction
-            admin_user = models.User.query.filter_by(email=admin_email).first()
-        except Exception as e:
-            print(f"Database schema issue detected: {e}")
-            db.session.rollback()
-            admin_user = None
+            # Create default admin user if it doesn't exist
+            admin_email = "admin@hurtrock.com"
 
-        if not admin_user:
+            # Check if admin user exists safely
             try:
-                admin_user = models.User(
-                    email=admin_email,
-                    password_hash=generate_password_hash("admin123"),
-                    name="Administrator",
-                    role="admin"
-                )
-                db.session.add(admin_user)
-                db.session.commit()
-                print(f"[OK] Default admin user created: {admin_email}")
+                db.session.rollback()  # Clear any pending transaction
+                admin_user = models.User.query.filter_by(email=admin_email).first()
             except Exception as e:
-                print(f"[ERROR] Failed to create admin user: {e}")
+                print(f"Database schema issue detected: {e}")
                 db.session.rollback()
-        else:
-            print(f"[OK] Admin user already exists: {admin_email}")
+                admin_user = None
 
-        # Create default store profile if it doesn't exist
-        try:
-            db.session.rollback()  # Clear any pending transaction
-            store_profile = models.StoreProfile.get_active_profile()
-            if not store_profile:
-                store_profile = models.StoreProfile(
-                    store_name='Hurtrock Music Store',
-                    store_tagline='Toko Alat Musik Terpercaya',
-                    store_address='Jl. Musik Raya No. 123, RT/RW 001/002, Kelurahan Musik, Kecamatan Harmoni',
-                    store_city='Jakarta Selatan',
-                    store_postal_code='12345',
-                    store_phone='0821-1555-8035',
-                    store_email='info@hurtrock.com',
-                    store_website='https://hurtrock.com',
-                    whatsapp_number='6282115558035',
-                    operating_hours='Senin - Sabtu: 09:00 - 21:00\nMinggu: 10:00 - 18:00',
-                    branch_name='Cabang Pusat',
-                    branch_code='HRT-001'
-                )
-                db.session.add(store_profile)
-                db.session.commit()
-                print("[OK] Default store profile created")
+            if not admin_user:
+                try:
+                    admin_user = models.User(
+                        email=admin_email,
+                        password_hash=generate_password_hash("admin123"),
+                        name="Administrator",
+                        role="admin"
+                    )
+                    db.session.add(admin_user)
+                    db.session.commit()
+                    print(f"[OK] Default admin user created: {admin_email}")
+                except Exception as e:
+                    print(f"[ERROR] Failed to create admin user: {e}")
+                    db.session.rollback()
             else:
-                print("[OK] Store profile already exists")
+                print(f"[OK] Admin user already exists: {admin_email}")
+
+            # Create default store profile if it doesn't exist
+            try:
+                db.session.rollback()  # Clear any pending transaction
+                store_profile = models.StoreProfile.get_active_profile()
+                if not store_profile:
+                    store_profile = models.StoreProfile(
+                        store_name='Hurtrock Music Store',
+                        store_tagline='Toko Alat Musik Terpercaya',
+                        store_address='Jl. Musik Raya No. 123, RT/RW 001/002, Kelurahan Musik, Kecamatan Harmoni',
+                        store_city='Jakarta Selatan',
+                        store_postal_code='12345',
+                        store_phone='0821-1555-8035',
+                        store_email='info@hurtrock.com',
+                        store_website='https://hurtrock.com',
+                        whatsapp_number='6282115558035',
+                        operating_hours='Senin - Sabtu: 09:00 - 21:00\nMinggu: 10:00 - 18:00',
+                        branch_name='Cabang Pusat',
+                        branch_code='HRT-001'
+                    )
+                    db.session.add(store_profile)
+                    db.session.commit()
+                    print("[OK] Default store profile created")
+                else:
+                    print("[OK] Store profile already exists")
+            except Exception as e:
+                print(f"[ERROR] Failed to create store profile: {e}")
+                db.session.rollback()
+
+            # Create sample data
+            create_sample_data()
+            print("[OK] Flask database initialization completed")
+
         except Exception as e:
-            print(f"[ERROR] Failed to create store profile: {e}")
+            print(f"[ERROR] Database initialization error: {e}")
             db.session.rollback()
 
-        # Create sample data
-        create_sample_data()
-        print("[OK] Flask database initialization completed")
 
-    except Exception as e:
-        print(f"[ERROR] Database initialization error: {e}")
-        db.session.rollback()
+def auto_init_enabled():
+    """AUTO_INIT_DB decides whether importing main.py bootstraps the database.
+
+    Defaults to on for local development and off when IS_PRODUCTION is set,
+    where `python main.py --init-db` (or `flask --app main init-db`) runs once
+    before the workers start.
+    """
+    default = 'false' if is_production else 'true'
+    return os.environ.get('AUTO_INIT_DB', default).lower() in ('1', 'true', 'yes')
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the database schema and default data"""
+    bootstrap_database()
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and pre-compress static assets (restart to serve them)"""
+    built = static_assets.build(app.static_folder)
+    print(f"[OK] Built {len(built['files'])} fingerprinted assets")
+
+@app.cli.command('release-reservations')
+def release_reservations_command():
+    """Return stock held by expired checkout reservations (run from cron)"""
+    released = stock_reservations.release_expired()
+    print(f"[OK] Released {released} expired stock reservations")
+
+@app.cli.command('gc-images')
+def gc_images_command():
+    """Delete product image files that no product refers to"""
+    removed = image_store.sweep(app.config['UPLOAD_FOLDER'])
+    print(f"[OK] Removed {removed} unreferenced product images")
+
+@app.cli.command('image-variants')
+def image_variants_command():
+    """Generate responsive derivatives for product images that have none"""
+    pending = models.ProductImage.query.filter(models.ProductImage.variants.is_(None)).all()
+    for product_image in pending:
+        image_path = product_image.image_url.lstrip('/')
+        if not os.path.exists(image_path):
+            print(f"[WARNING] Missing image file {image_path}")
+            continue
+        try:
+            product_image.variants = json.dumps(image_variants.generate_variants(image_path))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Could not generate variants for {image_path}: {e}")
+    print(f"[OK] Processed {len(pending)} product images")
+
+
+def create_app(init_db=None):
+    """
+    Entry point for WSGI servers (gunicorn: 'main:create_app()').
+
+    Routes are registered on the module-level `app`; this only runs the
+    deferred startup work. Pass init_db=True to bootstrap the database.
+    """
+    if init_db:
+        bootstrap_database()
+    return app
+
+
+if auto_init_enabled():
+    bootstrap_database()
 
 # Error handlers
 @app.errorhandler(404)
@@ -682,16 +820,16 @@ def internal_error(error):
 # Routes
 @app.route('/')
 def index():
-    products = models.Product.query.filter_by(is_active=True).limit(8).all()
-    categories = models.Category.query.filter_by(is_active=True).all()
+    products = models.Product.query.filter_by(is_active=True)\
+        .options(selectinload(models.Product.images)).limit(8).all()
+    categories = reference_cache.categories.get()
     return render_template('index.html', products=products, categories=categories)
 
-@app.route('/products')
-def products():
-    category_id = request.args.get('category')
-    search_query = request.args.get('search', '')
-
-    query = models.Product.query.filter_by(is_active=True)
+def _catalog_query(category_id=None, search_query=''):
+    """Base query for the storefront catalogue (active products only)"""
+    # Images are needed for the responsive <picture> markup of each card
+    query = models.Product.query.filter_by(is_active=True)\
+        .options(selectinload(models.Product.images))
 
     if category_id:
         query = query.filter_by(category_id=category_id)
@@ -699,12 +837,60 @@ def products():
     if search_query:
         query = query.filter(models.Product.name.contains(search_query))
 
-    products = query.all()
-    categories = models.Category.query.filter_by(is_active=True).all()
+    return query
+
+def _product_card(product):
+    """Compact product representation for listings and search results"""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': str(product.price),
+        'formatted_price': product.formatted_price,
+        'image_url': product.image_url or '/static/images/placeholder.jpg',
+        'brand': product.brand or '',
+        'description': product.description[:100] + '...' if product.description and len(product.description) > 100 else product.description or ''
+    }
 
-    return render_template('products.html', products=products, categories=categories,
-                         current_category=int(category_id) if category_id else None,
-                         search_query=search_query)
+@app.route('/products')
+def products():
+    category_id = request.args.get('category', type=int)
+    search_query = request.args.get('search', '')
+    sort = request.args.get('sort', 'newest')
+    if sort not in PRODUCT_SORTS:
+        sort = 'newest'
+
+    # Keyset pagination: only one page of products is ever loaded
+    page = paginate_keyset(_catalog_query(category_id, search_query), models.Product,
+                           sort=sort,
+                           cursor=request.args.get('cursor'),
+                           limit=clamp_page_size(request.args.get('limit')))
+    categories = reference_cache.categories.get()
+
+    return render_template('products.html', products=page.items, page=page, categories=categories,
+                         current_category=category_id,
+                         search_query=search_query,
+                         current_sort=sort)
+
+@app.route('/api/products')
+def api_list_products():
+    """JSON variant of the catalogue for infinite scrolling; ?ids=1,2,3 returns those products"""
+    if 'ids' in request.args:
+        return api_products_by_id(request.args['ids'])
+    sort = request.args.get('sort', 'newest')
+    page = paginate_keyset(_catalog_query(request.args.get('category', type=int),
+                                          request.args.get('search', '')),
+                           models.Product,
+                           sort=sort,
+                           cursor=request.args.get('cursor'),
+                           limit=clamp_page_size(request.args.get('limit')))
+    return jsonify({
+        'products': [_product_card(p) for p in page.items],
+        'sort': page.sort,
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'has_next': page.has_next,
+        'has_prev': page.has_prev
+    })
 
 @app.route('/product/<int:product_id>')
 def product_detail(product_id):
@@ -718,31 +904,30 @@ def search():
     query = request.args.get('q', '').strip()
     if query and len(query) >= 2:
         try:
-            # Case-insensitive search across multiple fields (using ILIKE for PostgreSQL performance)
-            search_term = f"%{query}%"
-            products = models.Product.query.filter(
-                db.or_(
-                    models.Product.name.ilike(search_term),
-                    models.Product.description.ilike(search_term),
-                    models.Product.brand.ilike(search_term),
-                    models.Product.model.ilike(search_term)
-                ),
-                models.Product.is_active == True
-            ).limit(10).all()  # Limit results for performance
-
-            return jsonify([{
-                'id': p.id,
-                'name': p.name,
-                'price': str(p.price),
-                'image_url': p.image_url or '/static/images/placeholder.jpg',
-                'brand': p.brand or '',
-                'description': p.description[:100] + '...' if p.description and len(p.description) > 100 else p.description or ''
-            } for p in products])
+            # Ranked full-text search with prefix matching (see product_search.py)
+            products = product_search.search_products(query, limit=10)
+            return jsonify([_product_card(p) for p in products])
         except Exception as e:
             print(f"Search error: {e}")
             return jsonify({'error': 'Search failed'}), 500
     return jsonify([])
 
+# Typeahead index, patched incrementally as products are committed
+suggest_index = product_suggest.SuggestIndex(_product_card)
+product_suggest.register_listeners(suggest_index)
+
+@app.route('/search/suggest')
+def search_suggest():
+    """Typeahead suggestions served from memory (same shape as /search)"""
+    query = request.args.get('q', '').strip()
+    if query and len(query) >= 2:
+        try:
+            return jsonify(suggest_index.suggest(query))
+        except Exception as e:
+            print(f"Suggest error: {e}")
+            return jsonify({'error': 'Search failed'}), 500
+    return jsonify([])
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -795,9 +980,8 @@ def logout():
 @app.route('/cart')
 @login_required
 def cart():
-    cart_items = models.CartItem.query.filter_by(user_id=current_user.id).all()
-    total = sum(item.quantity * item.product.price for item in cart_items)
-    return render_template('cart.html', cart_items=cart_items, total=total)
+    cart_view = cart_service.get_cart(current_user.id)
+    return render_template('cart.html', cart_items=cart_view.lines, total=cart_view.subtotal)
 
 @app.route('/add_to_cart/<int:product_id>', methods=['POST'])
 @login_required
@@ -805,55 +989,26 @@ def add_to_cart(product_id):
     product = models.Product.query.get_or_404(product_id)
     quantity = int(request.form.get('quantity', 1))
 
-    # Check if item already in cart
-    cart_item = models.CartItem.query.filter_by(
-        user_id=current_user.id,
-        product_id=product_id
-    ).first()
-
-    if cart_item:
-        cart_item.quantity += quantity
-    else:
-        cart_item = models.CartItem(
-            user_id=current_user.id,
-            product_id=product_id,
-            quantity=quantity
-        )
-        db.session.add(cart_item)
-
-    db.session.commit()
+    cart_service.add(current_user.id, product, quantity)
     flash(f'{product.name} ditambahkan ke keranjang!', 'success')
 
     return redirect(url_for('product_detail', product_id=product_id))
 
-@app.route('/update_cart/<int:item_id>', methods=['POST'])
+@app.route('/update_cart/<int:product_id>', methods=['POST'])
 @login_required
-def update_cart(item_id):
-    cart_item = models.CartItem.query.filter_by(
-        id=item_id,
-        user_id=current_user.id
-    ).first_or_404()
-
+def update_cart(product_id):
     quantity = int(request.form.get('quantity', 1))
 
-    if quantity > 0:
-        cart_item.quantity = quantity
-    else:
-        db.session.delete(cart_item)
+    if not cart_service.set_quantity(current_user.id, product_id, quantity):
+        abort(404)
 
-    db.session.commit()
     return redirect(url_for('cart'))
 
-@app.route('/remove_from_cart/<int:item_id>')
+@app.route('/remove_from_cart/<int:product_id>')
 @login_required
-def remove_from_cart(item_id):
-    cart_item = models.CartItem.query.filter_by(
-        id=item_id,
-        user_id=current_user.id
-    ).first_or_404()
-
-    db.session.delete(cart_item)
-    db.session.commit()
+def remove_from_cart(product_id):
+    if not cart_service.remove(current_user.id, product_id):
+        abort(404)
     flash('Item dihapus dari keranjang.', 'info')
 
     return redirect(url_for('cart'))
@@ -885,33 +1040,22 @@ def checkout():
         flash('Silakan lengkapi profile Anda terlebih dahulu sebelum melakukan pembelian.', 'warning')
         return redirect(url_for('profile', next=url_for('checkout')))
 
-    cart_items = models.CartItem.query.filter_by(user_id=current_user.id).all()
+    cart_view = cart_service.get_cart(current_user.id)
 
-    if not cart_items:
+    if not cart_view.lines:
         flash('Keranjang kosong!', 'error')
         return redirect(url_for('cart'))
 
-    subtotal = sum(item.quantity * item.product.price for item in cart_items)
+    # Expired holds go back on sale before stock is shown/reserved again
+    stock_reservations.maybe_release_expired()
 
-    # Calculate shipping weight and volume
-    total_weight = sum(item.quantity * (item.product.weight or 0) for item in cart_items)
-    total_volume = sum(item.quantity * (item.product.volume_cm3 or 0) for item in cart_items)
+    cart_items = cart_view.lines
 
-    # Get available shipping services
-    shipping_services = models.ShippingService.query.filter_by(is_active=True).all()
-
-    # Calculate shipping costs for each service
-    shipping_options = []
-    for service in shipping_services:
-        cost = service.calculate_shipping_cost(total_weight, total_volume)
-        shipping_options.append({
-            'service': service,
-            'cost': cost,
-            'delivery_estimate': f"{service.min_days}-{service.max_days} hari"
-        })
+    # Totals and every active service's cost in one pass; the POST reuses this quote
+    quote = shipping_quotes.quote(cart_items, _shipping_distance_km(current_user))
 
     # Get active payment configurations
-    payment_configs = models.PaymentConfiguration.query.filter_by(is_active=True).all()
+    payment_configs = reference_cache.payment_configs.get()
 
     # If no active payment config, show error
     if not payment_configs:
@@ -920,17 +1064,31 @@ def checkout():
 
     return render_template('checkout.html',
                          cart_items=cart_items,
-                         subtotal=subtotal,
-                         total=subtotal,  # Add total variable (will be updated by JS when shipping is selected)
-                         total_weight=total_weight,
-                         total_volume=total_volume,
-                         shipping_options=shipping_options,
+                         subtotal=quote.subtotal,
+                         total=quote.subtotal,  # Add total variable (will be updated by JS when shipping is selected)
+                         total_weight=quote.total_weight,
+                         total_volume=quote.total_volume,
+                         shipping_options=quote.options(),
                          payment_configs=payment_configs)
 
+def _shipping_distance_km(user):
+    """Store-to-buyer distance used for shipping quotes (local zone table)"""
+    store = store_profile_cache.get()
+    return shipping_zones.distance_km(
+        user.address,
+        store.store_postal_code if store else None,
+        store.store_city if store else None
+    )
+
 @app.route('/create-checkout-session', methods=['POST'])
 @login_required
 def create_checkout_session():
-    cart_items = models.CartItem.query.filter_by(user_id=current_user.id).all()
+    # Stock is reserved against cart_items rows, so pending cart changes are written first
+    cart_service.flush(current_user.id)
+    cart_items = (models.CartItem.query
+                  .options(joinedload(models.CartItem.product))
+                  .filter_by(user_id=current_user.id)
+                  .all())
 
     if not cart_items:
         return jsonify({'error': 'Keranjang kosong'}), 400
@@ -953,20 +1111,32 @@ def create_checkout_session():
         flash('Silakan pilih jasa kirim!', 'error')
         return redirect(url_for('checkout'))
 
-    shipping_service = models.ShippingService.query.get_or_404(int(shipping_service_id))
+    # Same quote the checkout page showed, unless the cart or services changed since
+    quote = shipping_quotes.quote(cart_items, _shipping_distance_km(current_user))
+    shipping_service = quote.service(int(shipping_service_id))
+    if shipping_service is None:
+        flash('Jasa kirim yang dipilih tidak tersedia!', 'error')
+        return redirect(url_for('checkout'))
 
-    # Calculate costs
-    subtotal = sum(item.quantity * item.product.price for item in cart_items)
-    total_weight = sum(item.quantity * (item.product.weight or 0) for item in cart_items)
-    total_volume = sum(item.quantity * (item.product.volume_cm3 or 0) for item in cart_items)
-    shipping_cost = shipping_service.calculate_shipping_cost(total_weight, total_volume)
-    total_amount = float(subtotal) + float(shipping_cost)
+    shipping_cost = quote.cost(shipping_service.id)
+    total_amount = float(quote.subtotal) + float(shipping_cost)
 
     # Store order info in session
     session['shipping_service_id'] = shipping_service_id
     session['shipping_cost'] = float(shipping_cost)
     session['payment_config_id'] = payment_config_id
 
+    # Hold the stock until the payment completes (or the hold expires); an
+    # earlier abandoned attempt by this buyer is given back first
+    stock_reservations.maybe_release_expired()
+    stock_reservations.release_for_user(current_user.id)
+    try:
+        stock_reservations.reserve(current_user.id, cart_items,
+                                   minutes=stock_reservations.payment_window_minutes(payment_config.provider))
+    except stock_reservations.InsufficientStock as e:
+        flash(f'Stok {e.product_name} tidak mencukupi untuk {e.requested} unit. Silakan ubah jumlah pesanan.', 'error')
+        return redirect(url_for('cart'))
+
     try:
         YOUR_DOMAIN = os.environ.get('DOMAINS', 'localhost:5000')
 
@@ -975,15 +1145,19 @@ def create_checkout_session():
         elif payment_config.provider == 'midtrans':
             return _create_midtrans_checkout(cart_items, shipping_service, shipping_cost, total_amount, YOUR_DOMAIN, payment_config)
         else:
+            stock_reservations.release_for_user(current_user.id)
             flash('Metode pembayaran tidak didukung!', 'error')
             return redirect(url_for('checkout'))
 
     except Exception as e:
+        db.session.rollback()
+        stock_reservations.release_for_user(current_user.id)
         flash(f'Error dalam memproses pembayaran: {str(e)}', 'error')
         return redirect(url_for('cart'))
 
 def _create_stripe_checkout(cart_items, shipping_service, shipping_cost, total_amount, domain, payment_config):
     """Create Stripe checkout session"""
+    import stripe
 
     # Set Stripe API key from config with fallback
     api_key = payment_config.stripe_secret_key or os.environ.get('STRIPE_SECRET_KEY')
@@ -1022,14 +1196,19 @@ def _create_stripe_checkout(cart_items, shipping_service, shipping_cost, total_a
         line_items=line_items,
         mode='payment',
         success_url=f'https://{domain}/payment-success',
-        cancel_url=f'https://{domain}/cart',
+        cancel_url=f'https://{domain}/payment/unfinish',
         customer_email=current_user.email,
+        # The payment page closes before the stock hold runs out
+        expires_at=int(time.time()) + stock_reservations.payment_window_minutes('stripe') * 60,
     )
+    stock_reservations.attach(current_user.id, checkout_session.id)
+    session[checkout_orders.SESSION_KEY] = checkout_orders.payment_reference('stripe', checkout_session.id)
 
     return redirect(checkout_session.url, code=303)
 
 def _create_midtrans_checkout(cart_items, shipping_service, shipping_cost, total_amount, domain, payment_config):
     """Create Midtrans checkout session"""
+    import midtransclient
     import uuid
 
     # Create Snap API instance
@@ -1091,6 +1270,8 @@ def _create_midtrans_checkout(cart_items, shipping_service, shipping_cost, total
         'transaction_details': transaction_details,
         'item_details': item_details,
         'customer_details': customer_details,
+        # The payment page closes when the stock hold runs out
+        'expiry': {'unit': 'minute', 'duration': stock_reservations.payment_window_minutes('midtrans')},
         'callbacks': {
             'finish': payment_config.callback_finish_url or f'https://{domain}/payment/finish',
             'unfinish': payment_config.callback_unfinish_url or f'https://{domain}/payment/unfinish',
@@ -1103,6 +1284,8 @@ def _create_midtrans_checkout(cart_items, shipping_service, shipping_cost, total
 
     # Store order ID in session for callback handling
     session['midtrans_order_id'] = order_id
+    session[checkout_orders.SESSION_KEY] = checkout_orders.payment_reference('midtrans', order_id)
+    stock_reservations.attach(current_user.id, order_id)
 
     # Redirect to Snap payment page
     return redirect(transaction['redirect_url'], code=303)
@@ -1110,68 +1293,50 @@ def _create_midtrans_checkout(cart_items, shipping_service, shipping_cost, total
 @app.route('/payment-success')
 @login_required
 def payment_success():
-    # Create order from cart items
-    cart_items = models.CartItem.query.filter_by(user_id=current_user.id).all()
-
-    if cart_items:
-        subtotal = sum(item.quantity * item.product.price for item in cart_items)
-
-        # Get shipping info from session
-        shipping_service_id = session.get('shipping_service_id')
-        shipping_cost = session.get('shipping_cost', 0)
-
-        total_amount = float(subtotal) + float(shipping_cost)
-
-        # Calculate estimated delivery days
-        estimated_delivery_days = 0
-        if shipping_service_id:
-            shipping_service = models.ShippingService.query.get(int(shipping_service_id))
-            if shipping_service:
-                estimated_delivery_days = shipping_service.max_days
-
-        order = models.Order(
-            user_id=current_user.id,
-            total_amount=total_amount,
-            shipping_cost=shipping_cost,
-            shipping_service_id=int(shipping_service_id) if shipping_service_id else None,
-            estimated_delivery_days=estimated_delivery_days,
-            shipping_address=current_user.address,
-            status='paid',
-            created_at=datetime.utcnow()
+    # The payment this visit belongs to; a refresh or repeated redirect reuses its order
+    reference = session.get(checkout_orders.SESSION_KEY)
+    if reference:
+        cart_service.flush(current_user.id)
+        order, created = checkout_orders.create_paid_order(
+            current_user,
+            reference,
+            shipping_service_id=session.get('shipping_service_id'),
+            shipping_cost=session.get('shipping_cost', 0)
         )
-        db.session.add(order)
-        db.session.flush()  # To get the order ID
-
-        # Add order items
-        for cart_item in cart_items:
-            order_item = models.OrderItem(
-                order_id=order.id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
-            )
-            db.session.add(order_item)
-
-        # Clear cart
-        for cart_item in cart_items:
-            db.session.delete(cart_item)
-
-        db.session.commit()
-
-        flash('Pembayaran berhasil! Terima kasih atas pesanan Anda.', 'success')
+        if created:
+            cart_service.invalidate(current_user.id)
+            flash('Pembayaran berhasil! Terima kasih atas pesanan Anda.', 'success')
 
     return render_template('payment_success.html', current_datetime=datetime.utcnow())
 
 @app.route('/orders')
 @login_required
 def orders():
-    user_orders = models.Order.query.filter_by(user_id=current_user.id).order_by(models.Order.created_at.desc()).all()
+    user_orders = query_loaders.buyer_order_list(
+        models.Order.query.filter_by(user_id=current_user.id)
+    ).order_by(models.Order.created_at.desc()).all()
     return render_template('orders.html', orders=user_orders)
 
 @app.route('/store-info')
 def store_info():
     return render_template('store_info.html')
 
+@app.route('/health')
+def health():
+    """Liveness probe: the worker is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/health/ready')
+def health_ready():
+    """Readiness probe polled by server.py: the app can reach its database"""
+    try:
+        db.session.execute(text('SELECT 1'))
+        return jsonify({'status': 'ready', 'pid': os.getpid()})
+    except Exception as e:
+        db.session.rollback()
+        print(f"[WARNING] Readiness check failed: {e}")
+        return jsonify({'status': 'unavailable'}), 503
+
 
 
 
@@ -1185,7 +1350,8 @@ def admin_dashboard():
     total_orders = models.Order.query.count()
     total_users = models.User.query.count()
 
-    recent_orders = models.Order.query.order_by(models.Order.created_at.desc()).limit(5).all()
+    recent_orders = query_loaders.recent_order_summary(models.Order.query)\
+        .order_by(models.Order.created_at.desc()).limit(5).all()
 
     # Analisis penjualan
     from sqlalchemy import func, extract
@@ -1230,10 +1396,31 @@ def admin_dashboard():
                          monthly_sales=monthly_sales,
                          best_selling_products=best_selling_products)
 
+@app.route('/admin/perf')
+@login_required
+@admin_required
+def admin_perf():
+    """Per-endpoint request and SQL statistics collected by db_profiler"""
+    stats = db_profiler.snapshot()
+    if request.args.get('format') == 'json':
+        return jsonify(stats)
+    return render_template('admin/perf.html', stats=stats,
+                         started_at=datetime.utcfromtimestamp(stats['started_at']))
+
+@app.route('/admin/perf/reset', methods=['POST'])
+@login_required
+@admin_required
+def admin_perf_reset():
+    db_profiler.reset()
+    flash('Statistik performa berhasil direset!', 'success')
+    return redirect(url_for('admin_perf'))
+
 @app.route('/admin/products')
 @login_required
 @admin_required
 def admin_products():
+    # Files left by earlier deletes (recent uploads, running jobs)
+    image_store.maybe_collect_deferred(app.config['UPLOAD_FOLDER'])
     # Get all products ordered by stock status (critical first)
     products = models.Product.query.order_by(
         db.case(
@@ -1245,8 +1432,8 @@ def admin_products():
         models.Product.name
     ).all()
 
-    categories = models.Category.query.filter_by(is_active=True).all()
-    suppliers = models.Supplier.query.filter_by(is_active=True).all()
+    categories = reference_cache.categories.get()
+    suppliers = reference_cache.suppliers.get()
 
     # Get products with different stock levels
     out_of_stock_products = models.Product.query.filter(models.Product.stock_quantity <= 0).all()
@@ -1263,6 +1450,7 @@ def admin_products():
     alert_products = critical_stock_products + low_stock_products
 
     return render_template('admin/products.html',
+                         image_jobs=image_pipeline.status_by_product(),
                          products=products,
                          categories=categories,
                          suppliers=suppliers,
@@ -1271,22 +1459,34 @@ def admin_products():
                          low_stock_products=low_stock_products,
                          alert_products=alert_products)
 
+@app.route('/admin/api/image-jobs')
+@login_required
+@admin_required
+def admin_image_jobs_status():
+    """Background image processing progress for the admin product list"""
+    product_ids = request.args.get('product_ids', '')
+    ids = [int(i) for i in product_ids.split(',') if i.strip().isdigit()] or None
+    return jsonify({
+        'summary': image_pipeline.summary(),
+        'products': {str(k): v for k, v in image_pipeline.status_by_product(ids).items()}
+    })
+
 @app.route('/admin/products/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def admin_add_product():
     if request.method == 'GET':
         # Show add product form
-        categories = models.Category.query.filter_by(is_active=True).all()
-        suppliers = models.Supplier.query.filter_by(is_active=True).all()
+        categories = reference_cache.categories.get()
+        suppliers = reference_cache.suppliers.get()
         return render_template('admin/add_product.html', categories=categories, suppliers=suppliers)
 
     try:
         # Validate required fields
         if not request.form.get('name') or not request.form.get('price') or not request.form.get('category_id'):
             flash('Nama produk, harga, dan kategori wajib diisi!', 'error')
-            categories = models.Category.query.filter_by(is_active=True).all()
-            suppliers = models.Supplier.query.filter_by(is_active=True).all()
+            categories = reference_cache.categories.get()
+            suppliers = reference_cache.suppliers.get()
             return render_template('admin/add_product.html', categories=categories, suppliers=suppliers)
 
         name = request.form['name'].strip()
@@ -1350,38 +1550,37 @@ def admin_add_product():
             print(f"[DEBUG] {len(valid_files)} valid files to process")
 
             # First pass: save and process all images
+            seen_urls = set()
             for i, file in enumerate(valid_files):
                 if allowed_file(file.filename):
                     try:
-                        # Generate unique filename
-                        filename = secure_filename(file.filename)
-                        filename = f"{uuid.uuid4()}_{filename}"
-                        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-                        # Create directory if it doesn't exist
-                        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-
-                        # Save file
-                        file.save(filepath)
-                        print(f"[DEBUG] File saved: {filepath}")
-
-                        # Compress image
-                        compress_image(filepath)
-
-                        # Detect orientation
-                        orientation = get_image_orientation(filepath)
-                        
-                        image_url = f"/static/public/produk_images/{filename}"
+                        # Detect orientation from the upload header
+                        orientation = get_image_orientation(file.stream)
+
+                        # Stored under its content hash, identical uploads share one file
+                        stored = image_store.store_upload(file, app.config['UPLOAD_FOLDER'])
+                        filepath, image_url = stored.path, stored.url
+                        print(f"[DEBUG] File stored: {filepath} (new: {stored.is_new})")
+                        if image_url in seen_urls:
+                            continue  # Same picture selected twice
+                        seen_urls.add(image_url)
+
+                        # Compression and derivatives run in the background image pipeline,
+                        # once per unique file
+                        if stored.is_new:
+                            image_pipeline.enqueue(filepath, image_url)
+                            image_pipeline.enqueue(filepath, image_url, operation='variants')
                         
                         # Store image info for sorting
                         processed_images.append({
                             'url': image_url,
                             'orientation': orientation,
                             'original_index': i,
-                            'filepath': filepath
+                            'filepath': filepath,
+                            'variants': None if stored.is_new else image_store.known_variants(image_url)
                         })
                         
-                        print(f"[DEBUG] Image processed: {filename}, orientation: {orientation}")
+                        print(f"[DEBUG] Image processed: {image_url}, orientation: {orientation}")
 
                     except Exception as img_error:
                         print(f"[ERROR] Failed to process image {file.filename}: {str(img_error)}")
@@ -1414,7 +1613,8 @@ def admin_add_product():
                         product_id=new_product.id,
                         image_url=image_url,
                         is_thumbnail=is_thumbnail,
-                        display_order=display_order
+                        display_order=display_order,
+                        variants=img_info['variants']
                     )
                     db.session.add(product_image)
                     print(f"[DEBUG] ProductImage created: {image_url}, orientation: {img_info['orientation']}, display_order: {display_order}, is_thumbnail: {is_thumbnail}")
@@ -1438,6 +1638,7 @@ def admin_add_product():
             print(f"[DEBUG] Using first image as thumbnail: {new_product.image_url}")
 
         db.session.commit()
+        image_pipeline.kick()
         print(f"[DEBUG] Product {new_product.name} saved successfully with {len(uploaded_images)} images")
         flash(f'Produk {new_product.name} berhasil ditambahkan dengan {len(uploaded_images)} gambar!', 'success')
 
@@ -1445,8 +1646,8 @@ def admin_add_product():
         db.session.rollback()
         print(f"[ERROR] Validation error: {str(ve)}")
         flash(f'Data tidak valid: {str(ve)}', 'error')
-        categories = models.Category.query.filter_by(is_active=True).all()
-        suppliers = models.Supplier.query.filter_by(is_active=True).all()
+        categories = reference_cache.categories.get()
+        suppliers = reference_cache.suppliers.get()
         return render_template('admin/add_product.html', categories=categories, suppliers=suppliers)
     except Exception as e:
         db.session.rollback()
@@ -1481,6 +1682,18 @@ def admin_edit_product(product_id):
         product.width = float(request.form.get('width', 0)) if request.form.get('width') else 0
         product.height = float(request.form.get('height', 0)) if request.form.get('height') else 0
 
+        # Remove images ticked for deletion; files nobody else uses are collected after commit
+        removed_urls = []
+        remove_ids = {int(i) for i in request.form.getlist('remove_image_ids') if i.isdigit()}
+        for image in [img for img in product.images if img.id in remove_ids]:
+            removed_urls.append(image.image_url)
+            product.images.remove(image)
+        if product.image_url in removed_urls:
+            remaining = sorted(product.images, key=lambda img: img.display_order or 0)
+            product.image_url = remaining[0].image_url if remaining else None
+            if remaining:
+                remaining[0].is_thumbnail = True
+
         # Handle multiple images upload if provided
         uploaded_images = []
         processed_images = []  # Store image info for sorting
@@ -1495,33 +1708,36 @@ def admin_edit_product(product_id):
 
         if files_to_process:
             # First pass: save and process all images
+            seen_urls = {image.image_url for image in product.images}
             for i, file in enumerate(files_to_process):
                 if file and file.filename and allowed_file(file.filename):
                     try:
-                        filename = secure_filename(file.filename)
-                        filename = f"{uuid.uuid4()}_{filename}"
-                        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-                        # Create directory if it doesn't exist
-                        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-
-                        file.save(filepath)
-                        compress_image(filepath)
-
-                        # Detect orientation
-                        orientation = get_image_orientation(filepath)
-                        
-                        image_url = f"/static/public/produk_images/{filename}"
+                        # Detect orientation from the upload header
+                        orientation = get_image_orientation(file.stream)
+
+                        # Stored under its content hash, identical uploads share one file
+                        stored = image_store.store_upload(file, app.config['UPLOAD_FOLDER'])
+                        filepath, image_url = stored.path, stored.url
+                        if image_url in seen_urls:
+                            continue  # Product already has this picture
+                        seen_urls.add(image_url)
+
+                        # Compression and derivatives run in the background image pipeline,
+                        # once per unique file
+                        if stored.is_new:
+                            image_pipeline.enqueue(filepath, image_url)
+                            image_pipeline.enqueue(filepath, image_url, operation='variants')
                         
                         # Store image info for sorting
                         processed_images.append({
                             'url': image_url,
                             'orientation': orientation,
                             'original_index': i,
-                            'filepath': filepath
+                            'filepath': filepath,
+                            'variants': None if stored.is_new else image_store.known_variants(image_url)
                         })
                         
-                        print(f"[DEBUG] Edit: Image processed: {filename}, orientation: {orientation}")
+                        print(f"[DEBUG] Edit: Image processed: {image_url}, orientation: {orientation}")
 
                     except Exception as img_error:
                         print(f"[ERROR] Failed to process image {file.filename}: {str(img_error)}")
@@ -1557,7 +1773,8 @@ def admin_edit_product(product_id):
                         product_id=product.id,
                         image_url=image_url,
                         is_thumbnail=is_thumbnail,
-                        display_order=existing_max_order + 1 + display_order_offset  # Add after existing images
+                        display_order=existing_max_order + 1 + display_order_offset,  # Add after existing images
+                        variants=img_info['variants']
                     )
                     db.session.add(product_image)
                     print(f"[DEBUG] Edit: ProductImage created: {image_url}, orientation: {img_info['orientation']}, display_order: {existing_max_order + 1 + display_order_offset}, is_thumbnail: {is_thumbnail}")
@@ -1590,6 +1807,10 @@ def admin_edit_product(product_id):
                 newest_images.is_thumbnail = True
 
         db.session.commit()
+        cart_service.products_changed()
+        image_pipeline.kick()
+        if removed_urls:
+            _collect_product_images(removed_urls)
         flash(f'Produk {product.name} berhasil diperbarui!', 'success')
 
     except Exception as e:
@@ -1598,6 +1819,17 @@ def admin_edit_product(product_id):
 
     return redirect(url_for('admin_products'))
 
+def _collect_product_images(urls):
+    """Delete stored images no product refers to any more (never fails the request)"""
+    try:
+        removed = image_store.collect_garbage(urls, app.config['UPLOAD_FOLDER'])
+        if removed:
+            print(f"[OK] Removed {removed} unreferenced product images")
+    except Exception as e:
+        db.session.rollback()
+        print(f"[WARNING] Image garbage collection failed: {e}")
+    image_store.maybe_collect_deferred(app.config['UPLOAD_FOLDER'])
+
 @app.route('/admin/products/<int:product_id>/delete', methods=['POST'])
 @login_required
 @admin_required
@@ -1609,6 +1841,11 @@ def admin_delete_product(product_id):
         flash('Tidak bisa menghapus produk yang sudah pernah dipesan!', 'error')
         return redirect(url_for('admin_products'))
 
+    # Reservations reference the product; one still held blocks the delete
+    if not stock_reservations.prepare_product_delete(product.id):
+        flash('Tidak bisa menghapus produk yang sedang dalam proses pembayaran! Coba lagi nanti.', 'error')
+        return redirect(url_for('admin_products'))
+
     # Check if product is in cart
     if product.cart_items:
         # Remove from all carts
@@ -1616,8 +1853,11 @@ def admin_delete_product(product_id):
             db.session.delete(cart_item)
 
     product_name = product.name
+    image_urls = [image.image_url for image in product.images] + [product.image_url]
     db.session.delete(product)
     db.session.commit()
+    cart_service.products_changed()
+    _collect_product_images(image_urls)
 
     flash(f'Produk {product_name} berhasil dihapus!', 'success')
     return redirect(url_for('admin_products'))
@@ -1685,6 +1925,7 @@ def admin_edit_category(category_id):
         category.is_active = 'is_active' in request.form
 
         db.session.commit()
+        reference_cache.categories.invalidate()
         flash(f'Kategori {category.name} berhasil diperbarui!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -1706,6 +1947,7 @@ def admin_delete_category(category_id):
     category_name = category.name
     db.session.delete(category)
     db.session.commit()
+    reference_cache.categories.invalidate()
 
     flash(f'Kategori {category_name} berhasil dihapus!', 'success')
     return redirect(url_for('admin_categories'))
@@ -1727,6 +1969,7 @@ def admin_add_category():
     category = models.Category(name=name, description=description)
     db.session.add(category)
     db.session.commit()
+    reference_cache.categories.invalidate()
 
     flash('Kategori berhasil ditambahkan!', 'success')
     return redirect(url_for('admin_categories'))
@@ -1808,6 +2051,7 @@ def admin_create_payment_config():
 
             db.session.add(config)
             db.session.commit()
+            reference_cache.payment_configs.invalidate()
 
             environment_text = "Sandbox" if is_sandbox else "Production"
             flash(f'Konfigurasi pembayaran {provider.title()} ({environment_text}) berhasil ditambahkan!', 'success')
@@ -1835,6 +2079,7 @@ def admin_toggle_payment_config(config_id):
     config.updated_at = datetime.utcnow()
 
     db.session.commit()
+    reference_cache.payment_configs.invalidate()
 
     status = 'diaktifkan' if config.is_active else 'dinonaktifkan'
     flash(f'Konfigurasi {config.provider} berhasil {status}!', 'success')
@@ -1851,16 +2096,28 @@ def payment_finish():
         flash('Pembayaran berhasil! Terima kasih atas pesanan Anda.', 'success')
         return redirect(url_for('payment_success'))
     else:
+        _release_buyer_stock()
         flash('Pembayaran gagal atau dibatalkan.', 'error')
         return redirect(url_for('cart'))
 
+def _release_buyer_stock():
+    """Give back the stock held for the current buyer's abandoned payment"""
+    if current_user.is_authenticated:
+        try:
+            stock_reservations.release_for_user(current_user.id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARNING] Could not release stock reservations: {e}")
+
 @app.route('/payment/unfinish')
 def payment_unfinish():
+    _release_buyer_stock()
     flash('Pembayaran belum diselesaikan. Silakan coba lagi.', 'warning')
     return redirect(url_for('cart'))
 
 @app.route('/payment/error')
 def payment_error():
+    _release_buyer_stock()
     flash('Terjadi kesalahan dalam pembayaran. Silakan coba lagi.', 'error')
     return redirect(url_for('cart'))
 
@@ -1887,6 +2144,9 @@ def payment_notification():
         transaction_status = data.get('transaction_status')
         fraud_status = data.get('fraud_status')
 
+        if transaction_status in ['deny', 'cancel', 'expire']:
+            stock_reservations.release_checkout(order_id)
+
         if order_id:
             # Find the transaction
             midtrans_transaction = models.MidtransTransaction.query.filter_by(
@@ -1958,6 +2218,10 @@ def notification_handling():
             print("No order_id in notification")
             return jsonify({'status': 'ok', 'message': 'No order_id provided'}), 200
 
+        # Stock held for a payment that will not complete goes back on sale
+        if transaction_status in ['deny', 'cancel', 'expire', 'failure']:
+            stock_reservations.release_checkout(order_id)
+
         # Find or create the transaction record
         midtrans_transaction = models.MidtransTransaction.query.filter_by(
             transaction_id=order_id
@@ -2178,35 +2442,121 @@ def notification_account_linking():
         print(f"Account linking notification error: {str(e)}")
         return jsonify({'status': 'error', 'message': 'Internal error'}), 500
 
+# Cart badge: rendered with the page, pushed over SSE when enabled, and a
+# conditional count endpoint for clients that still poll
+CART_EVENTS = os.environ.get('CART_EVENTS', 'false').lower() in ('1', 'true', 'yes', 'on')
+CART_EVENTS_TIMEOUT = int(os.environ.get('CART_EVENTS_TIMEOUT', '300'))
+CART_EVENTS_CHECK_INTERVAL = 1.0
+
+def _buyer_cart_count():
+    if not current_user.is_authenticated or current_user.role != 'buyer':
+        return 0
+    return cart_service.count(current_user.id)
+
+@app.context_processor
+def inject_cart_count():
+    """Cart badge count for the navbar, so pages do not fetch it separately"""
+    try:
+        return dict(cart_count=_buyer_cart_count(), cart_events=CART_EVENTS)
+    except Exception as e:
+        print(f"[ERROR] Failed to inject cart count: {e}")
+        db.session.rollback()
+        return dict(cart_count=None, cart_events=False)
+
 # API endpoint for cart count
 @app.route('/api/cart/count')
 @login_required
 def api_cart_count():
     try:
-        if current_user.role != 'buyer':
-            return jsonify({'count': 0})
-
-        count = models.CartItem.query.filter_by(user_id=current_user.id).count()
-        return jsonify({'count': count})
+        count = _buyer_cart_count()
     except Exception as e:
         print(f"Error getting cart count: {e}")
         return jsonify({'count': 0})
 
+    response = jsonify({'count': count})
+    response.set_etag(f"cart-{current_user.id}-{count}")
+    # Browsers revalidate every time and get a bodiless 304 while the count is unchanged
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/cart/events')
+@login_required
+def api_cart_events():
+    """
+    Server-Sent Events stream of the buyer's cart count.
+
+    Each open stream occupies a worker thread, so it is opt-in (CART_EVENTS)
+    and closed after CART_EVENTS_TIMEOUT seconds; EventSource reconnects.
+    """
+    if not CART_EVENTS or current_user.role != 'buyer':
+        abort(404)
+    user_id = current_user.id
+    # No pooled connection is held while the stream waits
+    db.session.remove()
+
+    def events():
+        marker = cart_service.change_marker(user_id)
+        deadline = time.monotonic() + CART_EVENTS_TIMEOUT
+        yield 'retry: 5000\n\n'
+        while time.monotonic() < deadline:
+            time.sleep(CART_EVENTS_CHECK_INTERVAL)
+            current = cart_service.change_marker(user_id)
+            if current == marker:
+                continue
+            marker = current
+            try:
+                # The session was saved with the response headers; it is not written here
+                count = cart_service.count(user_id, readonly=True)
+            finally:
+                db.session.remove()
+            yield f"event: cart\ndata: {json.dumps({'count': count})}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+MAX_PRODUCT_IDS = 100
+# Largest products.id (32-bit integer column); same bound as the chat service's clean_product_id
+MAX_PRODUCT_ID_VALUE = 2 ** 31 - 1
+
+def _chat_product_card(product):
+    """Product tag shown in chat messages"""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': float(product.price),
+        'image_url': product.image_url or '/static/images/placeholder.jpg',
+        'brand': product.brand or '',
+        'description': product.description or '',
+        'category': product.category.name if product.category else '',
+        'is_active': product.is_active
+    }
+
+def api_products_by_id(ids):
+    """Chat product tags for up to MAX_PRODUCT_IDS comma-separated ids, in request order"""
+    try:
+        product_ids = list(dict.fromkeys(int(i) for i in ids.split(',') if i.strip()))
+    except ValueError:
+        return jsonify({'error': 'ids must be comma-separated integers'}), 400
+    # Larger values would overflow the integer column in the IN (...) query
+    if any(not 1 <= product_id <= MAX_PRODUCT_ID_VALUE for product_id in product_ids):
+        return jsonify({'error': f'ids must be between 1 and {MAX_PRODUCT_ID_VALUE}'}), 400
+    if len(product_ids) > MAX_PRODUCT_IDS:
+        return jsonify({'error': f'At most {MAX_PRODUCT_IDS} ids per request'}), 400
+
+    products = {}
+    if product_ids:
+        products = {p.id: p for p in models.Product.query
+                    .options(joinedload(models.Product.category))
+                    .filter(models.Product.id.in_(product_ids))}
+    # Unknown ids are left out; callers treat them as not found
+    return jsonify({'products': [_chat_product_card(products[i]) for i in product_ids if i in products]})
+
 # API endpoint for chat service to get product info
 @app.route('/api/products/<int:product_id>')
 def api_get_product(product_id):
     try:
         product = models.Product.query.get_or_404(product_id)
-        return jsonify({
-            'id': product.id,
-            'name': product.name,
-            'price': float(product.price),
-            'image_url': product.image_url or '/static/images/placeholder.jpg',
-            'brand': product.brand or '',
-            'description': product.description or '',
-            'category': product.category.name if product.category else '',
-            'is_active': product.is_active
-        })
+        return jsonify(_chat_product_card(product))
     except Exception as e:
         print(f"Error getting product {product_id}: {e}")
         return jsonify({'error': 'Product not found'}), 404
@@ -2236,42 +2586,31 @@ def api_chat_token():
         print(f"Error generating chat token: {str(e)}")
         return jsonify({'error': 'Failed to generate token'}), 500
 
+def _chat_service_headers():
+    """Headers for calls made to the chat service on behalf of the current user"""
+    return {
+        'Authorization': f'Bearer {generate_jwt_token(current_user)}',
+        'Content-Type': 'application/json'
+    }
+
 # Proxy routes for chat service with /chat prefix
 @app.route('/chat/<path:path>')
 def proxy_chat_service(path):
     """Proxy all /chat requests to Django service on port 8000"""
     try:
-        import requests
-        
-        # Build target URL
-        target_url = f"http://127.0.0.1:8000/{path}"
-        
-        # Forward query parameters
+        # Query string passed through as sent
+        target = f"/{path}"
         if request.query_string:
-            target_url += f"?{request.query_string.decode()}"
-        
-        # Forward the request
-        if request.method == 'GET':
-            response = requests.get(target_url, headers=dict(request.headers), timeout=10)
-        elif request.method == 'POST':
-            response = requests.post(
-                target_url,
-                headers=dict(request.headers),
-                data=request.get_data(),
-                timeout=10
-            )
-        else:
-            response = requests.request(
-                request.method,
-                target_url,
-                headers=dict(request.headers),
-                data=request.get_data(),
-                timeout=10
-            )
-        
-        # Return response
-        return response.content, response.status_code, dict(response.headers)
-        
+            target += f"?{request.query_string.decode()}"
+
+        upstream = chat_proxy.request(
+            request.method, target,
+            headers=chat_proxy.forward_headers(request.headers),
+            data=request.get_data() if request.method != 'GET' else None,
+            timeout=10
+        )
+        return chat_proxy.stream_response(upstream)
+
     except Exception as e:
         print(f"Error proxying to chat service: {str(e)}")
         return jsonify({'error': 'Chat service unavailable'}), 503
@@ -2289,7 +2628,6 @@ def proxy_buyer_rooms():
                 return jsonify({'error': 'Chat service unavailable', 'rooms': [], 'total_count': 0}), 503
 
             # Wait for service to be ready
-            import time
             for i in range(10):
                 if check_django_service():
                     break
@@ -2297,41 +2635,22 @@ def proxy_buyer_rooms():
             else:
                 return jsonify({'error': 'Chat service failed to start', 'rooms': [], 'total_count': 0}), 503
 
-        search_query = request.args.get('search', '')
-
-        # Try multiple endpoints for Django service
-        endpoints = [
-            'http://127.0.0.1:8000/api/admin/buyer-rooms/',
-            'http://localhost:8000/api/admin/buyer-rooms/',
-            'http://0.0.0.0:8000/api/admin/buyer-rooms/'
-        ]
-
-        if search_query:
-            endpoints = [f"{url}?search={search_query}" for url in endpoints]
-
-        headers = {
-            'Authorization': f'Bearer {generate_jwt_token(current_user)}',
-            'Content-Type': 'application/json'
-        }
-
-        last_error = None
-        for chat_service_url in endpoints:
-            try:
-                response = requests.get(chat_service_url, headers=headers, timeout=5)
+        # Search and cursor pagination are handled by the chat service
+        params = {key: request.args[key] for key in ('search', 'cursor', 'limit') if request.args.get(key)}
+        upstream = chat_proxy.request('GET', '/api/admin/buyer-rooms/',
+                                      headers=_chat_service_headers(), params=params)
 
-                if response.status_code == 200:
-                    return jsonify(response.json()), response.status_code
-                else:
-                    last_error = f"Status {response.status_code}: {response.text}"
-                    continue
+        # 400: stale or malformed cursor; the client starts over
+        if upstream.status_code in (200, 400):
+            return chat_proxy.stream_response(upstream)
 
-            except requests.exceptions.RequestException as e:
-                last_error = str(e)
-                continue
-
-        print(f"All Django endpoints failed. Last error: {last_error}")
+        print(f"Chat service returned {upstream.status_code} for buyer rooms")
+        upstream.close()
         return jsonify({'error': 'Chat service unavailable', 'rooms': [], 'total_count': 0}), 503
 
+    except chat_proxy.ChatServiceUnavailable as e:
+        print(f"Chat service unavailable for buyer rooms: {e}")
+        return jsonify({'error': 'Chat service unavailable', 'rooms': [], 'total_count': 0}), 503
     except Exception as e:
         print(f"Unexpected error in proxy_buyer_rooms: {str(e)}")
         return jsonify({'error': 'Internal server error', 'rooms': [], 'total_count': 0}), 500
@@ -2340,51 +2659,19 @@ def proxy_buyer_rooms():
 @login_required
 def proxy_room_messages(room_name):
     try:
-        # Check if Django service is running
-        if not check_django_service():
-            print("[WARNING] Django chat service not responding")
-            return jsonify({'error': 'Chat service unavailable', 'results': []}), 503
-
-        # Try multiple endpoints
-        endpoints = [
-            f"http://127.0.0.1:8000/api/rooms/{room_name}/messages/",
-            f"http://localhost:8000/api/rooms/{room_name}/messages/",
-            f"http://0.0.0.0:8000/api/rooms/{room_name}/messages/"
-        ]
-
-        # Forward query parameters
-        query_params = request.args.to_dict()
-        if query_params:
-            query_string = "&".join([f"{k}={v}" for k, v in query_params.items()])
-            endpoints = [f"{url}?{query_string}" for url in endpoints]
-
-        headers = {
-            'Authorization': f'Bearer {generate_jwt_token(current_user)}',
-            'Content-Type': 'application/json'
-        }
-
-        last_error = None
-        for chat_service_url in endpoints:
-            try:
-                response = requests.get(chat_service_url, headers=headers, timeout=5)
-
-                if response.status_code == 200:
-                    try:
-                        return jsonify(response.json()), response.status_code
-                    except ValueError as e:
-                        print(f"JSON decode error: {str(e)}")
-                        return jsonify({'error': 'Invalid response from chat service', 'results': []}), 502
-                else:
-                    last_error = f"Status {response.status_code}: {response.text}"
-                    continue
+        upstream = chat_proxy.request('GET', f"/api/rooms/{url_quote(room_name)}/messages/",
+                                      headers=_chat_service_headers(), params=request.args)
 
-            except requests.exceptions.RequestException as e:
-                last_error = str(e)
-                continue
+        if upstream.status_code == 200:
+            return chat_proxy.stream_response(upstream)
 
-        print(f"All Django endpoints failed. Last error: {last_error}")
+        print(f"Chat service returned {upstream.status_code} for room messages")
+        upstream.close()
         return jsonify({'error': 'Chat service unavailable', 'results': []}), 503
 
+    except chat_proxy.ChatServiceUnavailable as e:
+        print(f"[WARNING] Django chat service not responding: {e}")
+        return jsonify({'error': 'Chat service unavailable', 'results': []}), 503
     except Exception as e:
         print(f"Unexpected error in proxy_room_messages: {str(e)}")
         return jsonify({'error': 'Internal server error', 'results': []}), 500
@@ -2393,44 +2680,19 @@ def proxy_room_messages(room_name):
 @login_required
 def proxy_mark_room_read(room_name):
     try:
-        # Check if Django service is running
-        if not check_django_service():
-            print("[WARNING] Django chat service not responding")
-            return jsonify({'error': 'Chat service unavailable'}), 503
-
-        # Try multiple endpoints
-        endpoints = [
-            f"http://127.0.0.1:8000/api/rooms/{room_name}/mark-read/",
-            f"http://localhost:8000/api/rooms/{room_name}/mark-read/",
-            f"http://0.0.0.0:8000/api/rooms/{room_name}/mark-read/"
-        ]
-
-        headers = {
-            'Authorization': f'Bearer {generate_jwt_token(current_user)}',
-            'Content-Type': 'application/json'
-        }
-
-        last_error = None
-        for chat_service_url in endpoints:
-            try:
-                response = requests.post(chat_service_url, headers=headers, timeout=5)
+        upstream = chat_proxy.request('POST', f"/api/rooms/{url_quote(room_name)}/mark-read/",
+                                      headers=_chat_service_headers())
 
-                if response.status_code == 200:
-                    try:
-                        return jsonify(response.json()), response.status_code
-                    except ValueError:
-                        return jsonify({'message': 'Messages marked as read'}), 200
-                else:
-                    last_error = f"Status {response.status_code}: {response.text}"
-                    continue
+        if upstream.status_code == 200:
+            return chat_proxy.stream_response(upstream)
 
-            except requests.exceptions.RequestException as e:
-                last_error = str(e)
-                continue
-
-        print(f"All Django endpoints failed. Last error: {last_error}")
+        print(f"Chat service returned {upstream.status_code} for mark-read")
+        upstream.close()
         return jsonify({'error': 'Chat service unavailable'}), 503
 
+    except chat_proxy.ChatServiceUnavailable as e:
+        print(f"[WARNING] Django chat service not responding: {e}")
+        return jsonify({'error': 'Chat service unavailable'}), 503
     except Exception as e:
         print(f"Unexpected error in proxy_mark_room_read: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -2440,8 +2702,33 @@ def proxy_mark_room_read(room_name):
 @login_required
 @staff_required
 def admin_orders():
-    orders = models.Order.query.order_by(models.Order.created_at.desc()).all()
-    return render_template('admin/orders.html', orders=orders)
+    status = request.args.get('status', '')
+    sort = request.args.get('sort', 'newest')
+    date_from = date_to = None
+    try:
+        if request.args.get('date_from'):
+            date_from = datetime.strptime(request.args['date_from'], '%Y-%m-%d').date()
+        if request.args.get('date_to'):
+            date_to = datetime.strptime(request.args['date_to'], '%Y-%m-%d').date()
+    except ValueError:
+        flash('Format tanggal tidak valid!', 'error')
+
+    filtered = query_loaders.filter_orders(models.Order.query, status, date_from, date_to)
+    total_orders = filtered.order_by(None).count()
+
+    # One page of orders plus two eager-load queries, however many orders exist
+    page = paginate_keyset(query_loaders.admin_order_list(filtered), models.Order,
+                           sort=sort,
+                           cursor=request.args.get('cursor'),
+                           limit=clamp_page_size(request.args.get('limit'), default=50, maximum=200),
+                           sort_options=query_loaders.ORDER_SORTS)
+
+    return render_template('admin/orders.html', orders=page.items, page=page,
+                         total_orders=total_orders,
+                         statuses=query_loaders.ORDER_STATUSES,
+                         current_status=status if status in query_loaders.ORDER_STATUSES else '',
+                         date_from=date_from, date_to=date_to,
+                         current_sort=page.sort)
 
 @app.route('/admin/order/<int:order_id>/update', methods=['POST'])
 @login_required
@@ -2505,8 +2792,9 @@ def print_professional_label(order_id):
     Generate simple thermal label for 120mm printer
     Standard ReportLab format, clean and readable
     """
+    from reportlab.pdfgen import canvas
     order = models.Order.query.get_or_404(order_id)
-    store_profile = models.StoreProfile.get_active_profile()
+    store_profile = store_profile_cache.get()
 
     # Generate tracking number if not exists
     if not order.tracking_number:
@@ -2896,7 +3184,7 @@ def export_sales(period):
     import calendar
 
     # Get store profile
-    store_profile = models.StoreProfile.get_active_profile()
+    store_profile = store_profile_cache.get()
     store_name = store_profile.store_name if store_profile else "Hurtrock Music Store"
 
     # Determine date range based on period
@@ -3147,8 +3435,9 @@ def export_sales(period):
 @login_required
 @staff_required
 def print_order_address(order_id):
+    from reportlab.pdfgen import canvas
     order = models.Order.query.get_or_404(order_id)
-    store_profile = models.StoreProfile.get_active_profile()
+    store_profile = store_profile_cache.get()
 
     # Create PDF untuk alamat pengiriman thermal (120mm width)
     buffer = io.BytesIO()
@@ -3310,7 +3599,7 @@ def print_order_address(order_id):
 @admin_required
 def admin_restock_orders():
     restock_orders = models.RestockOrder.query.order_by(models.RestockOrder.created_at.desc()).all()
-    suppliers = models.Supplier.query.filter_by(is_active=True).all()
+    suppliers = reference_cache.suppliers.get()
     products = models.Product.query.filter_by(is_active=True).all()
 
     # Convert to dict for JSON serialization
@@ -3443,6 +3732,8 @@ def admin_update_restock_status(order_id):
 @login_required
 @admin_required
 def admin_generate_restock_invoice(order_id):
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
     restock_order = models.RestockOrder.query.get_or_404(order_id)
 
     # Create PDF invoice
@@ -3579,6 +3870,7 @@ def admin_add_shipping_service():
 
         db.session.add(service)
         db.session.commit()
+        reference_cache.shipping_services.invalidate()
 
         flash(f'Jasa kirim {name} berhasil ditambahkan!', 'success')
     except Exception as e:
@@ -3604,6 +3896,7 @@ def admin_edit_shipping_service(service_id):
         service.is_active = request.form.get('is_active') == 'on'
 
         db.session.commit()
+        reference_cache.shipping_services.invalidate()
 
         flash(f'Jasa kirim {service.name} berhasil diperbarui!', 'success')
     except Exception as e:
@@ -3625,6 +3918,7 @@ def admin_delete_shipping_service(service_id):
     service_name = service.name
     db.session.delete(service)
     db.session.commit()
+    reference_cache.shipping_services.invalidate()
 
     flash(f'Jasa kirim {service_name} berhasil dihapus!', 'success')
     return redirect(url_for('admin_shipping_services'))
@@ -3676,6 +3970,7 @@ def admin_add_supplier():
 
         db.session.add(supplier)
         db.session.commit()
+        reference_cache.suppliers.invalidate()
 
         flash(f'Supplier {name} berhasil ditambahkan!', 'success')
     except Exception as e:
@@ -3700,6 +3995,7 @@ def admin_edit_supplier(supplier_id):
         supplier.is_active = request.form.get('is_active') == 'on'
 
         db.session.commit()
+        reference_cache.suppliers.invalidate()
 
         flash(f'Supplier {supplier.name} berhasil diperbarui!', 'success')
     except Exception as e:
@@ -3721,6 +4017,7 @@ def admin_delete_supplier(supplier_id):
     supplier_name = supplier.name
     db.session.delete(supplier)
     db.session.commit()
+    reference_cache.suppliers.invalidate()
 
     flash(f'Supplier {supplier_name} berhasil dihapus!', 'success')
     return redirect(url_for('admin_suppliers'))
@@ -3745,6 +4042,7 @@ def admin_store_profile():
         )
         db.session.add(profile)
         db.session.commit()
+        store_profile_cache.invalidate()
 
     return render_template('admin/store_profile.html', profile=profile)
 
@@ -3802,7 +4100,7 @@ def admin_update_store_profile():
                 os.makedirs(os.path.dirname(filepath), exist_ok=True)
 
                 file.save(filepath)
-                compress_image(filepath)
+                image_pipeline.enqueue(filepath, f"/static/logo_perusahaan/{filename}")
                 profile.logo_url = f"/static/logo_perusahaan/{filename}"
 
         # Store description/about
@@ -3810,6 +4108,8 @@ def admin_update_store_profile():
         
         profile.updated_at = models.get_utc_time()
         db.session.commit()
+        store_profile_cache.invalidate()
+        image_pipeline.kick()
 
         flash('Profil toko berhasil diperbarui!', 'success')
     except Exception as e:
@@ -3847,6 +4147,7 @@ def reset_and_initialize_database():
             # Create all tables fresh with current schema
             print("[INFO] Creating fresh tables...")
             db.create_all()
+            product_search.ensure_search_index()
             
             # Create default admin user
             print("[INFO] Creating default admin user...")
@@ -3896,8 +4197,10 @@ def reset_and_initialize_database():
 if __name__ == '__main__':
     # Main execution
     if len(sys.argv) > 1:
-        if sys.argv[1] == '--server-mode':
-            # Running through server.py, don't start directly
+        if sys.argv[1] in ('--server-mode', '--init-db'):
+            # One-off schema/default data creation (server.py, systemd ExecStartPre)
+            if not auto_init_enabled():
+                bootstrap_database()
             print("[INFO] Flask app initialized for server.py")
         elif sys.argv[1] == '--reset-db':
             # Reset database mode
@@ -3908,7 +4211,8 @@ if __name__ == '__main__':
         else:
             print(f"[INFO] Unknown argument: {sys.argv[1]}")
             print("[INFO] Available options:")
-            print("        --server-mode: Initialize for server.py")
+            print("        --init-db: Create database schema and default data")
+            print("        --server-mode: Initialize for server.py (same as --init-db)")
             print("        --reset-db: Reset and reinitialize database")
             sys.exit(1)
     else:
@@ -8,6 +8,7 @@ import pytz
 
 # Import db instance from database module
 from database import db
+import image_variants
 
 # Jakarta/WIB Timezone (UTC+7)
 WIB_TIMEZONE = pytz.timezone('Asia/Jakarta')
@@ -102,6 +103,13 @@ class Product(db.Model):
     
     def __repr__(self):
         return f'<Product {self.name}>'
+
+    @property
+    def main_image(self):
+        """ProductImage row behind image_url, if any"""
+        if not self.image_url:
+            return None
+        return next((img for img in self.images if img.image_url == self.image_url), None)
     
     @property
     def volume_cm3(self):
@@ -159,14 +167,53 @@ class ProductImage(db.Model):
     
     id = db.Column(Integer, primary_key=True)
     product_id = db.Column(Integer, ForeignKey('products.id'), nullable=False)
-    image_url = db.Column(String(255), nullable=False)
+    image_url = db.Column(String(255), nullable=False, index=True)  # Shared by duplicates (image_store.py)
     is_thumbnail = db.Column(Boolean, default=False)  # True if this is the main thumbnail
     display_order = db.Column(Integer, default=0)  # Order for displaying images
+    variants = db.Column(Text)  # JSON: responsive derivatives (see image_variants.py)
     created_at = db.Column(DateTime, default=get_utc_time)
     
     def __repr__(self):
         return f'<ProductImage {self.product_id}:{self.image_url}>'
 
+    @property
+    def variant_map(self):
+        return image_variants.parse(self.variants)
+
+    def srcset(self, fmt):
+        """srcset attribute for one format; empty until derivatives are generated"""
+        return image_variants.srcset(self.image_url, self.variant_map, fmt)
+
+class ImageJob(db.Model):
+    """Background processing job for an uploaded image (see image_pipeline.py)"""
+    __tablename__ = 'image_jobs'
+
+    # Keyed by file, not product: a stored image is shared by every product that uploaded it
+    id = db.Column(Integer, primary_key=True)
+    image_path = db.Column(String(255), nullable=False, index=True)  # Path on disk
+    image_url = db.Column(String(255))
+    operation = db.Column(String(30), nullable=False, default='compress')
+    status = db.Column(String(20), nullable=False, default='pending', index=True)  # pending, processing, done, failed
+    attempts = db.Column(Integer, default=0)
+    error = db.Column(Text)
+    created_at = db.Column(DateTime, default=get_utc_time)
+    started_at = db.Column(DateTime)
+    finished_at = db.Column(DateTime)
+
+    def __repr__(self):
+        return f'<ImageJob {self.id}:{self.operation} {self.status}>'
+
+class ImageOrphan(db.Model):
+    """Unreferenced image file left for a later garbage collection (see image_store.py)"""
+    __tablename__ = 'image_orphans'
+
+    id = db.Column(Integer, primary_key=True)
+    image_url = db.Column(String(255), nullable=False, unique=True)
+    created_at = db.Column(DateTime, default=get_utc_time)
+
+    def __repr__(self):
+        return f'<ImageOrphan {self.image_url}>'
+
 class CartItem(db.Model):
     __tablename__ = 'cart_items'
     
@@ -183,6 +230,25 @@ class CartItem(db.Model):
     def subtotal(self):
         return self.quantity * self.product.price
 
+class StockReservation(db.Model):
+    """Stock held for a buyer between checkout and payment (see stock_reservations.py)"""
+    __tablename__ = 'stock_reservations'
+    __table_args__ = (
+        db.Index('ix_stock_reservations_status_expires', 'status', 'expires_at'),
+    )
+
+    id = db.Column(Integer, primary_key=True)
+    user_id = db.Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    product_id = db.Column(Integer, ForeignKey('products.id'), nullable=False)
+    quantity = db.Column(Integer, nullable=False)
+    checkout_ref = db.Column(String(255), index=True)  # Stripe session id / Midtrans order id
+    status = db.Column(String(20), nullable=False, default='held')  # held, committed, released
+    expires_at = db.Column(DateTime, nullable=False)
+    created_at = db.Column(DateTime, default=get_utc_time)
+
+    def __repr__(self):
+        return f'<StockReservation {self.id} Product:{self.product_id} x{self.quantity} {self.status}>'
+
 class Order(db.Model):
     __tablename__ = 'orders'
     
@@ -197,6 +263,8 @@ class Order(db.Model):
     shipping_address = db.Column(Text)
     payment_method = db.Column(String(50))
     estimated_delivery_days = db.Column(Integer, default=0)
+    # Stripe checkout session / Midtrans order id; one order per payment
+    payment_reference = db.Column(String(255), unique=True, index=True)
     created_at = db.Column(DateTime, default=get_utc_time)
     updated_at = db.Column(DateTime, default=get_utc_time, onupdate=get_utc_time)
     
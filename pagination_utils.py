@@ -0,0 +1,141 @@
+"""
+Keyset (cursor) pagination helpers for large listings
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 96
+
+# Sort name -> (column name, descending)
+PRODUCT_SORTS = {
+    'newest': ('created_at', True),
+    'price_asc': ('price', False),
+    'price_desc': ('price', True),
+}
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query"""
+
+    def __init__(self, items, sort, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.sort = sort
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def clamp_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Parse a page size from the query string and keep it within limits"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _decode_value(column_name, raw):
+    if column_name == 'created_at':
+        return datetime.fromisoformat(raw)
+    if column_name == 'price':
+        return Decimal(raw)
+    return raw
+
+
+def encode_cursor(sort, direction, value, row_id):
+    """Encode a position in the listing as an opaque URL-safe token"""
+    payload = json.dumps({'s': sort, 'd': direction, 'v': _encode_value(value), 'i': row_id},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort_options=PRODUCT_SORTS):
+    """Decode a cursor token, returning None when it is malformed"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        sort = payload['s']
+        column_name, _ = sort_options[sort]
+        return {
+            'sort': sort,
+            'direction': 'prev' if payload['d'] == 'prev' else 'next',
+            'value': _decode_value(column_name, payload['v']),
+            'id': int(payload['i']),
+        }
+    except (KeyError, TypeError, ValueError, InvalidOperation, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def paginate_keyset(query, model, sort='newest', cursor=None, limit=DEFAULT_PAGE_SIZE,
+                    sort_options=PRODUCT_SORTS):
+    """
+    Fetch one page of `query` ordered by (sort column, id) using a keyset cursor.
+
+    Only `limit + 1` rows are read from the database, no matter how deep
+    the client has paged, so the cost does not grow with the offset.
+    """
+    if sort not in sort_options:
+        sort = next(iter(sort_options))
+    column_name, descending = sort_options[sort]
+    column = getattr(model, column_name)
+    id_column = model.id
+
+    position = decode_cursor(cursor, sort_options)
+    if position and position['sort'] != sort:
+        position = None
+    backwards = bool(position) and position['direction'] == 'prev'
+
+    # Walking backwards flips the comparison and the ordering, the rows are
+    # reversed again below so the page is always returned in display order
+    scan_descending = descending != backwards
+
+    if position:
+        value, row_id = position['value'], position['id']
+        if scan_descending:
+            query = query.filter(or_(column < value, and_(column == value, id_column < row_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, id_column > row_id)))
+
+    if scan_descending:
+        query = query.order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column.asc(), id_column.asc())
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        first, last = rows[0], rows[-1]
+        if backwards or has_more:
+            next_cursor = encode_cursor(sort, 'next', getattr(last, column_name), last.id)
+        if (has_more if backwards else position is not None):
+            prev_cursor = encode_cursor(sort, 'prev', getattr(first, column_name), first.id)
+
+    return KeysetPage(rows, sort, next_cursor=next_cursor, prev_cursor=prev_cursor)
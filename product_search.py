@@ -0,0 +1,228 @@
+"""
+Full-text product search
+
+PostgreSQL deployments get a generated `search_vector` tsvector column with
+a GIN index plus pg_trgm indexes for fuzzy brand/model matching. Local
+SQLite deployments get an FTS5 index kept in sync by triggers. Both are
+created idempotently by ensure_search_index(); if neither is available the
+search falls back to the old ILIKE scan.
+"""
+import re
+
+from sqlalchemy import text
+
+from database import db
+import models
+
+# 'simple' keeps Indonesian/English product names intact (no stemming)
+TS_CONFIG = 'simple'
+
+# Resolved lazily per process so workers that never ran ensure_search_index()
+# still pick up an index created by another process
+_UNSET = object()
+_backend = _UNSET
+_has_trigram = False
+
+_POSTGRES_DDL = [
+    f"""
+    ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(brand, '')), 'A') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(model, '')), 'B') ||
+        setweight(to_tsvector('{TS_CONFIG}', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING GIN (search_vector)",
+]
+
+_POSTGRES_TRIGRAM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_products_brand_trgm ON products USING GIN (brand gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_model_trgm ON products USING GIN (model gin_trgm_ops)",
+]
+
+_SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, brand, model, description,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, brand, model, description)
+        VALUES (new.id, new.name, new.brand, new.model, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, brand, model, description)
+        VALUES ('delete', old.id, old.name, old.brand, old.model, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, brand, model, description)
+        VALUES ('delete', old.id, old.name, old.brand, old.model, old.description);
+        INSERT INTO products_fts(rowid, name, brand, model, description)
+        VALUES (new.id, new.name, new.brand, new.model, new.description);
+    END
+    """,
+]
+
+
+def _tokens(query):
+    """Split a raw query into lowercase word tokens (safe for tsquery/MATCH)"""
+    return re.findall(r'\w+', query.lower())
+
+
+def ensure_search_index():
+    """Create the search index for the current database if it is missing"""
+    global _backend, _has_trigram
+
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == 'postgresql':
+            for statement in _POSTGRES_DDL:
+                with db.engine.begin() as conn:
+                    conn.execute(text(statement))
+            _backend = 'postgresql'
+
+            try:
+                for statement in _POSTGRES_TRIGRAM_DDL:
+                    with db.engine.begin() as conn:
+                        conn.execute(text(statement))
+                _has_trigram = True
+            except Exception as e:
+                print(f"[WARNING] pg_trgm not available, fuzzy brand/model search disabled: {e}")
+                _has_trigram = False
+
+        elif dialect == 'sqlite':
+            with db.engine.begin() as conn:
+                existing = conn.execute(text(
+                    "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'products_fts_%'"
+                )).scalar()
+                for statement in _SQLITE_DDL:
+                    conn.execute(text(statement))
+                # Missing triggers mean the index is new or products was recreated
+                if existing < 3:
+                    conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+            _backend = 'sqlite'
+
+        else:
+            _backend = None
+
+        if _backend:
+            print(f"[OK] Product search index ready ({_backend})")
+    except Exception as e:
+        print(f"[WARNING] Product search index unavailable, using ILIKE fallback: {e}")
+        _backend = None
+
+
+def _detect_backend():
+    """Probe the database for an existing search index without creating one"""
+    global _backend, _has_trigram
+
+    dialect = db.engine.dialect.name
+    try:
+        with db.engine.connect() as conn:
+            if dialect == 'postgresql':
+                has_column = conn.execute(text(
+                    "SELECT 1 FROM information_schema.columns "
+                    "WHERE table_name = 'products' AND column_name = 'search_vector'"
+                )).first()
+                _has_trigram = bool(conn.execute(text(
+                    "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+                )).first())
+                _backend = 'postgresql' if has_column else None
+            elif dialect == 'sqlite':
+                has_table = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+                )).first()
+                _backend = 'sqlite' if has_table else None
+            else:
+                _backend = None
+    except Exception as e:
+        print(f"[WARNING] Could not detect product search index: {e}")
+        _backend = None
+    return _backend
+
+
+def _ranked_ids_postgresql(tokens, raw_query, limit):
+    tsquery = ' & '.join(f"{token}:*" for token in tokens)
+    # `%` uses the trigram GIN indexes with pg_trgm's default 0.3 threshold
+    if _has_trigram:
+        sql = f"""
+            SELECT p.id
+            FROM products p, to_tsquery('{TS_CONFIG}', :tsquery) q
+            WHERE p.is_active = true
+              AND (p.search_vector @@ q OR p.brand % :raw OR p.model % :raw)
+            ORDER BY ts_rank_cd(p.search_vector, q)
+                     + greatest(similarity(coalesce(p.brand, ''), :raw),
+                                similarity(coalesce(p.model, ''), :raw)) DESC,
+                     p.id DESC
+            LIMIT :limit
+        """
+    else:
+        sql = f"""
+            SELECT p.id
+            FROM products p, to_tsquery('{TS_CONFIG}', :tsquery) q
+            WHERE p.is_active = true AND p.search_vector @@ q
+            ORDER BY ts_rank_cd(p.search_vector, q) DESC, p.id DESC
+            LIMIT :limit
+        """
+    rows = db.session.execute(text(sql), {'tsquery': tsquery, 'raw': raw_query, 'limit': limit})
+    return [row[0] for row in rows]
+
+
+def _ranked_ids_sqlite(tokens, limit):
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    rows = db.session.execute(text("""
+        SELECT p.id
+        FROM products_fts f JOIN products p ON p.id = f.rowid
+        WHERE products_fts MATCH :match AND p.is_active = 1
+        ORDER BY bm25(products_fts, 10.0, 8.0, 5.0, 1.0), p.id DESC
+        LIMIT :limit
+    """), {'match': match, 'limit': limit})
+    return [row[0] for row in rows]
+
+
+def _search_like(raw_query, limit):
+    search_term = f"%{raw_query}%"
+    return models.Product.query.filter(
+        db.or_(
+            models.Product.name.ilike(search_term),
+            models.Product.description.ilike(search_term),
+            models.Product.brand.ilike(search_term),
+            models.Product.model.ilike(search_term)
+        ),
+        models.Product.is_active == True
+    ).limit(limit).all()
+
+
+def search_products(raw_query, limit=10):
+    """Return active products matching `raw_query`, best matches first"""
+    tokens = _tokens(raw_query)
+    if not tokens:
+        return []
+
+    backend = _detect_backend() if _backend is _UNSET else _backend
+    if backend:
+        try:
+            if backend == 'postgresql':
+                ids = _ranked_ids_postgresql(tokens, raw_query, limit)
+            else:
+                ids = _ranked_ids_sqlite(tokens, limit)
+        except Exception as e:
+            print(f"[WARNING] Full-text search failed, using ILIKE fallback: {e}")
+            db.session.rollback()
+            return _search_like(raw_query, limit)
+
+        if not ids:
+            return []
+        by_id = {p.id: p for p in models.Product.query.filter(models.Product.id.in_(ids)).all()}
+        return [by_id[product_id] for product_id in ids if product_id in by_id]
+
+    return _search_like(raw_query, limit)
@@ -0,0 +1,225 @@
+"""
+In-memory typeahead suggestions for the product search boxes
+
+Every active product is indexed under the normalised start of each word in
+its name, brand and model, kept in a sorted array so a prefix lookup is a
+bisect plus a short scan. Product changes are picked up incrementally via
+SQLAlchemy session events, and answers are memoised in a small LRU+TTL
+cache, so typeahead requests do not touch the database at all.
+"""
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import models
+
+SUGGEST_LIMIT = 10
+CACHE_SIZE = int(os.environ.get('SUGGEST_CACHE_SIZE', '2048'))
+CACHE_TTL = float(os.environ.get('SUGGEST_CACHE_TTL', '60'))
+# Changes made by other worker processes are only seen after a full rebuild
+REBUILD_INTERVAL = float(os.environ.get('SUGGEST_REBUILD_INTERVAL', '300'))
+
+_WORD_RE = re.compile(r'[^\w]+', re.UNICODE)
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation to single spaces"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _WORD_RE.sub(' ', stripped.lower()).strip()
+
+
+class _TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SuggestIndex:
+    """Sorted-array prefix index over active products"""
+
+    def __init__(self, card_builder, limit=SUGGEST_LIMIT):
+        self.card_builder = card_builder
+        self.limit = limit
+        self._keys = []          # sorted (term, product_id)
+        self._entries = {}       # product_id -> (terms, normalised name, card)
+        self._built_at = None
+        self._pending = set()    # product ids changed since the last refresh
+        self._rebuild_all = False
+        self._lock = threading.RLock()
+        self._cache = _TTLCache(CACHE_SIZE, CACHE_TTL)
+
+    # -- maintenance -------------------------------------------------------
+
+    def mark_dirty(self, product_ids):
+        """Queue products for re-indexing on the next lookup"""
+        with self._lock:
+            self._pending.update(product_ids)
+
+    def invalidate(self):
+        """Force a full rebuild on the next lookup"""
+        with self._lock:
+            self._rebuild_all = True
+
+    def _terms_for(self, product):
+        words = set()
+        for field in (product.name, product.brand, product.model):
+            normalised = normalize(field)
+            if not normalised:
+                continue
+            parts = normalised.split(' ')
+            # Every word start, so "paul" matches "Gibson Les Paul"
+            for i in range(len(parts)):
+                words.add(' '.join(parts[i:]))
+        return words
+
+    def _add(self, product):
+        terms = self._terms_for(product)
+        self._entries[product.id] = (terms, normalize(product.name), self.card_builder(product))
+        for term in terms:
+            insort(self._keys, (term, product.id))
+
+    def _remove(self, product_id):
+        entry = self._entries.pop(product_id, None)
+        if not entry:
+            return
+        for term in entry[0]:
+            pos = bisect_left(self._keys, (term, product_id))
+            if pos < len(self._keys) and self._keys[pos] == (term, product_id):
+                del self._keys[pos]
+
+    def _build(self):
+        products = models.Product.query.filter_by(is_active=True).all()
+        self._entries = {}
+        keys = []
+        for product in products:
+            terms = self._terms_for(product)
+            self._entries[product.id] = (terms, normalize(product.name), self.card_builder(product))
+            keys.extend((term, product.id) for term in terms)
+        keys.sort()
+        self._keys = keys
+        self._built_at = time.monotonic()
+        self._pending.clear()
+        self._rebuild_all = False
+
+    def _refresh(self, product_ids):
+        products = {p.id: p for p in models.Product.query.filter(models.Product.id.in_(product_ids)).all()}
+        for product_id in product_ids:
+            self._remove(product_id)
+            product = products.get(product_id)
+            if product is not None and product.is_active:
+                self._add(product)
+
+    def _ensure_fresh(self):
+        """Build or patch the index; concurrent callers wait for one build"""
+        stale = (self._built_at is None or self._rebuild_all
+                 or time.monotonic() - self._built_at > REBUILD_INTERVAL)
+        if not stale and not self._pending:
+            return
+        with self._lock:
+            stale = (self._built_at is None or self._rebuild_all
+                     or time.monotonic() - self._built_at > REBUILD_INTERVAL)
+            if stale:
+                self._build()
+            elif self._pending:
+                pending, self._pending = self._pending, set()
+                self._refresh(pending)
+            else:
+                return
+            self._cache.clear()
+
+    # -- lookup ------------------------------------------------------------
+
+    def _scan(self, prefix):
+        ids = set()
+        keys = self._keys
+        pos = bisect_left(keys, (prefix,))
+        while pos < len(keys) and keys[pos][0].startswith(prefix):
+            ids.add(keys[pos][1])
+            pos += 1
+        return ids
+
+    def suggest(self, raw_query):
+        """Return product cards whose words start with every query token"""
+        query = normalize(raw_query)
+        if not query:
+            return []
+
+        self._ensure_fresh()
+        cached = self._cache.get(query)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            tokens = query.split(' ')
+            # Scan with the longest token (fewest candidates), then check the rest
+            anchor = max(tokens, key=len)
+            candidates = self._scan(anchor)
+            others = [t for t in tokens if t != anchor]
+            matches = []
+            for product_id in candidates:
+                terms, name, card = self._entries[product_id]
+                if all(any(term.startswith(t) for term in terms) for t in others):
+                    matches.append((not name.startswith(query), len(name), name, product_id, card))
+            matches.sort(key=lambda m: m[:4])
+            result = [m[4] for m in matches[:self.limit]]
+
+        self._cache.set(query, result)
+        return result
+
+
+def register_listeners(index):
+    """Keep `index` in step with Product changes committed through the ORM"""
+
+    @event.listens_for(Session, 'after_flush')
+    def _collect_product_changes(session, flush_context):
+        changed = session.info.setdefault('suggest_dirty', set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, models.Product) and obj.id is not None:
+                changed.add(obj.id)
+
+    @event.listens_for(Session, 'after_commit')
+    def _apply_product_changes(session):
+        changed = session.info.pop('suggest_dirty', None)
+        if changed:
+            index.mark_dirty(changed)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard_product_changes(session):
+        session.info.pop('suggest_dirty', None)
@@ -0,0 +1,53 @@
+"""
+Relationship loading policies for list views
+
+Every template that loops over orders touches `order.user` and
+`order.order_items -> item.product`. With the default lazy relationships
+that is one extra query per row; the helpers below attach the loader
+options each view needs so a page costs a fixed number of round-trips.
+"""
+from datetime import datetime, time, timedelta
+
+from sqlalchemy.orm import joinedload, selectinload
+
+import models
+
+# Sort name -> (column name, descending), see pagination_utils.paginate_keyset
+ORDER_SORTS = {
+    'newest': ('created_at', True),
+    'oldest': ('created_at', False),
+}
+
+ORDER_STATUSES = ['pending', 'paid', 'shipped', 'delivered', 'cancelled']
+
+
+def _order_items_with_products():
+    return selectinload(models.Order.order_items).joinedload(models.OrderItem.product)
+
+
+def admin_order_list(query):
+    """/admin/orders: customer, items and their products (shown in the modals)"""
+    return query.options(joinedload(models.Order.user), _order_items_with_products())
+
+
+def recent_order_summary(query):
+    """Dashboard recent orders: only the customer name/email is shown"""
+    return query.options(joinedload(models.Order.user))
+
+
+def buyer_order_list(query):
+    """Buyer /orders page: items and products, the user is already known"""
+    return query.options(_order_items_with_products())
+
+
+def filter_orders(query, status=None, date_from=None, date_to=None):
+    """Apply the admin order filters; dates are inclusive `date` objects"""
+    if status in ORDER_STATUSES:
+        query = query.filter(models.Order.status == status)
+    if date_from:
+        query = query.filter(models.Order.created_at >= datetime.combine(date_from, time.min))
+    if date_to:
+        # created_at is a timestamp, so compare against the start of the next day
+        next_day = datetime.combine(date_to + timedelta(days=1), time.min)
+        query = query.filter(models.Order.created_at < next_day)
+    return query
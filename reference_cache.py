@@ -0,0 +1,24 @@
+"""
+Versioned cache for storefront/admin reference data
+
+Active categories, suppliers, shipping services and payment configurations
+change only through the admin pages but are read on almost every request.
+Each list is cached per process as a tuple of detached rows (see
+cache_utils.CachedValue); the admin add/edit/delete routes call
+`invalidate()` on the matching entry, which also signals other workers.
+"""
+from cache_utils import CachedValue, detached_copy
+import models
+
+
+def _active_rows(model):
+    def load():
+        rows = model.query.filter_by(is_active=True).order_by(model.id).all()
+        return tuple(detached_copy(row) for row in rows)
+    return load
+
+
+categories = CachedValue('categories', _active_rows(models.Category))
+suppliers = CachedValue('suppliers', _active_rows(models.Supplier))
+shipping_services = CachedValue('shipping_services', _active_rows(models.ShippingService))
+payment_configs = CachedValue('payment_configs', _active_rows(models.PaymentConfiguration))
@@ -34,12 +34,17 @@ def check_django_service():
     except requests.exceptions.RequestException:
         return False
 
+FLASK_READY_URL = 'http://127.0.0.1:5000/health/ready'
+DJANGO_READY_URL = 'http://127.0.0.1:8000/health/'
+
 class HurtrockServer:
-    def __init__(self):
+    def __init__(self, production=False):
         self.flask_process = None
         self.django_process = None
         self.running = False
         self.project_root = Path(__file__).resolve().parent
+        # Production mode serves Flask with gunicorn (see gunicorn.conf.py)
+        self.production = production
 
         # Setup environment
         self.setup_environment()
@@ -93,6 +98,24 @@ class HurtrockServer:
             time.sleep(0.5)
         return False
 
+    def wait_for_ready(self, url, timeout=30, process=None):
+        """Poll a readiness endpoint until it answers 200 (service can serve requests)"""
+        import urllib.request
+        import urllib.error
+
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            if process is not None and process.poll() is not None:
+                return False  # Process exited, no point in waiting
+            try:
+                with urllib.request.urlopen(url, timeout=2) as response:
+                    if response.status == 200:
+                        return True
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.5)
+        return False
+
     def setup_django(self):
         """Setup Django migrations and database"""
         logger.info("Setting up Django chat service...")
@@ -192,22 +215,11 @@ except Exception as e:
 
             # Wait for Django to start
             logger.info("Waiting for Django service to start...")
-            
-            # Wait for port to be occupied
-            if self.wait_for_port(8000, timeout=45):
-                logger.info("Django port 8000 is now active")
-                
-                # Give Django a moment to fully initialize
-                time.sleep(3)
-                
-                # Check health endpoint
-                if check_django_service():
-                    logger.info("Django service started successfully")
-                    return True
-                else:
-                    logger.warning("Django port is active but health check failed")
-                    # Continue anyway, might be startup delay
-                    return True
+
+            # Poll the health endpoint rather than just waiting for the port
+            if self.wait_for_ready(DJANGO_READY_URL, timeout=45, process=self.django_process):
+                logger.info("Django service started successfully")
+                return True
             
             # Check if the process has terminated unexpectedly
             if self.django_process.poll() is not None:
@@ -248,6 +260,11 @@ except Exception as e:
             logger.warning("Port 5000 already in use. Skipping Flask start.")
             return False
 
+        if self.production:
+            if sys.platform != 'win32' and self.gunicorn_available():
+                return self.start_flask_production()
+            logger.warning("gunicorn not available on this platform, using the development server")
+
         logger.info("Starting Flask main service on port 5000...")
 
         try:
@@ -267,7 +284,7 @@ except Exception as e:
             flask_thread.start()
 
             # Wait for Flask to start
-            if self.wait_for_port(5000):
+            if self.wait_for_ready(FLASK_READY_URL):
                 logger.info("Flask service started successfully")
                 return True
             else:
@@ -278,6 +295,65 @@ except Exception as e:
             logger.error(f"Failed to start Flask: {e}", exc_info=True)
             return False
 
+    def gunicorn_available(self):
+        try:
+            import gunicorn  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def start_flask_production(self):
+        """Start Flask under gunicorn: pre-forked workers, graceful reload, recycling"""
+        logger.info("Starting Flask main service on port 5000 (gunicorn)...")
+
+        # Create tables and default data once, before the workers start
+        init_result = subprocess.run([
+            sys.executable, 'main.py', '--init-db'
+        ], cwd=str(self.project_root), capture_output=True, text=True)
+        if init_result.returncode != 0:
+            logger.warning(f"Flask initialization returned {init_result.returncode}. STDERR:\n{init_result.stderr}")
+
+        # Fingerprinted static assets + manifest, picked up by the workers on import
+        assets_result = subprocess.run([
+            sys.executable, 'static_assets.py'
+        ], cwd=str(self.project_root), capture_output=True, text=True)
+        if assets_result.returncode != 0:
+            logger.warning(f"Static asset build failed, serving unversioned files. STDERR:\n{assets_result.stderr}")
+
+        # Workers must not repeat the initialization on import
+        env = os.environ.copy()
+        env['AUTO_INIT_DB'] = 'false'
+
+        try:
+            self.flask_process = subprocess.Popen([
+                sys.executable, '-m', 'gunicorn',
+                '--config', str(self.project_root / 'gunicorn.conf.py'),
+                'main:create_app()'
+            ], cwd=str(self.project_root), env=env)
+        except Exception as e:
+            logger.error(f"Failed to start gunicorn: {e}", exc_info=True)
+            return False
+
+        if self.wait_for_ready(FLASK_READY_URL, timeout=90, process=self.flask_process):
+            logger.info(f"Flask service started successfully (gunicorn master pid {self.flask_process.pid})")
+            return True
+
+        logger.error("Flask service failed to become ready within timeout")
+        if self.flask_process.poll() is None:
+            self.flask_process.terminate()
+        return False
+
+    def reload(self):
+        """Gracefully reload the gunicorn workers (new code, no dropped requests)"""
+        if self.flask_process and self.flask_process.poll() is None:
+            logger.info("Reloading Flask workers...")
+            self.flask_process.send_signal(signal.SIGHUP)
+        else:
+            logger.warning("Reload requested but Flask is not running under gunicorn")
+
+    def reload_handler(self, signum, frame):
+        self.reload()
+
     def test_services(self):
         """Test if services are responding"""
         import requests
@@ -332,9 +408,20 @@ except Exception as e:
             except Exception as e:
                 logger.error(f"Error stopping Django: {e}")
 
-        # Add logic to stop Flask if it was started in a managed way (e.g., via a subprocess)
-        # If Flask is run in a thread as in start_flask, it will exit when the main process exits.
-        # If it needs explicit stopping, a mechanism to signal the thread or manage its process would be needed.
+        if self.flask_process and self.flask_process.poll() is None:
+            # SIGTERM lets gunicorn finish in-flight requests (graceful_timeout)
+            logger.info("Stopping Flask service...")
+            try:
+                self.flask_process.terminate()
+                self.flask_process.wait(timeout=35)
+                logger.info("Flask service stopped.")
+            except subprocess.TimeoutExpired:
+                logger.warning("Flask process did not terminate gracefully, killing...")
+                self.flask_process.kill()
+            except Exception as e:
+                logger.error(f"Error stopping Flask: {e}")
+
+        # When Flask runs in a thread (development mode) it exits with the main process
         logger.info("All managed services stopped.")
 
 
@@ -347,6 +434,8 @@ except Exception as e:
         # Setup signal handlers
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.reload_handler)
 
         # Setup Django (migrations, etc.)
         if not self.setup_django():
@@ -405,6 +494,9 @@ except Exception as e:
             while self.running:
                 # Add a small sleep to prevent high CPU usage in the main loop
                 time.sleep(1)
+                if self.flask_process and self.flask_process.poll() is not None:
+                    logger.error(f"Flask service exited with code {self.flask_process.returncode}")
+                    break
         except KeyboardInterrupt:
             logger.info("Keyboard interrupt received")
         finally:
@@ -433,9 +525,11 @@ def main():
             print(f"GUI error: {e}")
             print("Running in console mode instead...")
     
-    # Console mode (default)
+    # Console mode (default); --production or HURTROCK_SERVER_MODE=production uses gunicorn
+    production = ('--production' in sys.argv[1:]
+                  or os.environ.get('HURTROCK_SERVER_MODE', '').lower() == 'production')
     try:
-        server = HurtrockServer()
+        server = HurtrockServer(production=production)
         success = server.start()
         sys.exit(0 if success else 1)
     except Exception as e:
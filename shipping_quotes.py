@@ -0,0 +1,126 @@
+"""
+Shipping quotes for checkout
+
+checkout() shows the cost of every active shipping service and
+create_checkout_session() charges the one the buyer picked. Both go
+through quote(): the cart's subtotal, weight and volume are summed once,
+the active services' rates are converted to floats once per reload of
+reference_cache.shipping_services, and every service is priced in one
+pass over those rates. Quotes are cached per (cart contents, product data
+version, service set generation, distance) and the POST reuses the quote
+the checkout page was rendered with as long as the products' prices,
+weights and sizes are the same; when the cached cart is older than the
+database, the POST is quoted afresh from the rows it charges.
+
+    SHIPPING_QUOTE_CACHE_SIZE=1000   quotes kept per worker
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from cart_service import cart as cart_service
+import reference_cache
+from shipping_zones import DEFAULT_DISTANCE_KM
+
+CACHE_SIZE = int(os.environ.get('SHIPPING_QUOTE_CACHE_SIZE', '1000'))
+
+_lock = threading.Lock()
+_quotes = OrderedDict()
+# (services tuple the rates were built from, rates)
+_rates = (None, ())
+
+
+class Quote:
+    """Cart totals and the shipping cost of every active service"""
+
+    def __init__(self, subtotal, total_weight, total_volume, services, costs):
+        self.subtotal = subtotal
+        self.total_weight = total_weight
+        self.total_volume = total_volume
+        self.services = services
+        self.costs = costs
+
+    def service(self, service_id):
+        """Active service with this id (detached copy), or None"""
+        return next((s for s in self.services if s.id == service_id), None)
+
+    def cost(self, service_id):
+        return self.costs.get(service_id)
+
+    def options(self):
+        """Rows for the checkout page's service picker"""
+        return [{
+            'service': service,
+            'cost': self.costs[service.id],
+            'delivery_estimate': f"{service.min_days}-{service.max_days} hari"
+        } for service in self.services]
+
+
+def _service_rates():
+    """Active services and their rates as floats, rebuilt when the service cache reloads"""
+    global _rates
+    services = reference_cache.shipping_services.get()
+    built_from, rates = _rates
+    if built_from is not services:
+        rates = tuple(
+            (service.id, float(service.base_price), float(service.price_per_kg),
+             float(service.price_per_km or 0), float(service.volume_factor))
+            for service in services
+        )
+        _rates = (services, rates)
+    return services, rates
+
+
+def price_all(rates, weight_gram, volume_cm3, distance_km=DEFAULT_DISTANCE_KM):
+    """
+    Cost per service id; same formula as ShippingService.calculate_shipping_cost:
+    base + max(actual kg, volumetric kg) * price_per_kg + distance * price_per_km
+    """
+    weight_kg = float(weight_gram) / 1000
+    volume_cm3 = float(volume_cm3)
+    distance_km = float(distance_km)
+    return {
+        service_id: round(base + max(weight_kg, volume_cm3 / volume_factor) * per_kg + distance_km * per_km, 2)
+        for service_id, base, per_kg, per_km, volume_factor in rates
+    }
+
+
+def quote(lines, distance_km=DEFAULT_DISTANCE_KM):
+    """
+    Quote for cart lines (CartItem rows or cart_service CartLines; anything
+    with product_id, quantity and a loaded product).
+    """
+    lines = list(lines)
+    services, rates = _service_rates()
+    key = (
+        # The lines' own product values: a quote is only reused for rows
+        # with these prices, so the charged subtotal always matches the
+        # provider line items built from the same rows
+        tuple(sorted((line.product_id, line.quantity, str(line.product.price), str(line.product.weight or 0),
+                      str(line.product.volume_cm3 or 0)) for line in lines)),
+        cart_service.catalog.read(),
+        reference_cache.shipping_services.generation,
+        distance_km,
+    )
+    with _lock:
+        cached = _quotes.get(key)
+        if cached is not None and cached.services is services:
+            _quotes.move_to_end(key)
+            return cached
+
+    subtotal = 0
+    total_weight = 0
+    total_volume = 0
+    for line in lines:
+        product = line.product
+        subtotal += line.quantity * product.price
+        total_weight += line.quantity * (product.weight or 0)
+        total_volume += line.quantity * (product.volume_cm3 or 0)
+
+    result = Quote(subtotal, total_weight, total_volume, services,
+                   price_all(rates, total_weight, total_volume, distance_km))
+    with _lock:
+        _quotes[key] = result
+        while len(_quotes) > CACHE_SIZE:
+            _quotes.popitem(last=False)
+    return result
@@ -0,0 +1,151 @@
+"""
+Buyer-to-store shipping distance from a local zone table
+
+data/shipping_zones.csv lists shipping zones by postal code prefix (2 or 3
+digits) with a centroid and the city names that belong to it. On first use
+the table is loaded into compact arrays:
+
+    prefix index   1000 zone numbers, one per 3-digit postal code prefix
+    distances      estimated road distance (km) from the store's zone to
+                   every zone, computed once per store zone
+
+so a lookup is a postal code match on the address plus two array reads;
+no geocoding service is called. Addresses without a postal code are
+matched on the city names in the table. Unknown locations fall back to
+DEFAULT_DISTANCE_KM, the distance every quote used before.
+
+    SHIPPING_ZONES_CSV=data/shipping_zones.csv
+    SHIPPING_ROAD_FACTOR=1.3       great-circle to road distance multiplier
+"""
+import csv
+import math
+import os
+import re
+import threading
+from array import array
+
+DEFAULT_DISTANCE_KM = 50
+# Deliveries within one zone still travel across town
+LOCAL_DISTANCE_KM = 10
+ROAD_FACTOR = float(os.environ.get('SHIPPING_ROAD_FACTOR', '1.3'))
+ZONES_CSV = os.environ.get('SHIPPING_ZONES_CSV') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'data', 'shipping_zones.csv')
+
+NO_ZONE = -1
+EARTH_RADIUS_KM = 6371.0
+
+_POSTAL_CODE = re.compile(r'(?<!\d)(\d{5})(?!\d)')
+_WORD = re.compile(r'[a-z]+')
+# Longest city name in words that is looked for in an address
+_MAX_CITY_WORDS = 3
+
+
+class ZoneTable:
+    """Zones indexed by postal code prefix and city name"""
+
+    def __init__(self):
+        self.names = []
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.by_prefix = array('h', [NO_ZONE]) * 1000
+        self.by_city = {}
+        self._distances = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        table = cls()
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = sorted(csv.DictReader(f), key=lambda row: len(row['postal_prefix'].strip()))
+        # Shorter prefixes first, so 3-digit rows refine the 2-digit zones they fall in
+        for row in rows:
+            prefix = row['postal_prefix'].strip()
+            cities = [c.strip() for c in row['city'].split('|') if c.strip()]
+            zone = len(table.names)
+            table.names.append(cities[0] if cities else prefix)
+            table.latitudes.append(float(row['latitude']))
+            table.longitudes.append(float(row['longitude']))
+
+            span = 10 ** (3 - len(prefix))
+            start = int(prefix) * span
+            for slot in range(start, start + span):
+                table.by_prefix[slot] = zone
+            for city in cities:
+                table.by_city[' '.join(_WORD.findall(city.lower()))] = zone
+        return table
+
+    def zone_for_postal_code(self, postal_code):
+        postal_code = (postal_code or '').strip()
+        if len(postal_code) != 5 or not postal_code.isdigit():
+            return NO_ZONE
+        return self.by_prefix[int(postal_code[:3])]
+
+    def zone_for_address(self, address):
+        """Zone of the last postal code in the address, else of the last city named in it"""
+        address = address or ''
+        codes = _POSTAL_CODE.findall(address)
+        if codes:
+            zone = self.zone_for_postal_code(codes[-1])
+            if zone != NO_ZONE:
+                return zone
+        words = _WORD.findall(address.lower())
+        # City usually comes last; prefer "jakarta selatan" over "jakarta"
+        for end in range(len(words), 0, -1):
+            for size in range(min(_MAX_CITY_WORDS, end), 0, -1):
+                zone = self.by_city.get(' '.join(words[end - size:end]))
+                if zone is not None:
+                    return zone
+        return NO_ZONE
+
+    def distances_from(self, zone):
+        """Road distance estimate from `zone` to every zone, as a float array"""
+        distances = self._distances.get(zone)
+        if distances is None:
+            with self._lock:
+                distances = self._distances.get(zone)
+                if distances is None:
+                    distances = array('f', (
+                        _road_km(self.latitudes[zone], self.longitudes[zone],
+                                 self.latitudes[other], self.longitudes[other])
+                        for other in range(len(self.names))
+                    ))
+                    self._distances[zone] = distances
+        return distances
+
+
+def _road_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    great_circle = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+    return max(LOCAL_DISTANCE_KM, great_circle * ROAD_FACTOR)
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def table():
+    """The zone table, loaded on first use (empty if the CSV is missing)"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                try:
+                    _table = ZoneTable.load(ZONES_CSV)
+                except (OSError, KeyError, ValueError) as e:
+                    print(f"[WARNING] Shipping zones unavailable, using {DEFAULT_DISTANCE_KM} km for every quote: {e}")
+                    _table = ZoneTable()
+    return _table
+
+
+def distance_km(address, store_postal_code=None, store_city=None):
+    """Estimated shipping distance from the store to `address`"""
+    zones = table()
+    store_zone = zones.zone_for_postal_code(store_postal_code)
+    if store_zone == NO_ZONE:
+        store_zone = zones.zone_for_address(store_city)
+    buyer_zone = zones.zone_for_address(address)
+    if store_zone == NO_ZONE or buyer_zone == NO_ZONE:
+        return DEFAULT_DISTANCE_KM
+    return round(zones.distances_from(store_zone)[buyer_zone], 1)
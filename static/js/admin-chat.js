@@ -15,6 +15,7 @@ class AdminChat {
         this.chatToken = null;
         this.currentUser = null;
         this.isConnected = false;
+        this.productCache = new ChatProductCache(id => this.requestProductInfo(id));
         this.selectedRoomId = null;
         this.rooms = new Map();
         this.unreadCount = 0;
@@ -478,7 +479,7 @@ class AdminChat {
         }
     }
 
-    async loadChatRooms(searchQuery = '') {
+    async loadChatRooms(searchQuery = '', cursor = null) {
         try {
             // Show loading indicator
             const roomsList = document.getElementById('chat-rooms-list');
@@ -493,7 +494,10 @@ class AdminChat {
                 `;
             }
 
-            const url = `/api/admin/buyer-rooms/${searchQuery ? `?search=${encodeURIComponent(searchQuery)}` : ''}`;
+            const params = new URLSearchParams();
+            if (searchQuery) params.set('search', searchQuery);
+            if (cursor) params.set('cursor', cursor);
+            const url = `/api/admin/buyer-rooms/${params.toString() ? `?${params}` : ''}`;
             const response = await fetch(url, {
                 headers: {
                     'Authorization': `Bearer ${this.chatToken}`,
@@ -522,8 +526,15 @@ class AdminChat {
                     return bTime - aTime;
                 });
                 
-                this.displayChatRooms(sortedRooms);
-                this.updateTotalUnreadCount(sortedRooms);
+                // Rooms come in pages; "Muat lebih banyak" appends the next one
+                this.loadedRooms = cursor ? (this.loadedRooms || []).concat(sortedRooms) : sortedRooms;
+                this.roomsSearchQuery = searchQuery;
+                this.roomsNextCursor = data.next_cursor || null;
+
+                this.displayChatRooms(this.loadedRooms);
+                // The server's total covers the rooms not loaded yet
+                this.updateTotalUnreadCount(data.total_unread ??
+                    this.loadedRooms.reduce((sum, room) => sum + room.unread_count, 0));
                 
                 // Update search result info
                 if (searchQuery) {
@@ -533,6 +544,10 @@ class AdminChat {
             } else {
                 const errorText = await response.text();
                 console.error(`Failed to load chat rooms: ${response.status} - ${errorText}`);
+                if (cursor && response.status === 400) {
+                    // Cursor no longer valid; reload from the first page
+                    return this.loadChatRooms(searchQuery);
+                }
                 this.displayChatRooms([]);
                 
                 // Show error message for search
@@ -569,6 +584,12 @@ class AdminChat {
         }
     }
 
+    loadMoreChatRooms() {
+        if (this.roomsNextCursor) {
+            this.loadChatRooms(this.roomsSearchQuery || '', this.roomsNextCursor);
+        }
+    }
+
     displayChatRooms(rooms) {
         const roomsList = document.getElementById('chat-rooms-list');
         if (!roomsList) return;
@@ -631,7 +652,13 @@ class AdminChat {
                     </div>
                 </div>
             `;
-        }).join('');
+        }).join('') + (this.roomsNextCursor ? `
+            <div class="text-center py-2">
+                <button class="btn btn-sm btn-outline-secondary" onclick="adminChat.loadMoreChatRooms()">
+                    Muat lebih banyak
+                </button>
+            </div>
+        ` : '');
     }
 
     getTimeAgo(timestamp) {
@@ -908,6 +935,7 @@ class AdminChat {
 
                 const messages = data.results || data; // Handle pagination if present (data.results) or flat list
                 if (Array.isArray(messages)) {
+                    this.productCache.prefetch(messages);
                     messages.forEach(message => {
                         // Ensure message object is properly structured before displaying
                          if (message && typeof message === 'object') {
@@ -938,8 +966,7 @@ class AdminChat {
         });
     }
 
-    updateTotalUnreadCount(rooms) {
-        const totalUnread = rooms.reduce((sum, room) => sum + room.unread_count, 0);
+    updateTotalUnreadCount(totalUnread) {
         this.unreadCount = totalUnread;
         this.updateUnreadBadge();
         
@@ -1132,7 +1159,11 @@ class AdminChat {
         return div.innerHTML;
     }
 
-    async fetchProductInfo(productId) {
+    fetchProductInfo(productId) {
+        return this.productCache.get(productId);
+    }
+
+    async requestProductInfo(productId) {
         try {
             const response = await fetch(`/api/products/${productId}`, {
                 headers: {
@@ -1207,7 +1238,7 @@ class AdminChat {
                 </div>
             `;
 
-            const response = await fetch(`/search?q=${encodeURIComponent(query)}`);
+            const response = await fetch(`/search/suggest?q=${encodeURIComponent(query)}`);
 
             if (response.ok) {
                 const products = await response.json();
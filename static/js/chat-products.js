@@ -0,0 +1,42 @@
+// Product cards for chat product tags, shared by the admin and floating chat widgets
+
+class ChatProductCache {
+    constructor(requestOne) {
+        // requestOne(id) resolves to one product card, or null
+        this.requestOne = requestOne;
+        this.entries = new Map();
+    }
+
+    remember(id, request) {
+        // Concurrent and repeated lookups share one request; a lookup that
+        // found nothing (or failed) is forgotten so the next one tries again
+        const entry = request.then(productInfo => {
+            if (!productInfo && this.entries.get(id) === entry) this.entries.delete(id);
+            return productInfo;
+        });
+        this.entries.set(id, entry);
+        return entry;
+    }
+
+    get(productId) {
+        const id = Number(productId);
+        return this.entries.get(id) || this.remember(id, this.requestOne(id));
+    }
+
+    prefetch(messages) {
+        // Product tags in a history: one /api/products?ids=... request per 100 products
+        const ids = [...new Set(messages
+            .filter(message => message && message.product_id && !message.product_info)
+            .map(message => Number(message.product_id)))]
+            .filter(id => !this.entries.has(id));
+
+        for (let i = 0; i < ids.length; i += 100) {
+            const chunk = ids.slice(i, i + 100);
+            const request = fetch(`/api/products?ids=${chunk.join(',')}`)
+                .then(response => response.ok ? response.json() : { products: [] })
+                .then(data => new Map((data.products || []).map(product => [product.id, product])))
+                .catch(() => new Map());
+            chunk.forEach(id => this.remember(id, request.then(found => found.get(id) || null)));
+        }
+    }
+}
@@ -15,6 +15,7 @@ class FloatingChat {
         this.chatToken = null;
         this.currentUser = null;
         this.isConnected = false;
+        this.productCache = new ChatProductCache(id => this.requestProductInfo(id));
         this.selectedProduct = null;
         this.typingTimer = null;
         this.unreadCount = 0;
@@ -595,7 +596,11 @@ class FloatingChat {
         }, 100);
     }
 
-    async fetchProductInfo(productId) {
+    fetchProductInfo(productId) {
+        return this.productCache.get(productId);
+    }
+
+    async requestProductInfo(productId) {
         try {
             const response = await fetch(`/api/products/${productId}`);
             if (response.ok) {
@@ -740,6 +745,7 @@ class FloatingChat {
 
                         const messages = data.results || data; // Handle pagination
                         if (Array.isArray(messages)) {
+                            this.productCache.prefetch(messages);
                             messages.forEach(message => {
                                 if (message && typeof message === 'object') {
                                     this.displayMessage(message);
@@ -775,7 +781,7 @@ class FloatingChat {
         }
 
         try {
-            const response = await fetch(`/search?q=${encodeURIComponent(query)}`);
+            const response = await fetch(`/search/suggest?q=${encodeURIComponent(query)}`);
             if (response.ok) {
                 const products = await response.json();
                 this.displayProductResults(products);
@@ -118,7 +118,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function performSearch(query) {
-        fetch(`/search?q=${encodeURIComponent(query)}`)
+        fetch(`/search/suggest?q=${encodeURIComponent(query)}`)
             .then(response => {
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
@@ -177,24 +177,33 @@ document.addEventListener('DOMContentLoaded', function() {
         window.location.href = `/product/${productId}`;
     };
 
-    // Cart Count Update
-    updateCartCount();
+    // Cart Count Update: the count is rendered with the page, so the API is
+    // only asked when it is missing; changes are pushed when the server
+    // offers an event stream
+    const cartCountBadge = document.getElementById('cartCount');
+    if (cartCountBadge && cartCountBadge.dataset.count === undefined) {
+        updateCartCount();
+    }
+    if (cartCountBadge && cartCountBadge.dataset.eventsUrl && window.EventSource) {
+        const cartEvents = new EventSource(cartCountBadge.dataset.eventsUrl);
+        cartEvents.addEventListener('cart', event => {
+            showCartCount(cartCountBadge, JSON.parse(event.data).count);
+        });
+    }
+
+    function showCartCount(cartBadge, count) {
+        cartBadge.textContent = count || '0';
+        // Hide badge if count is 0
+        cartBadge.style.display = count > 0 ? 'inline' : 'none';
+    }
 
     function updateCartCount() {
         const cartBadge = document.getElementById('cartCount');
         if (cartBadge) {
-            // Make AJAX call to get actual cart count
+            // Make AJAX call to get actual cart count (revalidated with ETag)
             fetch('/api/cart/count')
                 .then(response => response.json())
-                .then(data => {
-                    cartBadge.textContent = data.count || '0';
-                    // Hide badge if count is 0
-                    if (data.count > 0) {
-                        cartBadge.style.display = 'inline';
-                    } else {
-                        cartBadge.style.display = 'none';
-                    }
-                })
+                .then(data => showCartCount(cartBadge, data.count))
                 .catch(error => {
                     console.error('Error fetching cart count:', error);
                     cartBadge.textContent = '0';
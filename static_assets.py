@@ -0,0 +1,256 @@
+"""
+Fingerprinted static assets with far-future caching
+
+`python static_assets.py` (or `flask --app main build-assets`), run once
+per deploy, copies the site's CSS, JS, images and favicons to
+static/dist/ with a content hash in the filename, rewrites /static/ URLs
+inside the CSS to the fingerprinted copies, writes gzip (and, with the
+optional `brotli` package, brotli) variants of text assets, and records
+everything in static/dist/manifest.json.
+
+At runtime url_for('static', filename='css/style.css') resolves to the
+fingerprinted file through the manifest, which is served with an
+immutable one-year Cache-Control and the best pre-compressed variant the
+browser accepts. Without a manifest nothing changes, and the manifest is
+ignored in debug mode (app.debug or FLASK_DEBUG=1) and whenever a file
+under static/ is newer than it, so edits show up until the next build.
+
+Files of the current build and the STATIC_KEEP_BUILDS builds before it
+are kept (workers still running an older manifest, and cached pages, keep
+referring to them until reloaded); anything older is deleted from dist/.
+The builds are listed in static/dist/builds.json.
+
+    STATIC_ASSETS=0             ignore the manifest even if it exists
+    STATIC_KEEP_BUILDS=2        previous builds whose files are kept
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from flask import request, send_from_directory
+
+# Source directories under static/ that are fingerprinted; uploads are not
+ASSET_DIRS = ('css', 'js', 'images', 'favicon')
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+BUILDS_NAME = 'builds.json'
+KEEP_BUILDS = int(os.environ.get('STATIC_KEEP_BUILDS', '2'))
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.xml', '.txt', '.ico'}
+# Not worth compressing (the headers cost more than the savings)
+MIN_COMPRESS_SIZE = 1024
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)/static/([^'")?#]+)([^'")]*)\1\s*\)""")
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _fingerprinted_name(relative, data):
+    stem, ext = os.path.splitext(relative)
+    return f"{DIST_DIR}/{stem}.{_digest(data)}{ext}"
+
+
+def _compress(path, data):
+    """Write .gz (and .br when available) next to `path`; returns the encodings written"""
+    encodings = []
+    with open(f"{path}.gz", 'wb') as f:
+        # mtime=0 keeps the output identical across builds
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    encodings.append('gzip')
+    try:
+        import brotli
+    except ImportError:
+        return encodings
+    with open(f"{path}.br", 'wb') as f:
+        f.write(brotli.compress(data, quality=11))
+    encodings.append('br')
+    return encodings
+
+
+def _read_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_json(path, value):
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(value, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def _newest_source_mtime(static_folder):
+    """Latest modification time of the files build() fingerprints, or 0"""
+    newest = 0
+    for directory in ASSET_DIRS:
+        for root, _, files in os.walk(os.path.join(static_folder, directory)):
+            for name in files:
+                try:
+                    newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+                except OSError:
+                    continue
+    return newest
+
+
+def _prune(static_folder, manifest):
+    """Record this build and delete dist/ files no kept build refers to; returns the number removed"""
+    dist_root = os.path.join(static_folder, DIST_DIR)
+    builds_path = os.path.join(dist_root, BUILDS_NAME)
+    builds = _read_json(builds_path, None)
+    if builds is None:
+        # First build with pruning: the manifest in use counts as the previous build
+        previous = _read_json(os.path.join(dist_root, MANIFEST_NAME), {})
+        builds = [sorted(previous['files'].values())] if previous.get('files') else []
+
+    current = sorted(manifest['files'].values())
+    builds = [current] + [files for files in builds if files != current]
+    builds = builds[:KEEP_BUILDS + 1]
+    _write_json(builds_path, builds)
+
+    keep = {MANIFEST_NAME, BUILDS_NAME}
+    for files in builds:
+        for target in files:
+            relative = target[len(DIST_DIR) + 1:]
+            keep.update((relative, f"{relative}.gz", f"{relative}.br"))
+
+    removed = 0
+    for root, _, names in os.walk(dist_root, topdown=False):
+        for name in names:
+            path = os.path.join(root, name)
+            if os.path.relpath(path, dist_root).replace(os.sep, '/') not in keep:
+                os.remove(path)
+                removed += 1
+        if root != dist_root and not os.listdir(root):
+            os.rmdir(root)
+    return removed
+
+
+def build(static_folder):
+    """Fingerprint and pre-compress the assets under `static_folder`; returns the manifest"""
+    dist_root = os.path.join(static_folder, DIST_DIR)
+
+    sources = []
+    for directory in ASSET_DIRS:
+        for root, _, files in os.walk(os.path.join(static_folder, directory)):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                sources.append(os.path.relpath(path, static_folder).replace(os.sep, '/'))
+
+    # CSS last, so url() references to images can point at their fingerprinted copies
+    sources.sort(key=lambda relative: relative.endswith('.css'))
+
+    files = {}
+    encodings = {}
+    for relative in sources:
+        with open(os.path.join(static_folder, relative), 'rb') as f:
+            data = f.read()
+        if relative.endswith('.css'):
+            text = data.decode('utf-8')
+            text = _CSS_URL.sub(
+                lambda m: f"url({m.group(1)}/static/{files.get(m.group(2), m.group(2))}{m.group(3)}{m.group(1)})",
+                text)
+            data = text.encode('utf-8')
+
+        target = _fingerprinted_name(relative, data)
+        target_path = os.path.join(static_folder, target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with open(target_path, 'wb') as f:
+            f.write(data)
+        files[relative] = target
+
+        if os.path.splitext(relative)[1].lower() in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+            encodings[target] = _compress(target_path, data)
+
+    manifest = {'files': files, 'encodings': encodings}
+    # Before the new manifest replaces the old one, which _prune() may need
+    removed = _prune(static_folder, manifest)
+    _write_json(os.path.join(dist_root, MANIFEST_NAME), manifest)
+    if removed:
+        print(f"[OK] Removed {removed} files of older asset builds")
+    return manifest
+
+
+class StaticAssets:
+    """Resolves url_for('static') through the manifest and serves dist/ files"""
+
+    def __init__(self):
+        self.app = None
+        self.files = {}
+        self.encodings = {}
+        self.enabled = False
+
+    def init_app(self, app):
+        self.app = app
+        if os.environ.get('STATIC_ASSETS', '1').lower() in ('0', 'false', 'no', 'off'):
+            return
+        if app.debug or os.environ.get('FLASK_DEBUG', '0') == '1':
+            # Development serves static/ directly so edits show up on reload
+            return
+        manifest_path = os.path.join(app.static_folder, DIST_DIR, MANIFEST_NAME)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            built_at = os.path.getmtime(manifest_path)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Ignoring unreadable asset manifest {manifest_path}: {e}")
+            return
+
+        if _newest_source_mtime(app.static_folder) > built_at:
+            print("[WARNING] Asset manifest is older than static/ sources; serving unfingerprinted "
+                  "files (run `python static_assets.py` to rebuild)")
+            return
+
+        self.files = manifest.get('files', {})
+        self.encodings = manifest.get('encodings', {})
+        self.enabled = True
+        app.url_defaults(self._rewrite_static_url)
+        app.view_functions['static'] = self.serve
+        print(f"[OK] Serving {len(self.files)} fingerprinted static assets")
+
+    def _rewrite_static_url(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.files.get(values['filename'], values['filename'])
+
+    def serve(self, filename):
+        """Static view: pre-compressed, immutable responses for fingerprinted files"""
+        if not filename.startswith(f"{DIST_DIR}/"):
+            return self.app.send_static_file(filename)
+
+        available = self.encodings.get(filename, ())
+        accepted = request.accept_encodings
+        encoding = next((e for e in ('br', 'gzip') if e in available and accepted[e]), None)
+        suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+
+        response = send_from_directory(self.app.static_folder, filename + suffix,
+                                       mimetype=_mimetype(filename), max_age=31536000,
+                                       conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if available:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+def _mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+assets = StaticAssets()
+
+
+if __name__ == '__main__':
+    # Deploy step; does not import the application
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    built = build(static_folder)
+    print(f"[OK] Built {len(built['files'])} fingerprinted assets "
+          f"({len(built['encodings'])} pre-compressed) in {os.path.join(static_folder, DIST_DIR)}")
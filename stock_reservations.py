@@ -0,0 +1,244 @@
+"""
+Stock reservations between checkout and payment
+
+create_checkout_session() holds the cart's stock before sending the buyer
+to Stripe/Midtrans. Each product is decremented with a conditional
+`UPDATE products SET stock_quantity = stock_quantity - :q WHERE id = :id
+AND stock_quantity >= :q`, so buyers only contend on the rows they buy and
+the last unit can be held by one buyer only. payment_success() turns the
+hold into a sale; a failed, cancelled or abandoned payment puts the stock
+back. Expired holds are released by release_expired(), run
+opportunistically on checkout and by `flask release-reservations`.
+
+The payment page closes after payment_window_minutes(); Stripe's window
+is clamped to 31 minutes - 23h55m, inside the 30 minute - 24 hour range
+it accepts. A hold outlives its payment page by HOLD_GRACE_MINUTES, so
+stock is never given back while the page can still be paid.
+
+    STOCK_RESERVATION_MINUTES=30   payment page expiry
+"""
+import os
+import threading
+import time
+from datetime import timedelta
+
+from sqlalchemy import delete, update
+
+from database import db
+import models
+
+RESERVATION_MINUTES = int(os.environ.get('STOCK_RESERVATION_MINUTES', '30'))
+# Stripe Checkout accepts expires_at 30 minutes to 24 hours ahead
+STRIPE_MIN_MINUTES = 31
+STRIPE_MAX_MINUTES = 24 * 60 - 5
+# Covers the time between reserving and the provider creating the page
+HOLD_GRACE_MINUTES = 2
+# Per-process throttle for the opportunistic expiry sweep
+SWEEP_INTERVAL = 30.0
+
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+class InsufficientStock(Exception):
+    """Raised by reserve() when a product cannot cover the requested quantity"""
+
+    def __init__(self, product_name, requested):
+        super().__init__(f"Insufficient stock for {product_name}")
+        self.product_name = product_name
+        self.requested = requested
+
+
+def decrement_stock(product_id, quantity):
+    """Take `quantity` units if available; False (nothing changed) otherwise"""
+    result = db.session.execute(
+        update(models.Product)
+        .where(models.Product.id == product_id, models.Product.stock_quantity >= quantity)
+        .values(stock_quantity=models.Product.stock_quantity - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def restore_stock(product_id, quantity):
+    db.session.execute(
+        update(models.Product)
+        .where(models.Product.id == product_id)
+        .values(stock_quantity=models.Product.stock_quantity + quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def payment_window_minutes(provider):
+    """Minutes the provider's payment page stays open"""
+    if provider == 'stripe':
+        return min(max(RESERVATION_MINUTES, STRIPE_MIN_MINUTES), STRIPE_MAX_MINUTES)
+    return RESERVATION_MINUTES
+
+
+def reserve(user_id, cart_items, minutes=RESERVATION_MINUTES):
+    """
+    Hold stock for every cart item and commit, for a payment page open
+    `minutes` long.
+
+    Raises InsufficientStock with nothing held if any product runs short.
+    Returns the expiry time of the holds.
+    """
+    expires_at = models.get_utc_time() + timedelta(minutes=minutes + HOLD_GRACE_MINUTES)
+    try:
+        # Fixed lock order, so two buyers of the same products cannot deadlock
+        for item in sorted(cart_items, key=lambda i: i.product_id):
+            if not decrement_stock(item.product_id, item.quantity):
+                raise InsufficientStock(item.product.name, item.quantity)
+            db.session.add(models.StockReservation(
+                user_id=user_id,
+                product_id=item.product_id,
+                quantity=item.quantity,
+                expires_at=expires_at
+            ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return expires_at
+
+
+def attach(user_id, checkout_ref):
+    """Link the user's new holds to the payment provider's session/order id"""
+    db.session.execute(
+        update(models.StockReservation)
+        .where(models.StockReservation.user_id == user_id,
+               models.StockReservation.status == 'held',
+               models.StockReservation.checkout_ref.is_(None))
+        .values(checkout_ref=checkout_ref)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def _release(*criteria):
+    """Release matching holds and return their stock; safe against concurrent sweeps"""
+    rows = db.session.query(
+        models.StockReservation.id, models.StockReservation.product_id, models.StockReservation.quantity
+    ).filter(models.StockReservation.status == 'held', *criteria).all()
+
+    released = 0
+    for reservation_id, product_id, quantity in rows:
+        # Only the transaction that flips the status gives the stock back
+        claimed = db.session.execute(
+            update(models.StockReservation)
+            .where(models.StockReservation.id == reservation_id,
+                   models.StockReservation.status == 'held')
+            .values(status='released')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed:
+            restore_stock(product_id, quantity)
+            released += 1
+    db.session.commit()
+    return released
+
+
+def release_for_user(user_id):
+    """Cancelled/failed payment or a new checkout attempt: give back the user's holds"""
+    return _release(models.StockReservation.user_id == user_id)
+
+
+def release_checkout(checkout_ref):
+    """Payment provider reported the checkout as failed or expired"""
+    if not checkout_ref:
+        return 0
+    return _release(models.StockReservation.checkout_ref == checkout_ref)
+
+
+def release_expired():
+    return _release(models.StockReservation.expires_at < models.get_utc_time())
+
+
+def maybe_release_expired():
+    """release_expired(), at most once per SWEEP_INTERVAL in this process; never raises"""
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < SWEEP_INTERVAL or not _sweep_lock.acquire(blocking=False):
+        return
+    try:
+        _last_sweep = now
+        released = release_expired()
+        if released:
+            print(f"[OK] Released {released} expired stock reservations")
+    except Exception as e:
+        db.session.rollback()
+        print(f"[WARNING] Could not release expired stock reservations: {e}")
+    finally:
+        _sweep_lock.release()
+
+
+def commit_for_user(user_id, checkout_ref):
+    """
+    Turn the user's holds for the checkout `checkout_ref` into a sale,
+    inside the caller's order transaction.
+
+    Returns {product_id: quantity} actually committed (holds already released
+    by an expiry sweep are not included).
+    """
+    # One statement: the WHERE on status makes it race-free against the expiry sweep
+    rows = db.session.execute(
+        update(models.StockReservation)
+        .where(models.StockReservation.user_id == user_id,
+               models.StockReservation.checkout_ref == checkout_ref,
+               models.StockReservation.status == 'held')
+        .values(status='committed')
+        .returning(models.StockReservation.product_id, models.StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    committed = {}
+    for product_id, quantity in rows:
+        committed[product_id] = committed.get(product_id, 0) + quantity
+    return committed
+
+
+def settle_order(user_id, order_id, cart_items, checkout_ref):
+    """
+    Apply the stock movement of a paid order (caller commits).
+
+    Held stock is used first; units that were not held any more are taken
+    with the same conditional decrement, and holds the final cart no longer
+    needs are given back.
+    """
+    held = commit_for_user(user_id, checkout_ref)
+    for item in cart_items:
+        held_quantity = held.pop(item.product_id, 0)
+        missing = item.quantity - held_quantity
+        if missing > 0 and not decrement_stock(item.product_id, missing):
+            # Already paid for; record the oversell for the admin instead of failing
+            print(f"[WARNING] Order {order_id}: product {item.product_id} oversold by up to {missing} units")
+        elif missing < 0:
+            restore_stock(item.product_id, -missing)
+    for product_id, quantity in held.items():
+        restore_stock(product_id, quantity)
+
+
+def prepare_product_delete(product_id):
+    """
+    Drop the finished reservations of a product about to be deleted
+    (caller commits). Returns False, deleting nothing, while a checkout
+    still holds its stock.
+    """
+    active = db.session.query(models.StockReservation.id).filter(
+        models.StockReservation.product_id == product_id,
+        models.StockReservation.status == 'held',
+        models.StockReservation.expires_at >= models.get_utc_time()
+    ).first()
+    if active:
+        return False
+    # Expired holds give their stock back first, like the expiry sweep
+    _release(models.StockReservation.product_id == product_id,
+             models.StockReservation.expires_at < models.get_utc_time())
+    db.session.execute(
+        delete(models.StockReservation)
+        .where(models.StockReservation.product_id == product_id,
+               models.StockReservation.status != 'held')
+        .execution_options(synchronize_session=False)
+    )
+    return True